@@ -0,0 +1,127 @@
+'''
+Synthetic contracts used by the benchmarks
+
+Everything is generated locally and deterministically so the results of
+two commits can be compared on one machine.
+'''
+
+from octopus.arch.evm.evm import EVM
+
+_reverse_table = EVM().reverse_table
+
+# EIP-170 maximum runtime code size
+MAX_CODE_SIZE = 24576
+
+CONTRACT_SIZES = (('small', 1024), ('medium', 8192), ('large', MAX_CODE_SIZE))
+
+
+def assemble(program):
+    '''Return the bytecode (bytes) of program, a list of mnemonics
+    or (mnemonic, operand) tuples
+    '''
+    code = bytearray()
+    for item in program:
+        name, operand = item if isinstance(item, tuple) else (item, None)
+        opcode, _, operand_size = _reverse_table[name][:3]
+        code.append(opcode)
+        if operand_size:
+            code += operand.to_bytes(operand_size, byteorder='big')
+    return bytes(code)
+
+
+# ==============================
+# #     opcode classes         #
+# ==============================
+
+# opcode class: body repeated in a straight line, stack balanced
+OPCODE_CLASSES = {
+    'arithmetic': [('PUSH1', 7), ('PUSH1', 5), 'ADD',
+                   ('PUSH1', 3), 'MUL', ('PUSH1', 2), 'SUB',
+                   ('PUSH1', 3), 'SWAP1', 'DIV', ('PUSH1', 4), 'SWAP1', 'MOD',
+                   ('PUSH1', 3), ('PUSH1', 2), 'EXP', 'ADD', 'POP'],
+    'comparison': [('PUSH1', 7), ('PUSH1', 5), 'LT',
+                   ('PUSH1', 3), 'GT', ('PUSH1', 1), 'EQ', 'ISZERO', 'POP'],
+    'bitwise': [('PUSH1', 0xf0), ('PUSH1', 0x0f), 'AND',
+                ('PUSH1', 0x55), 'OR', ('PUSH1', 0xaa), 'XOR', 'NOT',
+                ('PUSH1', 4), 'SHL', ('PUSH1', 2), 'SHR', 'POP'],
+    'stack': [('PUSH1', 1), ('PUSH1', 2), 'DUP2', 'DUP2', 'SWAP1',
+              'SWAP2', 'POP', 'POP', 'POP', 'POP'],
+    'memory': [('PUSH1', 0x2a), ('PUSH1', 0x80), 'MSTORE',
+               ('PUSH1', 0x80), 'MLOAD', 'POP'],
+    'storage': [('PUSH1', 0x2a), ('PUSH1', 1), 'SSTORE',
+                ('PUSH1', 1), 'SLOAD', 'POP'],
+    'sha3': [('PUSH1', 0x20), ('PUSH1', 0), 'SHA3', 'POP'],
+    'environment': ['CALLER', 'POP', 'CALLVALUE', 'POP',
+                    'CALLDATASIZE', 'POP', 'ADDRESS', 'POP'],
+}
+
+
+def opcode_class_contract(name, repeat=200):
+    '''Straight line code executing the body of OPCODE_CLASSES[name]
+    repeat times, then STOP (hex string)
+    '''
+    return assemble(OPCODE_CLASSES[name] * repeat + ['STOP']).hex()
+
+
+def jump_contract(repeat=200):
+    '''Chain of JUMP and JUMPI taken, then STOP (hex string)'''
+    program = list()
+    # PUSH2 dest JUMP JUMPDEST PUSH1 1 PUSH2 dest JUMPI JUMPDEST
+    offset = 0
+    for _ in range(repeat):
+        program += [('PUSH2', offset + 4), 'JUMP', 'JUMPDEST',
+                    ('PUSH1', 1), ('PUSH2', offset + 11), 'JUMPI',
+                    'JUMPDEST']
+        offset += 12
+    return assemble(program + ['STOP']).hex()
+
+
+# ==============================
+# #     sized contracts        #
+# ==============================
+
+def selector(index):
+    '''Deterministic 4 bytes function identifier'''
+    return (0x12345678 + index * 0x9e3779b1) & 0xffffffff
+
+
+def _function_body(index):
+    '''f(uint256 x) returns (x op ... op)'''
+    program = ['JUMPDEST', ('PUSH1', 4), 'CALLDATALOAD']
+    for i in range(12):
+        program += [('PUSH1', (index + i) & 0xff),
+                    ('ADD', 'MUL', 'XOR', 'OR')[i % 4]]
+    program += [('PUSH1', 0), 'MSTORE', ('PUSH1', 0x20), ('PUSH1', 0),
+                'RETURN']
+    return assemble(program)
+
+
+def _dispatcher(dests):
+    program = [('PUSH1', 0), 'CALLDATALOAD', ('PUSH1', 0xe0), 'SHR']
+    for index, dest in enumerate(dests):
+        program += ['DUP1', ('PUSH4', selector(index)), 'EQ',
+                    ('PUSH2', dest), 'JUMPI']
+    program += [('PUSH1', 0), 'DUP1', 'REVERT']
+    return assemble(program)
+
+
+def sized_contract(size):
+    '''Return (hex bytecode, selectors) of a contract with a linear
+    dispatcher and as many functions as fit in size bytes
+    '''
+    body_size = len(_function_body(0))
+    # prologue (6) + test (11) per function + fallback (4)
+    n_functions = (size - 10) // (11 + body_size)
+
+    dests = list()
+    offset = 10 + 11 * n_functions
+    bodies = list()
+    for index in range(n_functions):
+        dests.append(offset)
+        bodies.append(_function_body(index))
+        offset += len(bodies[-1])
+
+    code = _dispatcher(dests) + b''.join(bodies)
+    # pad up to size with unreachable code
+    code += bytes([_reverse_table['INVALID'][0]]) * (size - len(code))
+    return code.hex(), [selector(index) for index in range(n_functions)]
@@ -0,0 +1,211 @@
+'''
+Benchmarks of the emulator, the disassembler and the CFG construction
+
+    python -m benchmarks.run -o results.json
+    python -m benchmarks.run -o new.json --compare results.json
+
+Run from the repository root. Times are in seconds (median and min of
+--repeat runs), memory is the tracemalloc peak of one extra run, in bytes.
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from octopus.arch.evm.cfg import EvmCFG
+from octopus.arch.evm.disassembler import EvmDisassembler
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.program import Program, ProgramEmulator
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+from benchmarks.contracts import (CONTRACT_SIZES, OPCODE_CLASSES,
+                                  jump_contract, opcode_class_contract,
+                                  sized_contract)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CTF_BYTECODE = os.path.join(ROOT, 'ctf.bytecode')
+CTF_CALLDATA = bytes.fromhex('c6c58bcd95529edd28cb526ab5071fd2fdebd5fc'
+                             '4e08b2af6876dd33a57764a970157576')
+
+# calls per sized contract in the emulate benchmarks
+CALLS = 16
+
+
+def measure(func, repeat):
+    '''Run func repeat times + once under tracemalloc
+    func return the number of executed instructions or None
+    '''
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        steps = func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {'median': statistics.median(times), 'min': min(times),
+              'repeat': repeat, 'peak_memory': peak}
+    if steps is not None:
+        result['instructions'] = steps
+        result['instructions_per_second'] = steps / result['median']
+    return result
+
+
+def emulate_calls(engine, calls):
+    '''Emulate every callinfo of calls on a fresh state,
+    return the number of executed instructions
+    '''
+    steps = 0
+    for callinfo in calls:
+        # the engine keeps every state otherwise
+        engine.states = dict()
+        engine.states_total = 0
+        engine.emulate(callinfo, EthereumVMstate())
+        steps += engine.states_total
+    return steps
+
+
+def emulate_program(emulator, calls):
+    '''Same as emulate_calls with a ProgramEmulator'''
+    steps = 0
+    for callinfo in calls:
+        emulator.emulate(callinfo)
+        steps += emulator.steps
+    return steps
+
+
+def function_calls(selectors, count=CALLS):
+    '''count calls spread over all the functions of a sized contract'''
+    step = max(1, len(selectors) // count)
+    return [{'calldata': sel.to_bytes(4, 'big') + (42).to_bytes(32, 'big'),
+             'callvalue': 0} for sel in selectors[::step][:count]]
+
+
+def bench_opcodes(repeat):
+    results = dict()
+    contracts = [(name, opcode_class_contract(name))
+                 for name in sorted(OPCODE_CLASSES)]
+    contracts.append(('control', jump_contract()))
+    for name, bytecode in contracts:
+        engine = EthereumSSAEngine(bytecode, verbose=False)
+        calls = [{'calldata': b'', 'callvalue': 0}]
+        results['opcode.%s' % name] = measure(
+            lambda: emulate_calls(engine, calls), repeat)
+    return results
+
+
+def bench_contracts(repeat):
+    results = dict()
+    contracts = [(name, sized_contract(size))
+                 for name, size in CONTRACT_SIZES]
+    with open(CTF_BYTECODE) as f:
+        ctf = f.read().strip()
+
+    for name, (bytecode, _) in contracts + [('ctf', (ctf, None))]:
+        results['disassemble.%s' % name] = measure(
+            lambda: EvmDisassembler(bytecode).disassemble() and None, repeat)
+        results['cfg.%s' % name] = measure(
+            lambda: EvmCFG(bytecode, analysis='static') and None, repeat)
+        results['program.%s' % name] = measure(
+            lambda: Program.from_bytecode(bytecode) and None, repeat)
+
+    for name, (bytecode, selectors) in contracts:
+        engine = EthereumSSAEngine(bytecode, verbose=False)
+        emulator = ProgramEmulator(Program.from_bytecode(bytecode))
+        calls = function_calls(selectors)
+        results['emulate.%s' % name] = measure(
+            lambda: emulate_calls(engine, calls), repeat)
+        results['emulate_program.%s' % name] = measure(
+            lambda: emulate_program(emulator, calls), repeat)
+
+    engine = EthereumSSAEngine(ctf, verbose=False)
+    emulator = ProgramEmulator(Program.from_bytecode(ctf))
+    calls = [{'calldata': CTF_CALLDATA, 'callvalue': 0}]
+    results['emulate.ctf'] = measure(lambda: emulate_calls(engine, calls),
+                                     repeat)
+    results['emulate_program.ctf'] = measure(
+        lambda: emulate_program(emulator, calls), repeat)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _max_rss():
+    '''Process memory high-water mark in bytes, None if unavailable'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run(repeat=5, groups=('opcodes', 'contracts')):
+    results = dict()
+    if 'opcodes' in groups:
+        results.update(bench_opcodes(repeat))
+    if 'contracts' in groups:
+        results.update(bench_contracts(repeat))
+    return {'meta': {'commit': _git_commit(),
+                     'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'max_rss': _max_rss()},
+            'results': results}
+
+
+def compare(new, old, fp=sys.stdout):
+    '''Print the median time ratio new / old of every benchmark'''
+    fp.write('%-28s %12s %12s %8s\n' % ('benchmark', 'old', 'new', 'ratio'))
+    for name, result in sorted(new['results'].items()):
+        previous = old['results'].get(name)
+        if previous is None:
+            continue
+        ratio = result['median'] / previous['median']
+        fp.write('%-28s %12.6f %12.6f %8.3f\n' % (
+            name, previous['median'], result['median'], ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-o', '--output', help='JSON results file')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-g', '--group', action='append',
+                        choices=('opcodes', 'contracts'),
+                        help='benchmark group (default: all)')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='previous results to compare with')
+    args = parser.parse_args(argv)
+
+    report = run(args.repeat, args.group or ('opcodes', 'contracts'))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+'''
+CFG artifacts: EvmCFG / WasmCFG saved as versioned JSON lines
+
+    save_cfg(cfg, 'contract.cfg.jsonl')
+    artifact = CFGArtifact.open('contract.cfg.jsonl')   # header only
+    artifact.function('func_a9059cbb')  # Function, its blocks and edges
+    functions, basicblocks, edges = artifact.load()
+
+    cache = CFGCache('cfg_cache/')
+    artifact = cache.get(bytecode, arch='evm', analysis='dynamic')
+
+File layout, one JSON object per line:
+
+    header      format, version, arch, analysis, code_hash, functions
+                (name, prefered_name, selector, start_offset, blocks),
+                unresolved jumps and sections: [position, length] of the
+                following lines, relative to the end of the header line
+    function i  basicblocks and edges starting from them
+    remainder   basicblocks of no function and the remaining edges
+
+A basic block is stored with its name, offsets, function name and its
+instructions as [offset, raw bytes hex]; instructions are decoded again
+with the disassembler of the architecture, only for the blocks loaded.
+Opening a function only reads and decodes its own line.
+'''
+
+import json
+import os
+
+from octopus.core.basicblock import BasicBlock
+from octopus.core.edge import Edge
+from octopus.core.function import Function
+from octopus.core.utils import bytecode_to_bytes
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+ARTIFACT_FORMAT = 'octopus-cfg'
+ARTIFACT_VERSION = 1
+ARTIFACT_EXTENSION = '.cfg.jsonl'
+
+ARCHS = ('evm', 'wasm')
+
+
+class ArtifactFormatException(Exception):
+    """Exception raised when a CFG artifact can not be decoded"""
+    pass
+
+
+def _arch_of(cfg):
+    return 'wasm' if hasattr(cfg, 'module_bytecode') else 'evm'
+
+
+def _code_of(cfg, arch):
+    return cfg.module_bytecode if arch == 'wasm' else cfg.bytecode
+
+
+def code_hash(bytecode):
+    '''keccak of bytecode (hex or bytes), hex'''
+    from eth_hash.auto import keccak
+
+    return keccak(bytes(bytecode_to_bytes(bytecode))).hex()
+
+
+def _raw(instr, arch):
+    '''Encoded bytes of instr'''
+    if arch == 'wasm':
+        return bytes(instr.insn_byte)
+    return bytes((instr.opcode,)) + bytes(instr.operand or b'')
+
+
+def _disassembler(arch):
+    if arch == 'wasm':
+        from octopus.arch.wasm.disassembler import WasmDisassembler
+        return WasmDisassembler()
+    from octopus.arch.evm.disassembler import EvmDisassembler
+    return EvmDisassembler()
+
+
+def _condition(condition):
+    if condition is None or isinstance(condition, (bool, int, str)):
+        return condition
+    return str(condition)
+
+
+def _block_record(bb, arch):
+    return {'name': bb.name,
+            'start_offset': bb.start_offset,
+            'end_offset': bb.end_offset,
+            'function_name': bb.function_name,
+            'instructions': [[i.offset, _raw(i, arch).hex()]
+                             for i in bb.instructions]}
+
+
+def _edge_record(edge):
+    return [edge.node_from, edge.node_to, edge.type,
+            _condition(edge.condition)]
+
+
+def cfg_sections(cfg, arch=None):
+    '''Return (functions header, sections) of cfg, one section per
+    function then the remainder, see the module documentation
+    '''
+    arch = arch or _arch_of(cfg)
+    # edges use block offsets (evm) or names (wasm)
+    block_of = dict()
+    for bb in cfg.basicblocks:
+        block_of[bb.start_offset if arch == 'evm' else bb.name] = bb.name
+    edges_from = dict()
+    for edge in cfg.edges:
+        edges_from.setdefault(block_of.get(edge.node_from), list()).append(
+            edge)
+
+    functions = list()
+    sections = list()
+    owned = set()
+    for function in cfg.functions:
+        names = [bb.name for bb in function.basicblocks]
+        owned.update(names)
+        functions.append({'name': function.name,
+                          'prefered_name': function.prefered_name,
+                          'selector': function.selector,
+                          'start_offset': function.start_offset,
+                          'blocks': len(names)})
+        sections.append({
+            'basicblocks': [_block_record(bb, arch)
+                            for bb in function.basicblocks],
+            'edges': [_edge_record(e) for name in names
+                      for e in edges_from.get(name, ())]})
+
+    sections.append({
+        'basicblocks': [_block_record(bb, arch) for bb in cfg.basicblocks
+                        if bb.name not in owned],
+        'edges': [_edge_record(e) for name, edges in edges_from.items()
+                  if name not in owned for e in edges]})
+    return functions, sections
+
+
+def dumps_cfg(cfg, arch=None, analysis=None, digest=None):
+    '''Return the artifact of cfg (bytes)'''
+    arch = arch or _arch_of(cfg)
+    functions, sections = cfg_sections(cfg, arch)
+    lines = [json.dumps(section, separators=(',', ':')).encode('utf-8') +
+             b'\n' for section in sections]
+    positions = list()
+    position = 0
+    for line in lines:
+        positions.append([position, len(line)])
+        position += len(line)
+
+    header = {'format': ARTIFACT_FORMAT,
+              'version': ARTIFACT_VERSION,
+              'arch': arch,
+              'analysis': analysis or getattr(cfg, 'analysis', None),
+              'code_hash': digest or code_hash(_code_of(cfg, arch)),
+              'functions': functions,
+              'unresolved': sorted(getattr(cfg, 'unresolved', ())),
+              'sections': positions}
+    return json.dumps(header, separators=(',', ':')).encode('utf-8') + \
+        b'\n' + b''.join(lines)
+
+
+def save_cfg(cfg, path, arch=None, analysis=None, digest=None):
+    '''Save the artifact of cfg at path'''
+    data = dumps_cfg(cfg, arch, analysis, digest)
+    # atomic, an artifact may be read by other processes
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class CFGArtifact(object):
+    '''Lazily loaded CFG artifact, see the module documentation'''
+
+    def __init__(self, path, header, body):
+        self.path = path
+        self.header = header
+        # position of the first section in the file
+        self._body = body
+        self.arch = header['arch']
+        self.analysis = header['analysis']
+        self.code_hash = header['code_hash']
+        self.unresolved = set(header['unresolved'])
+        self.functions = [Function(f['start_offset'], name=f['name'],
+                                   prefered_name=f['prefered_name'],
+                                   selector=f['selector'])
+                          for f in header['functions']]
+        self._index = {f.name: i for i, f in enumerate(self.functions)}
+        self._loaded = dict()
+        self._disasm = None
+
+    @classmethod
+    def open(cls, path):
+        '''Read the header of the artifact located at path'''
+        with open(path, 'rb') as f:
+            line = f.readline()
+            try:
+                header = json.loads(line.decode('utf-8'))
+            except ValueError as e:
+                raise ArtifactFormatException('bad header: %s' % e)
+        if not isinstance(header, dict) or \
+                header.get('format') != ARTIFACT_FORMAT:
+            raise ArtifactFormatException('not a CFG artifact')
+        if header.get('version') != ARTIFACT_VERSION:
+            raise ArtifactFormatException('unsupported version %r'
+                                          % header.get('version'))
+        if header.get('arch') not in ARCHS:
+            raise ArtifactFormatException('unknown arch %r'
+                                          % header.get('arch'))
+        return cls(path, header, len(line))
+
+    def __len__(self):
+        return len(self.functions)
+
+    def _section(self, index):
+        position, length = self.header['sections'][index]
+        with open(self.path, 'rb') as f:
+            f.seek(self._body + position)
+            data = f.read(length)
+        if len(data) != length:
+            raise ArtifactFormatException('truncated artifact')
+        return json.loads(data.decode('utf-8'))
+
+    def _block(self, record):
+        if self._disasm is None:
+            self._disasm = _disassembler(self.arch)
+        instructions = [self._disasm.disassemble_opcode(bytes.fromhex(raw),
+                                                        offset)
+                        for offset, raw in record['instructions']]
+        bb = BasicBlock(record['start_offset'],
+                        instructions[0] if instructions else None,
+                        name=record['name'])
+        bb.end_offset = record['end_offset']
+        bb.end_instr = instructions[-1] if instructions else None
+        bb.function_name = record['function_name']
+        bb.instructions = instructions
+        return bb
+
+    def _load(self, index):
+        '''(basicblocks, edges) of section index, decoded once'''
+        if index not in self._loaded:
+            section = self._section(index)
+            self._loaded[index] = (
+                [self._block(record) for record in section['basicblocks']],
+                [Edge(*record) for record in section['edges']])
+        return self._loaded[index]
+
+    def function(self, key):
+        '''Function (by index or name) with its basicblocks and
+        instructions, return (function, edges)
+        '''
+        index = self._index[key] if isinstance(key, str) else key
+        function = self.functions[index]
+        function.basicblocks, edges = self._load(index)
+        function.instructions = [i for bb in function.basicblocks
+                                 for i in bb.instructions]
+        if function.instructions and function.start_instr is None:
+            function.start_instr = function.instructions[0]
+        return function, edges
+
+    def load(self):
+        '''Return (functions, basicblocks, edges) of the whole graph'''
+        basicblocks = dict()
+        edges = dict()
+        for index in range(len(self.functions)):
+            _, function_edges = self.function(index)
+            for bb in self.functions[index].basicblocks:
+                basicblocks.setdefault(bb.name, bb)
+            edges.update(dict.fromkeys(function_edges))
+        remainder, remainder_edges = self._load(len(self.functions))
+        for bb in remainder:
+            basicblocks.setdefault(bb.name, bb)
+        edges.update(dict.fromkeys(remainder_edges))
+        blocks = sorted(basicblocks.values(),
+                        key=lambda bb: (str(bb.function_name)
+                                        if self.arch == 'wasm' else '',
+                                        bb.start_offset))
+        return self.functions, blocks, list(edges)
+
+
+def build_cfg(bytecode, arch='evm', analysis='dynamic'):
+    '''Build the CFG of bytecode'''
+    if arch == 'wasm':
+        from octopus.arch.wasm.cfg import WasmCFG
+        return WasmCFG(bytecode)
+    from octopus.arch.evm.cfg import EvmCFG
+    return EvmCFG(bytecode, analysis=analysis)
+
+
+class CFGCache(object):
+    '''Directory of CFG artifacts named by code hash'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, digest, arch='evm', analysis='dynamic'):
+        name = '%s.%s' % (digest, arch)
+        if arch == 'evm':
+            name += '.' + analysis
+        return os.path.join(self.directory, name + ARTIFACT_EXTENSION)
+
+    def get(self, bytecode, arch='evm', analysis='dynamic'):
+        '''Open the artifact of bytecode, build the CFG and save it first
+        if needed
+        '''
+        digest = code_hash(bytecode)
+        path = self.path(digest, arch, analysis)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            logging.info('[+] Build CFG %s', digest)
+            save_cfg(build_cfg(bytecode, arch, analysis), path, arch,
+                     analysis, digest)
+        return CFGArtifact.open(path)
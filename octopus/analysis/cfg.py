@@ -0,0 +1,33 @@
+from abc import ABC, abstractmethod
+
+
+class CFG(ABC):
+    """ Generic Control Flow Graph class
+
+    Subclasses build the graph of their architecture in __init__ and
+    fill the attributes:
+
+        functions       list of octopus.core.function.Function
+        basicblocks     list of octopus.core.basicblock.BasicBlock
+        edges           list of octopus.core.edge.Edge
+    """
+
+    functions = ()
+    basicblocks = ()
+    edges = ()
+
+    @abstractmethod
+    def run_static_analysis(self):
+        """ Recover functions, basic blocks and edges from the
+        instructions only, without emulation """
+
+    def show(self):
+        """ Print the size of the graph """
+        print("len bb = %d" % len(self.basicblocks))
+        print("len func = %d" % len(self.functions))
+        print("len edges = %d" % len(self.edges))
+
+    def visualize(self):
+        """ Render the graph, if the architecture supports it """
+        raise NotImplementedError('%s can not be visualized'
+                                  % type(self).__name__)
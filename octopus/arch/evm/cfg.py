@@ -3,18 +3,113 @@ from octopus.core.function import Function
 from octopus.core.basicblock import BasicBlock
 
 from octopus.arch.evm.disassembler import EvmDisassembler
+from octopus.arch.evm.recovery import CFGRecovery, ValueSetAnalysis
+from octopus.arch.evm.signatures import default_database
 
-import json
-import os
+from collections import deque
 
 from logging import getLogger
 logging = getLogger(__name__)
 
 
-SIGNATURE_FILE_PATH = '/signatures.txt'
+# selector extraction: PUSH1 0xe0 SHR or PUSH29 0x01000...0 SWAP1 DIV
+SELECTOR_SHIFT = 0xe0
+SELECTOR_DIVISOR = 1 << 0xe0
+DISPATCH_COMPARISONS = ('EQ', 'GT', 'LT')
+
+
+def _dispatch_test(window):
+    """
+    Match the selector test ending the window with a JUMPI:
+        PUSHn value [DUP2] EQ|GT|LT PUSH1|PUSH2 target JUMPI
+    return (comparison, value push, target) or None
+    """
+    if len(window) < 4:
+        return None
+    push, compare = window[-2], window[-3]
+    if compare.name not in DISPATCH_COMPARISONS or \
+            push.name not in ('PUSH1', 'PUSH2'):
+        return None
+    value = window[-4]
+    if value.name == 'DUP2' and len(window) == 5:
+        value = window[-5]
+    if not value.is_push:
+        return None
+    return compare.name, value, push.operand_interpretation
+
+
+def _is_selector_extraction(window):
+    inst = window[-1]
+    if inst.name == 'SHR':
+        push = window[-2] if len(window) > 1 else None
+        return push is not None and push.is_push and \
+            push.operand_interpretation == SELECTOR_SHIFT
+    if inst.name == 'DIV' and len(window) > 2 and window[-2].name == 'SWAP1':
+        push = window[-3]
+        return push.is_push and \
+            push.operand_interpretation == SELECTOR_DIVISOR
+    return False
+
+
+class SelectorMatcher(object):
+    """
+    Streaming matcher of the dispatcher selector tests, see
+    enum_func_static. Instructions are given one by one to match,
+    the accepted function entries are given back to add
+    """
+
+    def __init__(self):
+        self.window = deque(maxlen=5)
+        self.in_dispatcher = False
+        self.dispatcher_end = None
+        self.entries = set()
+
+    def match(self, inst):
+        """ Return (selector, target) if inst ends a selector test
+        of a new function, None otherwise """
+        window = self.window
+        window.append(inst)
+        if self.dispatcher_end is not None and \
+                inst.offset >= self.dispatcher_end:
+            self.in_dispatcher = False
+
+        if _is_selector_extraction(window):
+            self.in_dispatcher = True
+            return None
+        if inst.name != 'JUMPI':
+            return None
+        test = _dispatch_test(window)
+        if test is None:
+            return None
+        compare, value, xref = test
+        if compare != 'EQ' or xref in self.entries:
+            return None
+        if value.name != 'PUSH4' and not (self.in_dispatcher and
+                                          value.operand_size < 4):
+            return None
+        return value.operand_interpretation, xref
+
+    def add(self, xref):
+        """ Record the function entry xref returned by match """
+        self.entries.add(xref)
+        if self.dispatcher_end is None or xref < self.dispatcher_end:
+            self.dispatcher_end = xref
 
 
 def enum_func_static(instructions):
+    """
+    Return the functions found in the dispatcher, in a single pass
+    over instructions with a sliding window of the last 5 instructions
+
+    Recognized selector tests (PUSH4 anywhere, PUSH1..PUSH3 for selectors
+    with leading zero bytes inside the dispatcher only):
+        PUSH4 selector DUP2 EQ PUSH target JUMPI      (solc 0.4)
+        DUP1 PUSH4 selector EQ PUSH target JUMPI
+    binary search splits (DUP1 PUSH4 pivot GT|LT PUSH target JUMPI) jump
+    to other parts of the dispatcher and are not functions.
+    The dispatcher starts at the selector extraction (SHR or DIV) and
+    ends at the first function entry.
+    """
 
     functions = list()
 
@@ -25,56 +120,42 @@ def enum_func_static(instructions):
                         prefered_name='Dispatcher')
     functions.append(function)
 
-    # parse the instructions and create Function object
+    by_offset = {inst.offset: inst for inst in instructions}
+    matcher = SelectorMatcher()
     for inst in instructions:
-        try:
-            # PUSH4 are used to push the function signature on the stack
-            if inst.name == 'PUSH4':
-                index = instructions.index(inst)
-                list_inst = instructions[index:index + 4]
-                push4, eq, push, jumpi = list_inst[0], list_inst[1], list_inst[2], list_inst[3]
-
-                # check if this basicblock test function signature
-                if eq.name == 'EQ' and push.name in ['PUSH1', 'PUSH2'] and jumpi.name == 'JUMPI':
-                    xref = int.from_bytes(push.operand, byteorder='big')
-                    sign = int.from_bytes(push4.operand, byteorder='big')
-                    name = 'func_%x' % sign
-                    prefered_name = find_signature(sign)
-
-                    # find instr with offset == xref
-                    begin_function = next(filter(lambda i: i.offset == xref, instructions))
-                    # create new function
-                    function = Function(xref,
-                                        start_instr=begin_function,
-                                        name=name,
-                                        prefered_name=prefered_name)
-
-                    functions.append(function)
-        except:
-            logging.info('enum_func_static Exception')
-            pass
+        match = matcher.match(inst)
+        if match is None or match[1] not in by_offset:
+            continue
+        sign, xref = match
+        matcher.add(xref)
+        # create new function
+        function = Function(xref,
+                            start_instr=by_offset[xref],
+                            name='func_%x' % sign,
+                            prefered_name=find_signature(sign),
+                            selector=sign)
+        functions.append(function)
     return functions
 
 
 def find_signature(sign):
-    path = os.path.dirname(os.path.realpath(__file__)) + SIGNATURE_FILE_PATH
-    with open(path) as data_file:
-        data = json.load(data_file)
-    try:
-        pref_name = data[str(hex(sign))]
-        return pref_name
-    except:
-        pass
-    return None
+    """ Return the name of the selector sign or None,
+    see octopus.arch.evm.signatures """
+    return default_database().lookup(sign)
 
 
-def enum_blocks_static(instructions):
+def enum_blocks_static(instructions, leaders=None):
 
     """
     Return a list of basicblock after
     statically parsing given instructions
+    leaders (optional) is the set of block start offsets,
+    see octopus.arch.evm.codemap
     """
 
+    if leaders is not None:
+        return _enum_blocks_leaders(instructions, leaders)
+
     basicblocks = list()
     index = 0
 
@@ -128,38 +209,100 @@ def enum_blocks_static(instructions):
     return basicblocks
 
 
+def _enum_blocks_leaders(instructions, leaders):
+    """
+    Split instructions at the given block start offsets
+    """
+    basicblocks = list()
+    block = None
+    for inst in instructions:
+        if block is None or inst.offset in leaders:
+            if block is not None:
+                basicblocks.append(block)
+            block = BasicBlock(inst.offset,
+                               inst,
+                               name='block_%x' % inst.offset)
+        block.instructions.append(inst)
+        block.end_offset = inst.offset_end
+        block.end_instr = inst
+    if block is not None:
+        basicblocks.append(block)
+    return basicblocks
+
+
+def assign_basicblocks(functions, basicblocks, edges):
+    """
+    Fill function.basicblocks with the blocks reachable from the function
+    entry without going through the entry of another function, blocks
+    shared by several functions keep the name of the first one
+    """
+    blocks = {bb.start_offset: bb for bb in basicblocks}
+    successors = dict()
+    for edge in edges:
+        successors.setdefault(edge.node_from, list()).append(edge.node_to)
+    entries = {f.start_offset for f in functions}
+
+    for function in functions:
+        if function.start_offset not in blocks:
+            continue
+        seen = {function.start_offset}
+        todo = [function.start_offset]
+        while todo:
+            offset = todo.pop()
+            for target in successors.get(offset, ()):
+                if target not in seen and target not in entries:
+                    seen.add(target)
+                    todo.append(target)
+        function.basicblocks = [blocks[offset] for offset in sorted(seen)]
+        for bb in function.basicblocks:
+            if bb.function_name == 'unknown':
+                bb.function_name = function.name
+
+
 class EvmCFG(CFG):
 
-    def __init__(self, bytecode=None, analysis='dynamic'):
-        """ TODO """
+    def __init__(self, bytecode=None, analysis='dynamic', code_map=None):
+        """ code_map: CodeMap of the runtime code (octopus.arch.evm.codemap)
+        used to split the basic blocks """
 
         self.bytecode = bytecode
         self.disasm = EvmDisassembler(self.bytecode)
         self.instructions = self.disasm.disassemble()
         self.analysis = analysis
+        if code_map is not None and len(code_map) != len(self.disasm.bytecode):
+            raise ValueError('code_map does not match the runtime code')
+        self.code_map = code_map
 
         self.basicblocks = list()
         self.functions = list()
         self.edges = list()
+        # offsets of the jumps with an unknown target (dynamic analysis)
+        self.unresolved = set()
 
         if self.analysis == 'dynamic':
             self.run_dynamic_analysis()
         elif self.analysis == 'static':
             self.run_static_analysis()
+        elif self.analysis == 'value_set':
+            self.run_dynamic_analysis(ValueSetAnalysis)
 
     def run_static_analysis(self):
         self.functions = enum_func_static(self.instructions)
-        self.basicblocks = enum_blocks_static(self.instructions)
+        leaders = self.code_map.leader_set() if self.code_map else None
+        self.basicblocks = enum_blocks_static(self.instructions, leaders)
 
-    def run_dynamic_analysis(self):
-
-        from octopus.platforms.ETH.emulator import EthereumSSAEngine
-
-        emul = EthereumSSAEngine(self.bytecode)
-        emul.emulate()
-        self.functions = emul.functions
-        self.basicblocks = emul.basicblocks
-        self.edges = emul.edges
+    def run_dynamic_analysis(self, recovery_class=CFGRecovery):
+        """ CFG recovery by abstract interpretation of the stack,
+        recovery_class: CFGRecovery or ValueSetAnalysis,
+        see octopus.arch.evm.recovery """
+        self.functions = enum_func_static(self.instructions)
+        leaders = self.code_map.leader_set() if self.code_map else None
+        recovery = recovery_class(self.instructions,
+                                  enum_blocks_static(self.instructions,
+                                                     leaders))
+        self.basicblocks, self.edges = recovery.run()
+        self.unresolved = recovery.unresolved
+        assign_basicblocks(self.functions, self.basicblocks, self.edges)
 
     def show(self):
         print("len bb = %d" % len(self.basicblocks))
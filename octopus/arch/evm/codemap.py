@@ -0,0 +1,118 @@
+'''
+Vectorized code / PUSH data analysis of EVM bytecode (requires numpy)
+
+    code_map = build_code_map(bytecode)
+    code_map.code_mask      # True where an instruction starts
+    code_map.jumpdests      # True on valid JUMPDEST
+    code_map.leaders        # sorted offsets of basic block starts
+
+    code_maps = build_code_maps(corpus)     # one pass for many contracts
+
+Instruction starts are the offsets reachable from offset 0 through
+next(i) = i + 1 + PUSH size of code[i]. They are found with pointer
+doubling: after k passes, every instruction at distance < 2**k from the
+beginning of its contract is marked, so log2(code size) passes over whole
+arrays are enough, even for a concatenated corpus.
+
+The maps are consumed by EvmCFG(code_map=...) and by the emulator
+(EthereumSSAEngine(code_map=...) or engine.code_map), both expect a map of
+the runtime code as returned by their disassembler (creation code and
+swarm hash removed) and raise ValueError on a map of another length.
+'''
+
+from octopus.arch.evm.evm import EVM
+from octopus.core.utils import bytecode_to_bytes
+
+
+JUMPDEST = 0x5b
+# opcodes ending a basic block, unknown opcodes are INVALID
+_TERMINATOR_NAMES = ('JUMP', 'JUMPI', 'STOP', 'RETURN', 'REVERT', 'INVALID',
+                     'SELFDESTRUCT')
+
+
+def _tables(np):
+    table = EVM().table
+    push_size = np.zeros(256, dtype=np.int64)
+    push_size[0x60:0x80] = np.arange(1, 33)
+    terminator = np.array([op not in table or
+                           table[op][0] in _TERMINATOR_NAMES
+                           for op in range(256)])
+    return push_size, terminator
+
+
+class CodeMap(object):
+    '''Masks of one contract, all numpy arrays indexed by code offset'''
+
+    def __init__(self, code, code_mask, jumpdests, leaders):
+        self.code = code
+        self.code_mask = code_mask
+        self.jumpdests = jumpdests
+        self.leaders = leaders
+
+    def __len__(self):
+        return len(self.code)
+
+    def is_jumpdest(self, offset):
+        return 0 <= offset < len(self.jumpdests) and \
+            bool(self.jumpdests[offset])
+
+    def jumpdest_bitmap(self):
+        '''Valid JUMPDEST as a bitmap, bit i % 8 of byte i // 8'''
+        import numpy as np
+
+        return np.packbits(self.jumpdests, bitorder='little').tobytes()
+
+    def leader_set(self):
+        return set(self.leaders.tolist())
+
+
+def build_code_maps(codes):
+    '''Return the CodeMap of every bytecode of codes (hex or bytes)'''
+    import numpy as np
+
+    codes = [bytes(bytecode_to_bytes(code)) for code in codes]
+    lengths = np.array([len(code) for code in codes], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    code = np.frombuffer(b''.join(codes), dtype=np.uint8)
+    n = len(code)
+    push_size, terminator = _tables(np)
+
+    # next instruction start, never past the end of its contract
+    # (the start of the next one), n is a sentinel pointing to itself
+    nxt = np.empty(n + 1, dtype=np.int64)
+    nxt[:n] = np.arange(1, n + 1) + push_size[code]
+    np.minimum(nxt[:n], np.repeat(ends, lengths), out=nxt[:n])
+    nxt[n] = n
+    first = nxt[:n].copy()
+
+    mark = np.zeros(n + 1, dtype=bool)
+    mark[starts[lengths > 0]] = True
+    covered = 1
+    longest = int(lengths.max()) if len(lengths) else 0
+    while covered < longest:
+        mark[nxt[mark]] = True
+        nxt = nxt[nxt]
+        covered *= 2
+    code_mask = mark[:n]
+
+    jumpdests = code_mask & (code == JUMPDEST)
+    leaders = np.zeros(n + 1, dtype=bool)
+    leaders[first[code_mask & terminator[code]]] = True
+    # a block after the last instruction of a contract does not exist
+    leaders[ends] = False
+    leaders[starts[lengths > 0]] = True
+    leaders[:n] |= jumpdests
+    leaders = np.flatnonzero(leaders[:n])
+
+    maps = list()
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        lo, hi = np.searchsorted(leaders, (start, end))
+        maps.append(CodeMap(code[start:end], code_mask[start:end],
+                            jumpdests[start:end], leaders[lo:hi] - start))
+    return maps
+
+
+def build_code_map(bytecode):
+    '''Return the CodeMap of bytecode (hex or bytes)'''
+    return build_code_maps([bytecode])[0]
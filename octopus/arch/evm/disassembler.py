@@ -1,10 +1,11 @@
-import io
 import logging
-import re
 
-from octopus.engine.disassembler import Disassembler
+from octopus.core.utils import bytecode_to_bytes
+from octopus.engine.disassembler import (Disassembler,
+                                         BytecodeEmptyException)
 
 from octopus.arch.evm.instruction import EvmInstruction
+from octopus.arch.evm.metadata import split_bytecode
 from octopus.arch.evm.evm import EVM
 
 
@@ -12,78 +13,136 @@ class EvmDisassembler(Disassembler):
 
     def __init__(self, bytecode=None):
         Disassembler.__init__(self, asm=EVM(), bytecode=bytecode)
+        # opcode -> table entry, unknown opcodes are INVALID
+        invalid = ('INVALID', 0, 0, 0, 0, 'Unknown opcode')
+        self._table = [self.asm.table.get(opcode, invalid)
+                       for opcode in range(256)]
         self.loader_code = None
+        self.constructor_args = b''
+        self.metadata = None
         self.swarm_hash = None
 
     def runtime_code_detector(self):
         '''Check for presence of runtime code
         '''
-        result = list(re.finditer('60.{2}604052', self.bytecode))
-        if len(result) > 1:
-            position = result[1].start()
+        layout = split_bytecode(self.bytecode)
+        if layout.loader is not None:
             logging.info("[+] Runtime code detected")
-            self.loader_code = self.bytecode[:position]
-            self.bytecode = self.bytecode[position:]
-
-    def swarm_hash_detector(self):
-        '''Check for presence of Swarm hash at the end of bytecode
-            https://github.com/ethereum/wiki/wiki/Swarm-Hash
+            self.loader_code = layout.loader
+            self.constructor_args = layout.constructor_args
+        self.bytecode = layout.code[layout.runtime_offset:]
+        return layout
+
+    def swarm_hash_detector(self, layout=None):
+        '''Check for presence of the CBOR metadata (Swarm / IPFS hash,
+            solc version) at the end of the runtime code
+            https://docs.soliditylang.org/en/latest/metadata.html
         '''
-        # we reduce to last 50 bytes to be sure it's the swarm hash
-        # and not fake code
-        swarm_hash_off = self.bytecode[-100:].find('a165627a7a72')
-        # bzzr == 0x65627a7a72
-        if swarm_hash_off > 0:
-            logging.info("[+] Swarm hash detected in bytecodes")
-            swarm_hash = self.bytecode[-100 + swarm_hash_off:]
-            logging.info("[+] Swarm hash value: 0x%s", swarm_hash)
-            logging.info("[+] Swarm hash removed")
-            self.swarm_hash = self.bytecode[-100 + swarm_hash_off:]
-            self.bytecode = self.bytecode[:-len(self.swarm_hash)]
+        layout = layout or split_bytecode(self.bytecode)
+        metadata = layout.metadata
+        if metadata is not None:
+            logging.info("[+] Metadata detected in bytecodes")
+            logging.info("[+] Metadata value: %s", metadata.as_dict())
+            logging.info("[+] Metadata removed")
+            self.metadata = metadata
+            self.swarm_hash = metadata.raw
+        self.bytecode = layout.runtime
 
     def analysis(self):
-        self.runtime_code_detector()
-        self.swarm_hash_detector()
+        self.swarm_hash_detector(self.runtime_code_detector())
 
-    def disassemble_opcode(self, bytecode, offset=0):
+    def _decode(self, view, pos, offset):
         """
-        TODO
+        Decode the instruction at view[pos], located at offset
         """
-
-        wallet = io.BytesIO(bytecode)
-        opcode = int.from_bytes(wallet.read(1), byteorder='big')
-
-        # default value
-        invalid = ('INVALID', 0, 0, 0, 0, 'Unknown opcode')
+        opcode = view[pos]
         name, operand_size, pops, pushes, gas, description = \
-            self.asm.table.get(opcode, invalid)
+            self._table[opcode]
         instruction = EvmInstruction(opcode, name, operand_size, pops, pushes,
                                      gas, description, offset=offset)
-        if instruction.has_operand:
-            instruction.operand = wallet.read(operand_size)
+        if operand_size:
+            # may be truncated at the end of the code
+            instruction.operand = bytes(view[pos + 1:pos + 1 + operand_size])
             if instruction.is_push:
                 # directly calculate the operand int representation
                 instruction.operand_interpretation = \
                     int.from_bytes(instruction.operand, byteorder='big')
-
         return instruction
 
-    def disassemble(self, bytecode=None, offset=0, r_format='list',
-                    analysis=True):
+    def disassemble_opcode(self, bytecode, offset=0):
+        """
+        Disassemble the first instruction of bytecode
+        """
+        return self._decode(memoryview(bytecode), 0, offset)
+
+    def iter_instructions(self, bytecode=None, offset=0, analysis=True):
         '''
+        Yield the instructions one by one, in a single pass over the code
         creation code remove if analysis param is set to True (default)
-        r_format: ('list' | 'text' | 'reverse')
         '''
-
         self.bytecode = bytecode if bytecode else self.bytecode
+        if not self.bytecode:
+            raise BytecodeEmptyException()
 
         if analysis:
             self.analysis()
+        self.bytecode = bytecode_to_bytes(self.bytecode)
 
-        # reset lists
-        self.instructions = list()
-        self.reverse_instructions = dict()
+        view = memoryview(self.bytecode)
+        while offset < len(view):
+            instruction = self._decode(view, offset, offset)
+            offset += instruction.size
+            yield instruction
+
+    def annotator(self):
+        '''
+        Streaming function / basic block labels used by write:
+        functions are the targets of the dispatcher tests seen before
+        (octopus.arch.evm.cfg.SelectorMatcher), blocks start at JUMPDEST
+        and after terminators
+        '''
+        # cfg imports this module
+        from octopus.arch.evm.cfg import SelectorMatcher
+
+        functions = dict()
+        matcher = SelectorMatcher()
+        state = {'leader': True}
+
+        def annotate(instr):
+            labels = list()
+            sign = functions.pop(instr.offset, None)
+            if sign is not None:
+                labels.append('\nfunc_%x:' % sign)
+            if state['leader'] or instr.name == 'JUMPDEST':
+                labels.append('block_%x:' % instr.offset)
+            state['leader'] = instr.is_terminator
+
+            match = matcher.match(instr)
+            # backward targets are already written
+            if match is not None and match[1] > instr.offset:
+                sign, target = match
+                matcher.add(target)
+                functions[target] = sign
+            return labels
+        return annotate
 
-        # call generic Disassembler.disassemble method
-        return super().disassemble(self.bytecode, offset,
-                                   r_format)
+    def disassemble(self, bytecode=None, offset=0, r_format='list',
+                    analysis=True):
+        '''
+        creation code remove if analysis param is set to True (default)
+        r_format: ('list' | 'text' | 'reverse')
+        '''
+        self.attributes_reset()
+        self.instructions = list(self.iter_instructions(bytecode, offset,
+                                                        analysis))
+
+        # fill reverse instructions
+        self.reverse_instructions = {k: v for k, v in
+                                     enumerate(self.instructions)}
+
+        if r_format == 'list':
+            return self.instructions
+        elif r_format == 'text':
+            return '\n'.join(map(str, self.instructions))
+        elif r_format == 'reverse':
+            return self.reverse_instructions
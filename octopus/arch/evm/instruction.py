@@ -1,95 +1,193 @@
+from collections import namedtuple
+
 from octopus.core.instruction import Instruction
 
 
+# instruction flags, computed once per opcode (see OpcodeDescriptor)
+ARITHMETIC = 1 << 0
+COMPARISON_LOGIC = 1 << 1
+SHA3 = 1 << 2
+ENVIRONMENTAL = 1 << 3
+BLOCK_INFO = 1 << 4
+STACK_MEMORY_STORAGE_FLOW = 1 << 5
+PUSH = 1 << 6
+DUP = 1 << 7
+SWAP = 1 << 8
+LOG = 1 << 9
+SYSTEM = 1 << 10
+BRANCH_CONDITIONAL = 1 << 11
+BRANCH_UNCONDITIONAL = 1 << 12
+HALT = 1 << 13
+BRANCH = BRANCH_CONDITIONAL | BRANCH_UNCONDITIONAL
+TERMINATOR = BRANCH | HALT
+
+# opcode >> 4: (group, flags)
+_GROUPS = {0: ('Stop and Arithmetic Operations', ARITHMETIC),
+           1: ('Comparison & Bitwise Logic Operations', COMPARISON_LOGIC),
+           2: ('SHA3', SHA3),
+           3: ('Environmental Information', ENVIRONMENTAL),
+           4: ('Block Information', BLOCK_INFO),
+           5: ('Stack, Memory, Storage and Flow Operations',
+               STACK_MEMORY_STORAGE_FLOW),
+           6: ('Push Operations', PUSH),
+           7: ('Push Operations', PUSH),
+           8: ('Duplication Operations', DUP),
+           9: ('Exchange Operations', SWAP),
+           0xa: ('Logging Operations', LOG),
+           0xf: ('System operations', SYSTEM)}
+_INVALID_GROUP = ('Invalid instruction', 0)
+
+_NAME_FLAGS = {'JUMPI': BRANCH_CONDITIONAL,
+               'JUMP': BRANCH_UNCONDITIONAL,
+               'RETURN': HALT,
+               'STOP': HALT,
+               'INVALID': HALT,
+               'SELFDESTRUCT': HALT,
+               'REVERT': HALT}
+
+
+# immutable, shared by all the instructions with the same opcode
+OpcodeDescriptor = namedtuple('OpcodeDescriptor', (
+    'opcode', 'name', 'operand_size', 'pops', 'pushes', 'fee',
+    'description', 'group', 'flags'))
+
+_descriptors = dict()
+
+
+def opcode_descriptor(opcode, name, operand_size, pops, pushes, fee,
+                      description):
+    '''Return the shared OpcodeDescriptor of an opcode table entry'''
+    key = (opcode, name)
+    descriptor = _descriptors.get(key)
+    if descriptor is None:
+        if name == 'INVALID':
+            # unknown opcodes of a group are not part of it
+            group, flags = _INVALID_GROUP
+        else:
+            group, flags = _GROUPS.get(opcode >> 4, _INVALID_GROUP)
+        flags |= _NAME_FLAGS.get(name, 0)
+        descriptor = OpcodeDescriptor(opcode, name, operand_size, pops,
+                                      pushes, fee, description, group, flags)
+        _descriptors[key] = descriptor
+    return descriptor
+
+
 class EvmInstruction(Instruction):
     """ETH Instruction
 
-    TODO
+    Only opcode, offset, operand and the analysis results are stored per
+    instruction. Opcode attributes (name, operand_size, pops, pushes, fee,
+    description) are read from the shared self.descriptor, the
+    classification properties only test the precomputed self.flags.
 
     """
 
+    __slots__ = ('opcode', 'offset', 'operand', 'operand_interpretation',
+                 'xref', 'ssa', 'descriptor', 'flags')
+
     def __init__(self, opcode, name,
                  operand_size, pops, pushes, fee,
                  description, operand=None,
                  operand_interpretation=None, offset=0, xref=None):
         """ TODO """
-        super().__init__(opcode=opcode, name=name,
-                         operand_size=operand_size, pops=pops, pushes=pushes,
-                         fee=fee, description=description, operand=operand,
-                         operand_interpretation=operand_interpretation,
-                         offset=offset, xref=xref)
+        self.opcode = opcode
+        self.offset = offset
+        self.operand = operand
+        self.operand_interpretation = operand_interpretation
+        self.xref = xref
+        self.ssa = None
+        self.descriptor = opcode_descriptor(opcode, name, operand_size,
+                                            pops, pushes, fee, description)
+        self.flags = self.descriptor.flags
+
+    @property
+    def name(self):
+        return self.descriptor.name
+
+    @property
+    def operand_size(self):
+        return self.descriptor.operand_size
+
+    @property
+    def pops(self):
+        return self.descriptor.pops
+
+    @property
+    def pushes(self):
+        return self.descriptor.pushes
+
+    @property
+    def fee(self):
+        return self.descriptor.fee
+
+    @property
+    def description(self):
+        return self.descriptor.description
 
     @property
     def group(self):
         '''Instruction classification as per the yellow paper'''
-        classes = {0: 'Stop and Arithmetic Operations',
-                   1: 'Comparison & Bitwise Logic Operations',
-                   2: 'SHA3',
-                   3: 'Environmental Information',
-                   4: 'Block Information',
-                   5: 'Stack, Memory, Storage and Flow Operations',
-                   6: 'Push Operations',
-                   7: 'Push Operations',
-                   8: 'Duplication Operations',
-                   9: 'Exchange Operations',
-                   0xa: 'Logging Operations',
-                   0xf: 'System operations'}
-        return classes.get(self.opcode >> 4, 'Invalid instruction')
+        return self.descriptor.group
 
     @property
     def is_terminator(self):
         """ True if the instruction is a basic block terminator """
-        return self.is_branch or self.is_halt
+        return bool(self.flags & TERMINATOR)
+
+    @property
+    def is_branch(self):
+        """ True if the instruction is a jump """
+        return bool(self.flags & BRANCH)
 
     @property
     def is_branch_conditional(self):
         """ Return list if the instruction is a jump """
-        return self.semantics in ['JUMPI']
+        return bool(self.flags & BRANCH_CONDITIONAL)
 
     @property
     def is_branch_unconditional(self):
         """ Return list if the instruction is a jump """
-        return self.semantics in ['JUMP']
+        return bool(self.flags & BRANCH_UNCONDITIONAL)
 
     @property
     def is_system(self):
         """ True if the instruction is a system operation """
-        return self.group == 'System operations'
+        return bool(self.flags & SYSTEM)
 
     @property
     def is_arithmetic(self):
         """ True if the instruction is an arithmetic operation """
-        return self.group == 'Stop and Arithmetic Operations'
+        return bool(self.flags & ARITHMETIC)
 
     @property
     def is_comparaison_logic(self):
         """ True if the instruction is a Comparison & Bitwise Logic Operations """
-        return self.group == 'Comparison & Bitwise Logic Operations'
+        return bool(self.flags & COMPARISON_LOGIC)
 
     @property
     def is_sha3(self):
         """ True if the instruction is SHA3"""
-        return self.group == 'SHA3'
+        return bool(self.flags & SHA3)
 
     @property
     def is_environmental(self):
         """ True if the instruction access enviromental data """
-        return self.group == 'Environmental Information'
+        return bool(self.flags & ENVIRONMENTAL)
 
     @property
     def uses_block_info(self):
         """ True if the instruction access block information """
-        return self.group == 'Block Information'
+        return bool(self.flags & BLOCK_INFO)
 
     @property
     def uses_stack_block_storage_info(self):
         """ True if the instruction are in the group Stack, Memory, Storage and Flow Operations """
-        return self.group == 'Stack, Memory, Storage and Flow Operations'
+        return bool(self.flags & STACK_MEMORY_STORAGE_FLOW)
 
     @property
     def is_push(self):
         """ True if the instruction is a push Operations """
-        return self.group == 'Push Operations'
+        return bool(self.flags & PUSH)
 
     @property
     def have_xref(self):
@@ -98,10 +196,9 @@ class EvmInstruction(Instruction):
 
     def set_xref(self, v):
         """ TODO """
-        self._xref = int.from_bytes(v, byteorder='big')
+        self.xref = int.from_bytes(v, byteorder='big')
 
     @property
     def is_halt(self):
         """ Return list if the instruction is a basic block terminator """
-        return self.semantics in ('RETURN', 'STOP', 'INVALID',
-                                  'SELFDESTRUCT', 'REVERT')
+        return bool(self.flags & HALT)
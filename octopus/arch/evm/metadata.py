@@ -0,0 +1,200 @@
+'''
+Byte-level layout of a contract bytecode
+
+    creation code = loader | runtime code | metadata | constructor arguments
+    runtime code  = runtime code | metadata
+
+The metadata appended by solc is a CBOR map followed by its length on two
+bytes (big-endian):
+
+    a2 64 'ipfs' 58 22 <34 bytes> 64 'solc' 43 <3 bytes> 00 33
+
+Keys are ipfs, bzzr0 (legacy swarm hash), bzzr1, solc (version, 3 bytes
+or a text string for nightly builds) and experimental.
+
+Everything works on bytes in O(n), without converting to hex.
+'''
+
+from octopus.core.utils import bytecode_to_bytes
+
+
+# PUSH1 0x80 (0x60 before solc 0.4.22) PUSH1 0x40 MSTORE
+_PROLOGUE_VALUES = (0x60, 0x80)
+# CBOR text keys starting the metadata map
+_METADATA_KEYS = (b'\x64ipfs', b'\x65bzzr0', b'\x65bzzr1', b'\x64solc')
+
+
+class MetadataFormatException(Exception):
+    """Exception raised when a CBOR metadata can not be decoded"""
+    pass
+
+
+class Metadata(object):
+    '''Decoded CBOR metadata trailer'''
+
+    def __init__(self, offset, raw, fields):
+        # offset of the CBOR map in the code
+        self.offset = offset
+        # CBOR map and length suffix
+        self.raw = raw
+        self.fields = fields
+
+    @property
+    def end(self):
+        return self.offset + len(self.raw)
+
+    @property
+    def solc_version(self):
+        version = self.fields.get('solc')
+        if isinstance(version, bytes) and len(version) == 3:
+            return '%d.%d.%d' % tuple(version)
+        return version
+
+    def as_dict(self):
+        return {key: value.hex() if isinstance(value, bytes) else value
+                for key, value in self.fields.items()}
+
+    def __repr__(self):
+        return '<Metadata 0x%x %s>' % (self.offset, self.as_dict())
+
+
+def _cbor_item(data, pos):
+    '''Decode the CBOR item at data[pos], return (value, next position)'''
+    if pos >= len(data):
+        raise MetadataFormatException('truncated')
+    major, info = data[pos] >> 5, data[pos] & 0x1f
+    pos += 1
+    if info < 24:
+        arg = info
+    elif info <= 27:
+        size = 1 << (info - 24)
+        if pos + size > len(data):
+            raise MetadataFormatException('truncated')
+        arg = int.from_bytes(data[pos:pos + size], byteorder='big')
+        pos += size
+    else:
+        raise MetadataFormatException('unsupported length %d' % info)
+
+    if major == 0:
+        return arg, pos
+    if major in (2, 3):
+        if pos + arg > len(data):
+            raise MetadataFormatException('truncated')
+        value = bytes(data[pos:pos + arg])
+        if major == 3:
+            try:
+                value = value.decode('utf-8')
+            except UnicodeDecodeError:
+                raise MetadataFormatException('invalid text')
+        return value, pos + arg
+    if major == 5:
+        fields = dict()
+        for _ in range(arg):
+            key, pos = _cbor_item(data, pos)
+            if not isinstance(key, str):
+                raise MetadataFormatException('non text key')
+            fields[key], pos = _cbor_item(data, pos)
+        return fields, pos
+    if major == 7 and info in (20, 21):
+        return info == 21, pos
+    raise MetadataFormatException('unsupported major type %d' % major)
+
+
+def decode_metadata(code, offset):
+    '''Decode the metadata map starting at code[offset], return a Metadata
+    if it is followed by its length, None otherwise
+    '''
+    try:
+        fields, end = _cbor_item(code, offset)
+    except MetadataFormatException:
+        return None
+    if not isinstance(fields, dict) or not fields or end + 2 > len(code) or \
+            int.from_bytes(code[end:end + 2], 'big') != end - offset:
+        return None
+    return Metadata(offset, bytes(code[offset:end + 2]), fields)
+
+
+def find_metadata(code, start=0):
+    '''Return the Metadata of the code in code[start:] or None
+
+    The length suffix is checked first, it is the metadata of a runtime
+    code without constructor arguments. Otherwise the last valid map is
+    used, the previous ones belong to contracts created by this code.
+    '''
+    if len(code) >= 2:
+        length = int.from_bytes(code[-2:], 'big')
+        if length < len(code) - 1 - start:
+            metadata = decode_metadata(code, len(code) - 2 - length)
+            if metadata is not None:
+                return metadata
+
+    candidates = set()
+    for key in _METADATA_KEYS:
+        pos = code.find(key, start + 1)
+        while pos != -1:
+            # map header (a1..a5) before the first key
+            if 0xa1 <= code[pos - 1] <= 0xa5:
+                candidates.add(pos - 1)
+            pos = code.find(key, pos + 1)
+    for offset in sorted(candidates, reverse=True):
+        metadata = decode_metadata(code, offset)
+        if metadata is not None:
+            return metadata
+    return None
+
+
+def prologue_offsets(code):
+    '''Offsets of PUSH1 0x80|0x60 PUSH1 0x40 MSTORE at instruction starts'''
+    offsets = list()
+    pos = 0
+    end = len(code)
+    while pos < end:
+        op = code[pos]
+        if op == 0x60 and code[pos + 1:pos + 2] and \
+                code[pos + 1] in _PROLOGUE_VALUES and \
+                code[pos + 2:pos + 5] == b'\x60\x40\x52':
+            offsets.append(pos)
+        if 0x60 <= op <= 0x7f:
+            pos += op - 0x5e
+        else:
+            pos += 1
+    return offsets
+
+
+class CodeLayout(object):
+    '''Parts of a bytecode, see the module documentation'''
+
+    def __init__(self, code, runtime_offset, metadata):
+        self.code = code
+        self.runtime_offset = runtime_offset
+        self.metadata = metadata
+        self.runtime_end = metadata.offset if metadata else len(code)
+        self.args_offset = metadata.end if metadata else len(code)
+
+    @property
+    def loader(self):
+        '''Creation code or None'''
+        return self.code[:self.runtime_offset] if self.runtime_offset \
+            else None
+
+    @property
+    def runtime(self):
+        '''Runtime code without metadata'''
+        return self.code[self.runtime_offset:self.runtime_end]
+
+    @property
+    def constructor_args(self):
+        return self.code[self.args_offset:]
+
+
+def split_bytecode(bytecode):
+    '''Return the CodeLayout of bytecode (bytes or hex)
+
+    The runtime code starts at the second solc prologue found at an
+    instruction start, the constructor arguments after the metadata.
+    '''
+    code = bytes(bytecode_to_bytes(bytecode))
+    prologues = prologue_offsets(code)
+    runtime_offset = prologues[1] if len(prologues) > 1 else 0
+    return CodeLayout(code, runtime_offset,
+                      find_metadata(code, runtime_offset))
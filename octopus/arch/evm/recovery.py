@@ -0,0 +1,397 @@
+'''
+CFG recovery by abstract interpretation of the stack
+
+    recovery = CFGRecovery(instructions)
+    basicblocks, edges = recovery.run()
+    recovery.unresolved     # offsets of JUMP / JUMPI with unknown target
+
+    vsa = ValueSetAnalysis(instructions)
+    basicblocks, edges = vsa.run()
+    vsa.targets             # {jump offset: set of targets}
+
+Each basic block is interpreted once per distinct entry stack with a
+worklist. Stack values are constants (int) or None (unknown).
+Constants are folded through PUSH, DUP, SWAP and the operations of
+FOLDED_OPERATIONS, like EthereumSSASimplifier does on the SSA form, so
+targets computed in the block (PUSH2 a PUSH1 b ADD JUMP) or pushed by a
+previous block (internal function return addresses) are resolved.
+
+Between blocks, only constants that are valid JUMPDEST offsets are kept,
+the other values become None: entry stacks only differ by the return
+addresses they carry. Every block gets at most max_states entry stacks,
+then every new entry stack is widened to unknown values (its jumps end
+up in unresolved), so the work is linear in the code size times that
+bound. Nothing is
+copied besides the entry stacks, no memory, storage or path condition.
+'''
+
+from collections import deque
+from itertools import product
+
+from octopus.core.edge import (Edge, EDGE_UNCONDITIONAL,
+                               EDGE_CONDITIONAL_TRUE, EDGE_CONDITIONAL_FALSE,
+                               EDGE_FALLTHROUGH)
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+MAX_STATES_PER_BLOCK = 64
+
+TT256 = 2 ** 256
+TT256M1 = 2 ** 256 - 1
+
+JUMP = 0x56
+JUMPI = 0x57
+
+
+def _shl(shift, value):
+    return (value << shift) & TT256M1 if shift < 256 else 0
+
+
+def _shr(shift, value):
+    return value >> shift if shift < 256 else 0
+
+
+# opcode: function of the popped constants (top of the stack first)
+FOLDED_OPERATIONS = {
+    0x01: lambda a, b: (a + b) & TT256M1,                       # ADD
+    0x02: lambda a, b: (a * b) & TT256M1,                       # MUL
+    0x03: lambda a, b: (a - b) & TT256M1,                       # SUB
+    0x04: lambda a, b: a // b if b else 0,                      # DIV
+    0x06: lambda a, b: a % b if b else 0,                       # MOD
+    0x0a: lambda a, b: pow(a, b, TT256),                        # EXP
+    0x10: lambda a, b: int(a < b),                              # LT
+    0x11: lambda a, b: int(a > b),                              # GT
+    0x14: lambda a, b: int(a == b),                             # EQ
+    0x15: lambda a: int(a == 0),                                # ISZERO
+    0x16: lambda a, b: a & b,                                   # AND
+    0x17: lambda a, b: a | b,                                   # OR
+    0x18: lambda a, b: a ^ b,                                   # XOR
+    0x19: lambda a: a ^ TT256M1,                                # NOT
+    0x1b: _shl,                                                 # SHL
+    0x1c: _shr,                                                 # SHR
+}
+
+
+class CFGRecovery(object):
+    '''Worklist CFG recovery, see the module documentation'''
+
+    def __init__(self, instructions, basicblocks=None,
+                 max_states=MAX_STATES_PER_BLOCK):
+        from octopus.arch.evm.cfg import enum_blocks_static
+
+        self.instructions = instructions
+        if basicblocks is None:
+            basicblocks = enum_blocks_static(instructions)
+        self.blocks = {bb.start_offset: bb for bb in basicblocks}
+        self.jumpdests = frozenset(i.offset for i in instructions
+                                   if i.name == 'JUMPDEST')
+        self.max_states = max_states
+
+        self.edges = list()
+        # offsets of the jumps with at least one unknown target
+        self.unresolved = set()
+        # number of interpreted (block, entry stack)
+        self.states = 0
+
+    def run(self):
+        '''Return (reachable basic blocks sorted by offset, edges)'''
+        if not self.instructions:
+            return list(), list()
+        edges = dict()
+        visited = dict()
+        worklist = deque()
+
+        def schedule(offset, stack):
+            entry = tuple(v if v in self.jumpdests else None for v in stack)
+            seen = visited.setdefault(offset, set())
+            if entry in seen:
+                return
+            if len(seen) >= self.max_states:
+                # widen: every entry stack of this height is covered
+                # by the one without any known value
+                widened = (None,) * len(entry)
+                if widened in seen:
+                    return
+                if len(seen) >= 2 * self.max_states:
+                    self._give_up(offset)
+                    return
+                logging.info('[X] state limit reached at 0x%x', offset)
+                entry = widened
+            seen.add(entry)
+            worklist.append((offset, entry))
+
+        schedule(self.instructions[0].offset, ())
+        while worklist:
+            offset, entry = worklist.popleft()
+            self.states += 1
+            block = self.blocks[offset]
+            for target, edge_type, stack in self.successors(block, entry):
+                if target is None:
+                    self.unresolved.add(block.end_instr.offset)
+                    continue
+                edge = Edge(offset, target, edge_type)
+                edges.setdefault(edge, None)
+                schedule(target, stack)
+
+        self.edges = list(edges)
+        reachable = [self.blocks[offset] for offset in sorted(visited)]
+        return reachable, self.edges
+
+    def _give_up(self, offset):
+        '''The block at offset is not interpreted with a new entry stack,
+        its terminating jump may miss targets
+        '''
+        logging.info('[X] state limit reached at 0x%x', offset)
+        last = self.blocks[offset].end_instr
+        if last.opcode == JUMP or last.opcode == JUMPI:
+            self.unresolved.add(last.offset)
+
+    def interpret(self, block, entry):
+        '''Return the stack after the instructions of block,
+        before the terminator is applied
+        '''
+        stack = list(entry)
+        pop = stack.pop
+        push = stack.append
+        for instr in block.instructions:
+            op = instr.opcode
+            if 0x60 <= op <= 0x7f:
+                push(instr.operand_interpretation)
+            elif 0x80 <= op <= 0x8f:
+                n = op - 0x7f
+                push(stack[-n] if len(stack) >= n else None)
+            elif 0x90 <= op <= 0x9f:
+                n = op - 0x8e
+                while len(stack) < n:
+                    stack.insert(0, None)
+                stack[-1], stack[-n] = stack[-n], stack[-1]
+            elif op == JUMP or op == JUMPI:
+                break
+            elif op == 0x58:
+                # PC
+                push(instr.offset)
+            else:
+                args = [pop() if stack else None for _ in range(instr.pops)]
+                fold = FOLDED_OPERATIONS.get(op)
+                if fold is not None and None not in args:
+                    push(fold(*args))
+                else:
+                    stack.extend([None] * instr.pushes)
+        return stack
+
+    def successors(self, block, entry):
+        '''Yield (target offset or None if unknown, edge type, stack)
+        for the successors of block entered with the stack entry
+        '''
+        stack = self.interpret(block, entry)
+        last = block.end_instr
+        fallthrough = last.offset_end + 1
+
+        if last.opcode == JUMP or last.opcode == JUMPI:
+            target = stack.pop() if stack else None
+            if last.opcode == JUMPI and stack:
+                stack.pop()
+            if target is None or target in self.jumpdests:
+                edge_type = EDGE_UNCONDITIONAL if last.opcode == JUMP \
+                    else EDGE_CONDITIONAL_TRUE
+                yield target, edge_type, stack
+            else:
+                logging.info('[X] Bad JUMP to 0x%x', target)
+            if last.opcode == JUMPI and fallthrough in self.blocks:
+                yield fallthrough, EDGE_CONDITIONAL_FALSE, stack
+        elif not last.is_halt and fallthrough in self.blocks:
+            yield fallthrough, EDGE_FALLTHROUGH, stack
+
+
+# return addresses of a shared internal function, far more than
+# MAX_STATES_PER_BLOCK: the callers of a function are not bounded by the
+# number of stacks CFGRecovery interprets per block
+MAX_VALUES = 1024
+
+
+def _join(a, b, max_values):
+    '''Union of two value sets, None (any value) above max_values'''
+    if a is None or b is None:
+        return None
+    union = a | b
+    return union if len(union) <= max_values else None
+
+
+class ValueSetAnalysis(CFGRecovery):
+    '''
+    Value-set analysis of the stack
+
+    Stack values are sets of constants or None (any value). Instead of
+    one state per distinct entry stack, the entry stacks of a block with
+    the same height (the stack shape) are joined, so each
+    (block, height) state is memoized and only interpreted again when
+    one of its sets grows. Return addresses pushed by every caller of an
+    internal function reach its final JUMP as one set, that gives every
+    return edge.
+
+    Sets above max_values and results of operations on more than
+    max_values combinations are widened to None. The jumps
+    left with an unknown target are then taken from CFGRecovery, whose
+    graph is merged, so the result is never smaller than its own.
+    '''
+
+    def __init__(self, instructions, basicblocks=None,
+                 max_states=MAX_STATES_PER_BLOCK, max_values=MAX_VALUES):
+        CFGRecovery.__init__(self, instructions, basicblocks, max_states)
+        self.max_values = max_values
+        # jump offset: set of resolved targets
+        self.targets = dict()
+
+    def run(self):
+        '''Return (reachable basic blocks sorted by offset, edges)'''
+        if not self.instructions:
+            return list(), list()
+        edges = dict()
+        # offset: {height: entry stack}
+        entries = dict()
+        worklist = deque()
+        queued = set()
+
+        def schedule(offset, stack):
+            entry = tuple(self._abstract(v) for v in stack)
+            shapes = entries.setdefault(offset, dict())
+            previous = shapes.get(len(entry))
+            if previous is None:
+                if len(shapes) >= self.max_states:
+                    self._give_up(offset)
+                    return
+            else:
+                entry = tuple(_join(a, b, self.max_values)
+                              for a, b in zip(previous, entry))
+                if entry == previous:
+                    return
+            shapes[len(entry)] = entry
+            key = (offset, len(entry))
+            if key not in queued:
+                queued.add(key)
+                worklist.append(key)
+
+        schedule(self.instructions[0].offset, ())
+        while worklist:
+            key = worklist.popleft()
+            queued.discard(key)
+            offset, height = key
+            self.states += 1
+            block = self.blocks[offset]
+            for target, edge_type, stack in self.successors(
+                    block, entries[offset][height]):
+                if target is None:
+                    self.unresolved.add(block.end_instr.offset)
+                    continue
+                edge = Edge(offset, target, edge_type)
+                edges.setdefault(edge, None)
+                schedule(target, stack)
+
+        reachable = set(entries)
+        if self.unresolved:
+            self._fallback(reachable, edges)
+        self.edges = list(edges)
+        return [self.blocks[offset] for offset in sorted(reachable)], \
+            self.edges
+
+    def _fallback(self, reachable, edges):
+        '''Merge the CFGRecovery graph, where one entry stack per caller
+        may still know the targets of the widened jumps
+        '''
+        recovery = CFGRecovery(self.instructions, self.blocks.values(),
+                               self.max_states)
+        blocks, recovered = recovery.run()
+        unresolved = {offset for offset in self.unresolved
+                      if offset in recovery.unresolved}
+        for bb in blocks:
+            last = bb.end_instr.offset
+            if bb.start_offset not in reachable and \
+                    last in recovery.unresolved:
+                unresolved.add(last)
+            reachable.add(bb.start_offset)
+        for edge in recovered:
+            edges.setdefault(edge, None)
+            last = self.blocks[edge.node_from].end_instr
+            if edge.type in (EDGE_UNCONDITIONAL, EDGE_CONDITIONAL_TRUE) and \
+                    (last.opcode == JUMP or last.opcode == JUMPI):
+                self.targets.setdefault(last.offset, set()).add(edge.node_to)
+        self.unresolved = unresolved
+
+    def _abstract(self, values):
+        '''Only JUMPDEST offsets are kept between blocks'''
+        if values is None:
+            return None
+        values = values & self.jumpdests
+        return values if values else None
+
+    def interpret(self, block, entry):
+        stack = list(entry)
+        pop = stack.pop
+        push = stack.append
+        for instr in block.instructions:
+            op = instr.opcode
+            if 0x60 <= op <= 0x7f:
+                push(frozenset((instr.operand_interpretation,)))
+            elif 0x80 <= op <= 0x8f:
+                n = op - 0x7f
+                push(stack[-n] if len(stack) >= n else None)
+            elif 0x90 <= op <= 0x9f:
+                n = op - 0x8e
+                while len(stack) < n:
+                    stack.insert(0, None)
+                stack[-1], stack[-n] = stack[-n], stack[-1]
+            elif op == JUMP or op == JUMPI:
+                break
+            elif op == 0x58:
+                # PC
+                push(frozenset((instr.offset,)))
+            else:
+                args = [pop() if stack else None for _ in range(instr.pops)]
+                push_many = self._fold(op, args)
+                if push_many is not None:
+                    push(push_many)
+                else:
+                    stack.extend([None] * instr.pushes)
+        return stack
+
+    def _fold(self, op, args):
+        fold = FOLDED_OPERATIONS.get(op)
+        if fold is None or None in args:
+            return None
+        combinations = 1
+        for values in args:
+            combinations *= len(values)
+        if combinations > self.max_values:
+            return None
+        return frozenset(fold(*values) for values in product(*args))
+
+    def successors(self, block, entry):
+        '''Yield (target offset or None if unknown, edge type, stack)
+        for the successors of block entered with the stack entry
+        '''
+        stack = self.interpret(block, entry)
+        last = block.end_instr
+        fallthrough = last.offset_end + 1
+
+        if last.opcode == JUMP or last.opcode == JUMPI:
+            targets = stack.pop() if stack else None
+            if last.opcode == JUMPI and stack:
+                stack.pop()
+            edge_type = EDGE_UNCONDITIONAL if last.opcode == JUMP \
+                else EDGE_CONDITIONAL_TRUE
+            if targets is None:
+                yield None, edge_type, stack
+            else:
+                for target in sorted(targets):
+                    if target in self.jumpdests:
+                        self.targets.setdefault(last.offset,
+                                                set()).add(target)
+                        yield target, edge_type, stack
+                    else:
+                        logging.info('[X] Bad JUMP to 0x%x', target)
+            if last.opcode == JUMPI and fallthrough in self.blocks:
+                yield fallthrough, EDGE_CONDITIONAL_FALSE, stack
+        elif not last.is_halt and fallthrough in self.blocks:
+            yield fallthrough, EDGE_FALLTHROUGH, stack
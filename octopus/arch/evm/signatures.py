@@ -0,0 +1,298 @@
+'''
+Compiled function signature database
+
+    python -m octopus.arch.evm.signatures -o signatures.db 4byte.json ...
+
+    db = SignatureDatabase.open('signatures.db')   # mmap, nothing decoded
+    db.lookup(0xa9059cbb)                          # 'transfer(address,uint256)'
+    db.lookup_many([0xa9059cbb, 0x095ea7b3])
+
+File layout (little-endian): header, then every section padded to 8 bytes
+
+    selectors   u4 * count        sorted selectors
+    offsets     u4 * (count + 1)  names of selectors[i] are
+                                  strings[offsets[i]:offsets[i + 1]]
+    strings     utf-8             names of one selector separated by '\\n'
+
+Lookups are a binary search over the selectors section.
+find_signature (octopus.arch.evm.cfg) uses default_database(): the
+signatures.db file next to this module if it exists, signatures.txt
+compiled in memory otherwise, loaded once per process.
+
+Inputs of the build tool are JSON ({"0xselector": "name"} as
+signatures.txt, or a list of {"hex_signature", "text_signature"} objects)
+or text files, one "0xselector<separator>name" or "name" per line.
+'''
+
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+SIGNATURE_MAGIC = b'OSIG'
+SIGNATURE_VERSION = 1
+
+_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+SIGNATURE_DB_PATH = os.path.join(_DIRECTORY, 'signatures.db')
+SIGNATURE_JSON_PATH = os.path.join(_DIRECTORY, 'signatures.txt')
+
+# magic, version, count, strings size
+_HEADER = struct.Struct('<4sHxxII')
+_ALIGN = 8
+_SEPARATOR = '\n'
+_LINE = re.compile(r'^(0x[0-9a-fA-F]{8})[\s,;:]+(\S.*)$')
+
+
+class SignatureFormatException(Exception):
+    """Exception raised when a signature database can not be decoded"""
+    pass
+
+
+def _padding(size):
+    return -size % _ALIGN
+
+
+def _column_bytes(column):
+    if sys.byteorder != 'little':
+        column = array('I', column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column_view(buf):
+    if sys.byteorder == 'little':
+        return buf.cast('I')
+    column = array('I', buf.tobytes())
+    column.byteswap()
+    return column
+
+
+class SignatureDatabase(object):
+    '''Sorted selectors and their names, see the module documentation'''
+
+    def __init__(self, selectors, offsets, strings, buf=None):
+        self.selectors = selectors
+        self.offsets = offsets
+        self.strings = strings
+        self._buf = buf
+
+    def __len__(self):
+        return len(self.selectors)
+
+    def __contains__(self, selector):
+        return self._index(selector) is not None
+
+    def _index(self, selector):
+        index = bisect_left(self.selectors, selector)
+        if index < len(self.selectors) and self.selectors[index] == selector:
+            return index
+        return None
+
+    def names(self, selector):
+        '''Return every known name of selector (int)'''
+        index = self._index(selector)
+        if index is None:
+            return list()
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.strings[start:end]).decode('utf-8').split(
+            _SEPARATOR)
+
+    def lookup(self, selector):
+        '''Return the first name of selector (int) or None'''
+        names = self.names(selector)
+        return names[0] if names else None
+
+    def lookup_many(self, selectors):
+        '''Return {selector: name or None} for every selector'''
+        return {selector: self.lookup(selector) for selector in selectors}
+
+    # ==============================
+    # #     serialization          #
+    # ==============================
+
+    @classmethod
+    def from_entries(cls, entries):
+        '''Build the database of entries, an iterable of
+        (selector int, name), in memory
+        '''
+        return cls.loads(build_database(entries))
+
+    @classmethod
+    def loads(cls, buf):
+        '''Database over buf (bytes, mmap...) without copying'''
+        view = memoryview(buf)
+        if len(view) < _HEADER.size:
+            raise SignatureFormatException('truncated header')
+        magic, version, count, strings_size = _HEADER.unpack_from(view)
+        if magic != SIGNATURE_MAGIC:
+            raise SignatureFormatException('bad magic %r' % magic)
+        if version != SIGNATURE_VERSION:
+            raise SignatureFormatException('unsupported version %d'
+                                           % version)
+
+        sections = list()
+        pos = _HEADER.size + _padding(_HEADER.size)
+        for size in (count * 4, (count + 1) * 4, strings_size):
+            if pos + size > len(view):
+                raise SignatureFormatException('truncated database')
+            sections.append(view[pos:pos + size])
+            pos += size + _padding(size)
+        selectors, offsets, strings = sections
+        return cls(_column_view(selectors), _column_view(offsets), strings,
+                   buf=buf)
+
+    @classmethod
+    def open(cls, path):
+        '''Memory-map the database file located at path'''
+        with open(path, 'rb') as f:
+            return cls.loads(mmap.mmap(f.fileno(), 0,
+                                       access=mmap.ACCESS_READ))
+
+
+def build_database(entries):
+    '''Return the binary form of the database of entries,
+    an iterable of (selector int, name). Duplicated names are dropped,
+    the names of a selector keep their input order.
+    '''
+    names = dict()
+    for selector, name in entries:
+        name = name.strip()
+        if not name or _SEPARATOR in name:
+            continue
+        known = names.setdefault(selector & 0xffffffff, list())
+        if name not in known:
+            known.append(name)
+
+    selectors = array('I', sorted(names))
+    offsets = array('I', [0])
+    strings = list()
+    size = 0
+    for selector in selectors:
+        data = _SEPARATOR.join(names[selector]).encode('utf-8')
+        strings.append(data)
+        size += len(data)
+        offsets.append(size)
+
+    chunks = [_HEADER.pack(SIGNATURE_MAGIC, SIGNATURE_VERSION,
+                           len(selectors), size),
+              bytes(_padding(_HEADER.size))]
+    for section in (_column_bytes(selectors), _column_bytes(offsets),
+                    b''.join(strings)):
+        chunks.append(section)
+        chunks.append(bytes(_padding(len(section))))
+    return b''.join(chunks)
+
+
+def write_database(entries, path):
+    '''Build the database of entries and save it at path'''
+    data = build_database(entries)
+    # atomic, the database may be mapped by other processes
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+# ==============================
+# #     importers              #
+# ==============================
+
+def selector_of(name):
+    '''Selector (int) of a text signature'''
+    from eth_hash.auto import keccak
+
+    return int.from_bytes(keccak(name.encode('utf-8'))[:4], 'big')
+
+
+def iter_json(fp):
+    '''Yield (selector, name) from a JSON signature file'''
+    data = json.load(fp)
+    if isinstance(data, dict):
+        # 4byte.directory API pages
+        data = data.get('results', data)
+    if isinstance(data, dict):
+        for selector, names in data.items():
+            if isinstance(names, str):
+                names = [names]
+            for name in names:
+                yield int(selector, 16), name
+    else:
+        for obj in data:
+            name = obj['text_signature']
+            selector = obj.get('hex_signature')
+            yield (int(selector, 16) if selector else selector_of(name)), \
+                name
+
+
+def iter_text(fp):
+    '''Yield (selector, name) from fp, one "0xselector name" or "name"
+    per line, the selector of a name alone is computed
+    '''
+    for line in fp:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        match = _LINE.match(line)
+        if match:
+            yield int(match.group(1), 16), match.group(2)
+        else:
+            yield selector_of(line), line
+
+
+def iter_file(path):
+    '''Yield (selector, name) from a JSON or text signature file'''
+    with open(path, encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first in ('{', '['):
+            yield from iter_json(f)
+        else:
+            yield from iter_text(f)
+
+
+_default = None
+
+
+def default_database():
+    '''Database used by find_signature, loaded once'''
+    global _default
+    if _default is None:
+        if os.path.exists(SIGNATURE_DB_PATH):
+            _default = SignatureDatabase.open(SIGNATURE_DB_PATH)
+        else:
+            _default = SignatureDatabase.from_entries(
+                iter_file(SIGNATURE_JSON_PATH))
+    return _default
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compile signature dumps into a signature database')
+    parser.add_argument('inputs', nargs='*',
+                        help='JSON or text signature files '
+                             '(default: signatures.txt)')
+    parser.add_argument('-o', '--output', default=SIGNATURE_DB_PATH)
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs or [SIGNATURE_JSON_PATH]
+    entries = (entry for path in inputs for entry in iter_file(path))
+    size = write_database(entries, args.output)
+    db = SignatureDatabase.open(args.output)
+    sys.stderr.write('%d selectors, %d bytes written to %s\n'
+                     % (len(db), size, args.output))
+
+
+if __name__ == '__main__':
+    main()
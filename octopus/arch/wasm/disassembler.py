@@ -87,29 +87,43 @@ class WasmDisassembler(Disassembler):
 
         return super().disassemble(bytecode, offset, r_format)
 
-    def extract_functions_code(self, module_bytecode):
-        functions = list()
+    def iter_functions_code(self, module_bytecode):
+        '''Yield the code (bytes) of every function of the module'''
         mod_iter = iter(decode_module(module_bytecode))
         _, _ = next(mod_iter)
-        sections = list(mod_iter)
 
         # iterate over all section
-        #code_data = [cur_sec_data for cur_sec, cur_sec_data in sections if isinstance(cur_sec_data.get_decoder_meta()['types']['payload'], CodeSection)][0]
-        for cur_sec, cur_sec_data in sections:
+        for cur_sec, cur_sec_data in mod_iter:
             sec = cur_sec_data.get_decoder_meta()['types']['payload']
             if isinstance(sec, CodeSection):
-                code_data = cur_sec_data
-                break
-        if not code_data:
-            raise ValueError('No functions/codes in the module')
-        for idx, func in enumerate(code_data.payload.bodies):
-            instructions = self.disassemble(func.code.tobytes())
+                for func in cur_sec_data.payload.bodies:
+                    yield func.code.tobytes()
+                return
+        raise ValueError('No functions/codes in the module')
+
+    def extract_functions_code(self, module_bytecode):
+        functions = list()
+        for code in self.iter_functions_code(module_bytecode):
+            instructions = self.disassemble(code)
             cur_function = Function(0, instructions[0])
             cur_function.instructions = instructions
 
             functions.append(cur_function)
         return functions
 
+    def write_module(self, fp, module_bytecode, offset=0, offsets=False):
+        '''Write the text disassembly of every function of the module
+        to fp while decoding, same format as disassemble_module(r_format='text')
+        return the number of instructions written
+        '''
+        bytecode = bytecode_to_bytes(module_bytecode)
+        count = 0
+        for index, code in enumerate(self.iter_functions_code(bytecode[offset:])):
+            fp.write('func %d\n' % index)
+            count += self.write(fp, code, offsets=offsets, annotate=False)
+            fp.write('\n')
+        return count
+
     def disassemble_module(self, module_bytecode=None, offset=0, r_format='list'):
 
         bytecode = bytecode_to_bytes(module_bytecode)
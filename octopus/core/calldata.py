@@ -0,0 +1,37 @@
+class Calldata(object):
+    """Read-only view of the input data of a call
+
+    Reads past the end return zeros, like the EVM.
+    Slices are memoryviews over the original buffer (no copy).
+    """
+    def __init__(self, data=None):
+        if isinstance(data, Calldata):
+            data = data.data
+        self.data = memoryview(data if data is not None else b'')
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __bytes__(self):
+        return self.data.tobytes()
+
+    def __reduce__(self):
+        # memoryview can not be pickled nor deep copied
+        return (Calldata, (self.data.tobytes(),))
+
+    def load(self, p):
+        '''32 bytes word at p, zero padded'''
+        word = self.data[p:p+0x20]
+        v = int.from_bytes(word, byteorder="big")
+        if len(word) < 0x20:
+            v <<= 8 * (0x20 - len(word))
+        return v
+
+    def copy_to(self, memory, dest, p, size):
+        '''Copy size bytes at p into memory at dest, zero padded'''
+        if not size:
+            return
+        memory.mwrite(dest, self.data[p:p+size], size)
@@ -1,12 +1,15 @@
 class Function(object):
 
     def __init__(self, start_offset, start_instr=None,
-                 name='func_default_name', prefered_name=None):
+                 name='func_default_name', prefered_name=None,
+                 selector=None):
         # parameters
         self.start_offset = start_offset
         self.start_instr = start_instr
         self.name = name
         self.prefered_name = prefered_name if prefered_name else name
+        # 4 bytes function identifier (evm) if any
+        self.selector = selector
         self.size = 0
         self.end_offset = None
         self.end_instr = None
@@ -1,5 +1,9 @@
 class Instruction(object):
     """Instruction """
+
+    # subclasses may declare __slots__
+    __slots__ = ()
+
     def __init__(self, opcode, name,
                  operand_size, pops, pushes, fee,
                  description, operand=None,
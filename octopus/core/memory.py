@@ -9,13 +9,34 @@ class  Memory(bytearray):
         self[p:p+0x20] = (v).to_bytes(32, byteorder="big")
 
     def mstore8(self,p,v):
-        if len(self) < p:
-            self.mextend(p)
-        self[p:p] = (v).to_bytes(1, byteorder="big")
+        if len(self) < p+1:
+            self.mextend(p+1)
+        self[p] = v & 0xff
+
+    def mwrite(self, p, data, size):
+        '''write data (any buffer) at p, zero padded to size bytes'''
+        if len(self) < p+size:
+            self.mextend(p+size)
+        n = min(len(data), size)
+        self[p:p+n] = data[:n]
+        if n < size:
+            self[p+n:p+size] = bytes(size-n)
 
     def mload(self,p):
-        v = int(self[p:p+0x20].hex(),16)
+        if len(self) < p+0x20:
+            self.mextend(p+0x20)
+        v = int.from_bytes(self[p:p+0x20], byteorder="big")
         return v
 
+    def mread(self, p, size):
+        '''size bytes at p, memory is extended like the EVM does'''
+        if not size:
+            return b''
+        if len(self) < p+size:
+            self.mextend(p+size)
+        return bytes(self[p:p+size])
+
     def mextend(self,p):
-        self.extend(bytearray(p))
\ No newline at end of file
+        '''extend the memory up to p bytes'''
+        if len(self) < p:
+            self.extend(bytes(p-len(self)))
\ No newline at end of file
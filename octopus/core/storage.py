@@ -2,9 +2,19 @@ class  Storage(dict):
     """docstring for  Memory"""
     def __init__(self):
         super()
-        
+        # number of sstore per slot
+        self.versions = dict()
+        # callables notified with (slot, value) after each sstore
+        self.observers = list()
+
     def sstore(self, p, v):
         self[p] = v
+        self.versions[p] = self.versions.get(p, 0) + 1
+        for observer in self.observers:
+            observer(p, v)
+
+    def version(self, p):
+        return self.versions.get(p, 0)
 
     def sload(self, p):
         if not self.get(p):
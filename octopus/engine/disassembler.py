@@ -24,6 +24,51 @@ class Disassembler(object):
         """ Generic method to disassemble one instruction """
         raise NotImplementedError
 
+    def iter_instructions(self, bytecode=None, offset=0):
+        """Generic method to yield the instructions one by one
+
+        :param bytecode: bytecode sequence
+        :param offset: start offset
+        """
+        self.bytecode = bytecode if bytecode else self.bytecode
+        if not self.bytecode:
+            raise BytecodeEmptyException()
+
+        self.bytecode = bytecode_to_bytes(self.bytecode)
+
+        while offset < len(self.bytecode):
+            instr = self.disassemble_opcode(self.bytecode[offset:], offset)
+            offset += instr.size
+            yield instr
+
+    def annotator(self):
+        """Return a callable instruction -> list of label lines
+        written before the instruction by write, or None
+        """
+        return None
+
+    def write(self, fp, bytecode=None, offset=0, offsets=True,
+              annotate=True):
+        """Write the text disassembly to fp, one line per instruction,
+        while decoding: the instructions are never stored
+
+        :param fp: file object opened in text mode
+        :param offsets: prefix lines with the instruction offset
+        :param annotate: write the labels of annotator (function / block)
+        :return: number of instructions written
+        """
+        annotate = self.annotator() if annotate else None
+        count = 0
+        for instr in self.iter_instructions(bytecode, offset):
+            if annotate is not None:
+                for label in annotate(instr):
+                    fp.write(label + '\n')
+            if offsets:
+                fp.write('%8x: ' % instr.offset)
+            fp.write(str(instr) + '\n')
+            count += 1
+        return count
+
     def disassemble(self, bytecode=None, offset=0, r_format='list'):
         """Generic method to disassemble bytecode
 
@@ -38,17 +83,7 @@ class Disassembler(object):
         """
         # reinitialize class variable
         self.attributes_reset()
-
-        self.bytecode = bytecode if bytecode else self.bytecode
-        if not self.bytecode:
-            raise BytecodeEmptyException()
-
-        self.bytecode = bytecode_to_bytes(self.bytecode)
-
-        while offset < len(self.bytecode):
-            instr = self.disassemble_opcode(self.bytecode[offset:], offset)
-            offset += instr.size
-            self.instructions.append(instr)
+        self.instructions = list(self.iter_instructions(bytecode, offset))
 
         # fill reverse instructions
         self.reverse_instructions = {k: v for k, v in
@@ -0,0 +1,153 @@
+'''
+Optimistic parallel execution of an ordered batch of transactions
+
+    results = execute_batch([(bytecode, callinfo), ...], storage, workers=4)
+
+Every transaction is first executed speculatively in a worker process
+against a copy of the initial storage, recording the slots it reads and
+writes. Results are then validated in order: a transaction that read a
+slot written by an earlier transaction of the batch is executed again,
+sequentially, against a copy of the current storage.
+
+The final storage is the same as the one obtained by calling emulate for
+each transaction in order, as long as no transaction raises an exception.
+A transaction raising an exception (e.g. a stack underflow) is not
+committed: its result records the error and none of its SSTOREs are
+applied, where a sequential emulate would leave the writes done before
+the exception in the storage.
+'''
+
+import multiprocessing
+import os
+
+from octopus.core.storage import Storage
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.rwset import ReadWriteSet
+from octopus.platforms.ETH.snapshot import dumps_storage, loads_storage
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+class TransactionResult(object):
+    '''Outcome of one transaction of a batch'''
+
+    def __init__(self, index, status=None, return_data=b'', rw_set=None,
+                 touched=None, error=None):
+        self.index = index
+        # name of the last executed instruction (RETURN, STOP, REVERT...)
+        self.status = status
+        self.return_data = return_data
+        self.rw_set = rw_set
+        # final value of every slot read or written by the transaction
+        self.touched = touched or dict()
+        self.error = error
+        self.reexecuted = False
+
+    @classmethod
+    def from_state(cls, index, state):
+        touched = {slot: state.storage[slot] for slot in
+                   state.storage_reads | state.storage_writes}
+        return cls(index, status=state.instr.name if state.instr else None,
+                   return_data=bytes(state.last_returned),
+                   rw_set=state.rw_set or ReadWriteSet.from_state(state),
+                   touched=touched)
+
+
+class _Engines(dict):
+    '''bytecode -> engine, built on first use'''
+
+    def __missing__(self, bytecode):
+        engine = EthereumSSAEngine(bytecode, verbose=False)
+        self[bytecode] = engine
+        return engine
+
+
+def _run(engines, bytecode, callinfo, storage):
+    engine = engines[bytecode]
+    # the engine keeps every state otherwise
+    engine.states = dict()
+    engine.states_total = 0
+    state = EthereumVMstate()
+    state.storage = storage
+    return engine.emulate(callinfo, state)
+
+
+# per process globals of the speculative workers
+_worker_storage = None
+_worker_engines = None
+
+
+def _init_worker(storage_data):
+    global _worker_storage, _worker_engines
+    _worker_storage = loads_storage(storage_data)
+    _worker_engines = _Engines()
+
+
+def _execute(engines, index, bytecode, callinfo, storage):
+    '''TransactionResult of the transaction run on a copy of storage,
+    storage itself is never modified
+    '''
+    scratch = Storage()
+    scratch.update(storage)
+    try:
+        state = _run(engines, bytecode, callinfo, scratch)
+    except Exception as e:
+        return TransactionResult(index, error='%s: %s' % (type(e).__name__, e))
+    return TransactionResult.from_state(index, state)
+
+
+def _speculate(task):
+    index, bytecode, callinfo = task
+    return _execute(_worker_engines, index, bytecode, callinfo,
+                    _worker_storage)
+
+
+def _commit(result, storage):
+    '''Apply the effects of a validated speculative result'''
+    writes = result.rw_set.storage_writes
+    for slot, value in result.touched.items():
+        if slot in writes:
+            storage.sstore(slot, value)
+        else:
+            # SLOAD of a missing slot store a 0
+            storage.setdefault(slot, value)
+
+
+def execute_batch(transactions, storage, workers=None, chunksize=16):
+    '''Execute transactions, a list of (bytecode, callinfo), against
+    storage (modified in place). Return the list of TransactionResult.
+    '''
+    workers = workers or os.cpu_count() or 1
+    tasks = [(index, bytecode, callinfo) for index, (bytecode, callinfo)
+             in enumerate(transactions)]
+
+    storage_data = dumps_storage(storage)
+    if workers == 1:
+        _init_worker(storage_data)
+        speculative = [_speculate(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(storage_data,)) as pool:
+            speculative = pool.map(_speculate, tasks, chunksize=chunksize)
+
+    # validation, in order
+    engines = _Engines()
+    written = set()
+    results = list()
+    for (index, bytecode, callinfo), result in zip(tasks, speculative):
+        if result.error is not None or \
+                any(slot in written for slot in result.rw_set.storage_reads):
+            logging.info('[+] re-execute transaction %d', index)
+            result = _execute(engines, index, bytecode, callinfo, storage)
+            result.reexecuted = True
+        if result.error is None:
+            _commit(result, storage)
+            written.update(result.rw_set.storage_writes)
+        else:
+            # a failing transaction leaves the storage unchanged
+            logging.info('[X] transaction %d failed: %s', index, result.error)
+        results.append(result)
+
+    return results
@@ -0,0 +1,158 @@
+'''
+Memoized results of calls without side effects (pure & view calls)
+
+    engine.result_cache = CallResultCache(maxsize=4096)
+    engine.emulate(callinfo, state)   # executed
+    engine.emulate(callinfo, state)   # cached
+
+A result is reused when the code hash, calldata, callvalue and gas are the
+same and the storage slots read by the call hold the same values, whatever
+the Storage object: a modified slot never matches the old entries, which
+are evicted by the LRU.
+
+Cached states are shared between hits and must be treated as read-only.
+Tracers and coverage are not notified on a hit.
+
+ViewMonitor only re-evaluates the calls depending on the modified slots.
+'''
+
+from collections import OrderedDict
+
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+class CallResultCache(object):
+    '''Bounded LRU cache of final states'''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        # full key -> final state
+        self.entries = OrderedDict()
+        # call key -> {tuple of storage slots read: number of entries}
+        self.read_sets = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def call_key(code_hash, callinfo):
+        calldata = callinfo.get('calldata')
+        if calldata is not None:
+            calldata = bytes(calldata)
+        return (code_hash, calldata, callinfo.get('callvalue'),
+                callinfo.get('gas'))
+
+    @staticmethod
+    def _values(slots, storage):
+        # not sload, a missing slot must not be created
+        return tuple(storage.get(slot, 0) for slot in slots)
+
+    def lookup(self, code_hash, callinfo, storage):
+        '''Return the cached final state or None'''
+        call_key = self.call_key(code_hash, callinfo)
+        for slots in self.read_sets.get(call_key, ()):
+            key = (call_key, slots, self._values(slots, storage))
+            state = self.entries.get(key)
+            if state is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return state
+        self.misses += 1
+        return None
+
+    def store(self, code_hash, callinfo, state):
+        '''Save the final state of a call without side effects'''
+        call_key = self.call_key(code_hash, callinfo)
+        slots = tuple(sorted(state.storage_reads))
+        key = (call_key, slots, self._values(slots, state.storage))
+
+        if key not in self.entries:
+            read_sets = self.read_sets.setdefault(call_key, dict())
+            read_sets[slots] = read_sets.get(slots, 0) + 1
+        self.entries[key] = state
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self._forget(self.entries.popitem(last=False)[0])
+
+    def _forget(self, key):
+        call_key, slots, _ = key
+        # forget the read set once no entry uses it anymore
+        read_sets = self.read_sets[call_key]
+        read_sets[slots] -= 1
+        if not read_sets[slots]:
+            del read_sets[slots]
+            if not read_sets:
+                del self.read_sets[call_key]
+
+    def clear(self):
+        self.entries.clear()
+        self.read_sets.clear()
+
+
+class ViewMonitor(object):
+    '''Keep the results of a fixed set of calls up to date
+
+        monitor = ViewMonitor(storage)
+        monitor.add(engine, callinfo)
+        monitor.refresh()       # evaluate everything
+        storage.sstore(slot, value)
+        monitor.refresh()       # only the calls that read slot
+    '''
+
+    def __init__(self, storage):
+        self.storage = storage
+        # (engine, callinfo) per call index
+        self.calls = list()
+        # final state per call index
+        self.results = list()
+        # storage slot -> call indexes reading it
+        self.readers = dict()
+        self.dirty = set()
+        # index of the call being evaluated
+        self.evaluating = None
+        storage.observers.append(self.on_sstore)
+
+    def add(self, engine, callinfo):
+        '''Register a call, return its index'''
+        self.calls.append((engine, callinfo))
+        self.results.append(None)
+        index = len(self.calls) - 1
+        self.dirty.add(index)
+        return index
+
+    def on_sstore(self, slot, value):
+        # the writes of a call do not make its own result stale
+        self.dirty.update(index for index in self.readers.get(slot, ())
+                          if index != self.evaluating)
+
+    def _evaluate(self, index):
+        engine, callinfo = self.calls[index]
+        state = EthereumVMstate()
+        state.storage = self.storage
+        self.evaluating = index
+        try:
+            result = engine.emulate(callinfo, state)
+        finally:
+            self.evaluating = None
+
+        previous = self.results[index]
+        if previous is not None:
+            for slot in previous.storage_reads:
+                readers = self.readers.get(slot)
+                if readers is not None:
+                    readers.discard(index)
+        for slot in result.storage_reads:
+            self.readers.setdefault(slot, set()).add(index)
+        self.results[index] = result
+
+    def refresh(self):
+        '''Re-evaluate the calls depending on the modified slots,
+        return their indexes
+        '''
+        dirty, self.dirty = sorted(self.dirty), set()
+        for index in dirty:
+            self._evaluate(index)
+        return dirty
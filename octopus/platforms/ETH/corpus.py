@@ -0,0 +1,232 @@
+'''
+Bulk disassembly and static analysis of a corpus of contracts
+
+    python -m octopus.platforms.ETH.corpus contracts/ -o out.jsonl
+    python -m octopus.platforms.ETH.corpus contracts.jsonl -w 8
+    cat codes.txt | python -m octopus.platforms.ETH.corpus - > out.jsonl
+
+Inputs are a directory (one bytecode per file, hex or raw), a JSONL file
+(one object per line with a bytecode field) or stdin (hex bytecode or JSON
+object per line). Contracts are deduplicated by keccak code hash, only the
+first occurrence is analyzed with EvmCFG in the process pool; the others
+are written as duplicate records as soon as they are read. The input is
+read as the pool progresses, it is never loaded at once.
+
+Output, one JSON object per line:
+
+    {"name", "code_hash", "size", "instructions", "basicblocks",
+     "functions": [{"name", "selector", "offset"}], "creation_code",
+     "swarm_hash", "metadata", "constructor_args",
+     ["disassembly"] or "error"}
+    {"name", "code_hash", "duplicate_of"}
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+
+from eth_hash.auto import keccak
+
+from octopus.arch.evm.cfg import EvmCFG
+from octopus.core.utils import bytecode_to_bytes
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+BYTECODE_FIELDS = ('bytecode', 'code', 'runtime_bytecode')
+NAME_FIELDS = ('address', 'name', 'id')
+
+
+def _code_bytes(data):
+    '''bytes of a hex (str or bytes) or raw bytecode'''
+    if isinstance(data, str):
+        return bytes(bytecode_to_bytes(data.strip()))
+    text = data.strip()
+    try:
+        return bytes(bytecode_to_bytes(text.decode('ascii')))
+    except (UnicodeDecodeError, ValueError):
+        return bytes(data)
+
+
+def _from_object(obj, index, field=None):
+    fields = (field,) if field else BYTECODE_FIELDS
+    code = next((obj[f] for f in fields if obj.get(f)), None)
+    if code is None:
+        raise ValueError('no bytecode field in line %d' % index)
+    if not isinstance(code, str):
+        raise ValueError('bytecode of line %d is not a string' % index)
+    name = next((str(obj[f]) for f in NAME_FIELDS if obj.get(f)),
+                str(index))
+    return name, _code_bytes(code)
+
+
+def iter_directory(path):
+    '''Yield (file name, code) for every file of path'''
+    for name in sorted(os.listdir(path)):
+        filename = os.path.join(path, name)
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                yield name, _code_bytes(f.read())
+
+
+def iter_lines(fp, field=None):
+    '''Yield (name, code) from fp, one JSON object or hex bytecode per line.
+    Names are taken from NAME_FIELDS, or the line number.
+    '''
+    for index, line in enumerate(fp):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith('{'):
+                yield _from_object(json.loads(line), index, field)
+            else:
+                yield str(index), _code_bytes(line)
+        except ValueError as e:
+            logging.warning('[-] skip line %d: %s', index, e)
+
+
+def iter_source(source, field=None):
+    '''Yield (name, code) from a directory, a JSONL file or '-' (stdin)'''
+    if source == '-':
+        yield from iter_lines(sys.stdin, field)
+    elif os.path.isdir(source):
+        yield from iter_directory(source)
+    else:
+        with open(source) as f:
+            yield from iter_lines(f, field)
+
+
+def analyze_contract(code, disassembly=False):
+    '''Return the analysis record of code (bytes)'''
+    cfg = EvmCFG(code, analysis='static')
+    record = {'size': len(code),
+              'instructions': len(cfg.instructions),
+              'basicblocks': len(cfg.basicblocks),
+              'functions': [{'name': f.prefered_name,
+                             'selector': '%08x' % f.selector
+                             if f.selector is not None else None,
+                             'offset': f.start_offset}
+                            for f in cfg.functions],
+              'creation_code': cfg.disasm.loader_code is not None,
+              'swarm_hash': cfg.disasm.swarm_hash.hex()
+              if cfg.disasm.swarm_hash else None,
+              'metadata': cfg.disasm.metadata.as_dict()
+              if cfg.disasm.metadata else None,
+              'constructor_args': cfg.disasm.constructor_args.hex()}
+    if disassembly:
+        record['disassembly'] = '\n'.join('%d %s' % (i.offset, i)
+                                          for i in cfg.instructions)
+    return record
+
+
+def _analyze(task):
+    name, code_hash, code, disassembly = task
+    record = {'name': name, 'code_hash': code_hash}
+    try:
+        record.update(analyze_contract(code, disassembly))
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    return record
+
+
+def process_corpus(contracts, out, workers=None, chunksize=8,
+                   disassembly=False):
+    '''Analyze the unique contracts of contracts, an iterable of
+    (name, code), write one JSON line per input to out.
+    Return the statistics.
+
+    contracts is read in the calling thread, at most workers * chunksize
+    contracts are waiting for the pool at any time.
+    '''
+    workers = workers or os.cpu_count() or 1
+    stats = dict.fromkeys(('inputs', 'unique', 'duplicates', 'errors'), 0)
+    first = dict()
+
+    def write(record):
+        out.write(json.dumps(record, sort_keys=True))
+        out.write('\n')
+
+    def written(record):
+        stats['unique'] += 1
+        if 'error' in record:
+            stats['errors'] += 1
+        write(record)
+
+    def tasks():
+        for name, code in contracts:
+            stats['inputs'] += 1
+            code_hash = keccak(code).hex()
+            if code_hash in first:
+                stats['duplicates'] += 1
+                write({'name': name, 'code_hash': code_hash,
+                       'duplicate_of': first[code_hash]})
+                continue
+            first[code_hash] = name
+            yield name, code_hash, code, disassembly
+
+    if workers == 1:
+        for task in tasks():
+            written(_analyze(task))
+        return stats
+
+    # records of the pool, put by its result handler thread
+    done = queue.Queue()
+    limit = workers * chunksize
+    pending = 0
+    with multiprocessing.Pool(workers) as pool:
+        for task in tasks():
+            while pending >= limit:
+                written(done.get())
+                pending -= 1
+            pool.apply_async(_analyze, (task,), callback=done.put,
+                             error_callback=_error_callback(task, done))
+            pending += 1
+        while pending:
+            written(done.get())
+            pending -= 1
+    return stats
+
+
+def _error_callback(task, done):
+    '''Put the error record of task in done if it can not be run'''
+    name, code_hash = task[:2]
+
+    def callback(e):
+        done.put({'name': name, 'code_hash': code_hash,
+                  'error': '%s: %s' % (type(e).__name__, e)})
+    return callback
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Disassemble and analyze a corpus of contracts')
+    parser.add_argument('source',
+                        help="directory, JSONL file or '-' for stdin")
+    parser.add_argument('-o', '--output', help='JSONL output (stdout)')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=8,
+                        help='contracts queued per worker')
+    parser.add_argument('--field', help='bytecode field of JSON objects')
+    parser.add_argument('--disassembly', action='store_true',
+                        help='include the text disassembly')
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        stats = process_corpus(iter_source(args.source, args.field), out,
+                               args.workers, args.chunksize,
+                               args.disassembly)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write('%(inputs)d contracts, %(unique)d unique, '
+                     '%(duplicates)d duplicates, %(errors)d errors\n' % stats)
+
+
+if __name__ == '__main__':
+    main()
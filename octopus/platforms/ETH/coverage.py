@@ -0,0 +1,101 @@
+'''
+Edge coverage bitmap (AFL style) for EthereumEmulatorEngine
+
+The engines only update the map when they enter a basic block, once per
+entry: at every JUMPDEST executed and at a JUMPI fallthrough which is not a
+JUMPDEST, so the per-instruction cost is zero.
+
+    engine.coverage = CoverageMap()
+    engine.emulate(callinfo, state)
+    new_edges = engine.coverage.diff(previous_map)
+'''
+
+MAP_SIZE = 1 << 16
+
+# hit counts -> AFL buckets (1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+)
+_BUCKETS = bytes(0 if n == 0 else
+                 1 if n == 1 else
+                 2 if n == 2 else
+                 4 if n == 3 else
+                 8 if n < 8 else
+                 16 if n < 16 else
+                 32 if n < 32 else
+                 64 if n < 128 else 128 for n in range(256))
+_HIT = bytes([0] + [1] * 255)
+
+
+def block_location(offset):
+    '''Spread block offsets over 32 bits (Knuth multiplicative hash)'''
+    return (offset * 2654435761) & 0xffffffff
+
+
+class CoverageMap(object):
+    '''Fixed size map of (previous block, current block) hit counters'''
+
+    def __init__(self, size=MAP_SIZE):
+        if size & (size - 1):
+            raise ValueError('coverage map size must be a power of 2')
+        self.size = size
+        self.mask = size - 1
+        self.bitmap = bytearray(size)
+        self.prev_location = 0
+
+    def start(self):
+        '''Reset the previous block at the beginning of an execution'''
+        self.prev_location = 0
+
+    def visit(self, offset):
+        '''Record the edge from the previous block to the block at offset'''
+        cur = block_location(offset)
+        index = (cur ^ self.prev_location) & self.mask
+        self.bitmap[index] = (self.bitmap[index] + 1) & 0xff
+        self.prev_location = cur >> 1
+
+    def clear(self):
+        self.bitmap[:] = bytes(self.size)
+        self.prev_location = 0
+
+    def copy(self):
+        new = CoverageMap(self.size)
+        new.bitmap[:] = self.bitmap
+        return new
+
+    def merge(self, other):
+        '''Add other hit counts to this map (saturate at 255)'''
+        bitmap = self.bitmap
+        for index, count in enumerate(other.bitmap):
+            if count:
+                bitmap[index] = min(bitmap[index] + count, 0xff)
+
+    def edges(self):
+        '''Return the indexes of all hit edges'''
+        return [i for i, count in enumerate(self.bitmap) if count]
+
+    def count(self):
+        '''Number of hit edges'''
+        return self.size - self.bitmap.count(0)
+
+    def classify(self):
+        '''Return the bitmap with hit counts replaced by AFL buckets'''
+        return bytes(self.bitmap).translate(_BUCKETS)
+
+    def diff(self, other):
+        '''Return the indexes of edges hit in this map but not in other'''
+        new = int.from_bytes(bytes(self.bitmap).translate(_HIT), 'big') & \
+            ~int.from_bytes(bytes(other.bitmap).translate(_HIT), 'big')
+        if not new:
+            return []
+        return [i for i, hit in
+                enumerate(new.to_bytes(self.size, 'big')) if hit]
+
+    def has_new_bits(self, virgin):
+        '''Compare the bucketed hit counts with virgin (a bytearray of
+        all the buckets seen so far), update it and return True if this
+        execution reached a new edge or a new hit count bucket
+        '''
+        cur = int.from_bytes(self.classify(), 'big')
+        seen = int.from_bytes(virgin, 'big')
+        if not cur & ~seen:
+            return False
+        virgin[:] = (cur | seen).to_bytes(self.size, 'big')
+        return True
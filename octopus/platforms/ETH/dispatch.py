@@ -0,0 +1,132 @@
+'''
+Solidity dispatcher shortcut
+
+The dispatcher extracts the selector from the calldata then compares it
+with every function identifier:
+
+    PUSH1 0x00 CALLDATALOAD ... DIV|SHR ...     prologue
+    PUSH4 sel DUP2 EQ PUSH2 dest JUMPI          (solc 0.4, first test)
+    DUP1 PUSH4 sel EQ PUSH2 dest JUMPI          following tests
+    ...
+
+Each test leaves the stack unchanged when its JUMPI is taken, so once the
+prologue is executed the engine can jump directly to the destination of
+the selector on top of the stack.
+'''
+
+from octopus.arch.evm.cfg import enum_func_static
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+# instructions allowed between CALLDATALOAD and the first test
+PROLOGUE_OPS = ('DIV', 'SHR', 'AND', 'SWAP1', 'DUP1', 'DUP2')
+
+
+def _match_test(instructions, index):
+    '''Return (selector, destination, length) if a selector test starts
+    at index, None otherwise
+    '''
+    window = instructions[index:index + 5]
+    names = [i.name for i in window]
+    if len(window) < 5 or names[2] != 'EQ' or names[4] != 'JUMPI' or \
+            names[3] not in ('PUSH1', 'PUSH2', 'PUSH3'):
+        return None
+    if names[0] == 'DUP1' and names[1] == 'PUSH4':
+        push4 = window[1]
+    elif names[0] == 'PUSH4' and names[1] == 'DUP2':
+        push4 = window[0]
+    else:
+        return None
+    return (push4.operand_interpretation,
+            window[3].operand_interpretation, 5)
+
+
+def _prologue_end(instructions):
+    '''Return the index of the first selector test if the prologue
+    matches a known pattern, None otherwise
+    '''
+    loads = [index for index, i in enumerate(instructions)
+             if i.name == 'CALLDATALOAD']
+    if not loads:
+        return None
+    index = loads[0]
+    # the selector is read at calldata offset 0
+    if index == 0 or not instructions[index - 1].name.startswith('PUSH') or \
+            instructions[index - 1].operand_interpretation:
+        return None
+
+    shifted = False
+    index += 1
+    while index < len(instructions):
+        if _match_test(instructions, index):
+            return index if shifted else None
+        instr = instructions[index]
+        if instr.name in ('DIV', 'SHR'):
+            shifted = True
+        elif instr.name not in PROLOGUE_OPS and not instr.name.startswith('PUSH'):
+            return None
+        index += 1
+    return None
+
+
+class DispatchTable(object):
+    '''selector -> function entry offset of a linear dispatcher'''
+
+    def __init__(self, head, head_offset, entries):
+        # index of the first selector test
+        self.head = head
+        self.head_offset = head_offset
+        self.entries = entries
+        self.hits = 0
+        self.misses = 0
+
+    def fast_entry(self, engine, state):
+        '''Called when the engine reaches the first selector test,
+        jump to the function if the selector on the stack is known.
+        Otherwise the dispatcher is executed normally.
+        '''
+        if not state._stack:
+            self.misses += 1
+            return False
+        entry = self.entries.get(state._stack[-1])
+        index = engine.offset_to_index.get(entry)
+        if index is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        state.pc = index
+        return True
+
+
+def build_dispatch_table(instructions):
+    '''Return a DispatchTable for instructions or None if the dispatcher
+    does not match a known pattern
+    '''
+    head = _prologue_end(instructions)
+    if head is None:
+        logging.info('[-] dispatcher prologue not recognized')
+        return None
+
+    functions = {f.start_offset: f for f in enum_func_static(instructions)
+                 if f.selector is not None}
+
+    # walk the chain of tests; only keep the ones confirmed by
+    # enum_func_static and jumping to a JUMPDEST
+    entries = dict()
+    index = head
+    match = _match_test(instructions, index)
+    while match:
+        selector, dest, length = match
+        function = functions.get(dest)
+        if function is None or function.selector != selector or \
+                function.start_instr.name != 'JUMPDEST':
+            break
+        entries.setdefault(selector, dest)
+        index += length
+        match = _match_test(instructions, index)
+
+    if not entries:
+        return None
+    return DispatchTable(head, instructions[head].offset, entries)
@@ -1,12 +1,21 @@
 from octopus.engine.emulator import EmulatorEngine
 from octopus.core.ssa import SSA, SSA_TYPE_FUNCTION, SSA_TYPE_CONSTANT
+from octopus.core.calldata import Calldata
+from octopus.arch.evm.instruction import (ARITHMETIC, COMPARISON_LOGIC, SHA3,
+                                          ENVIRONMENTAL, BLOCK_INFO,
+                                          STACK_MEMORY_STORAGE_FLOW, PUSH,
+                                          DUP, SWAP, LOG, SYSTEM)
 
 from octopus.platforms.ETH.vmstate import EthereumVMstate
+from octopus.platforms.ETH.constants import TT256M1
 
 from octopus.platforms.ETH.disassembler import EthereumDisassembler
+from octopus.platforms.ETH.dispatch import build_dispatch_table
+from octopus.platforms.ETH.rwset import ReadWriteSet
 from octopus.platforms.ETH.ssa import EthereumSSASimplifier
 
 from octopus.engine.helper import helper as hlp
+from octopus.core.utils import bytecode_to_bytes
 
 import copy
 
@@ -18,15 +27,19 @@ logging = getLogger(__name__)
 
 class EthereumEmulatorEngine(EmulatorEngine):
 
-    def __init__(self, bytecode, ssa=True, symbolic_exec=False, max_depth=20):
+    def __init__(self, bytecode, ssa=True, symbolic_exec=False, max_depth=20,
+                 verbose=True, fast_entry=False, code_map=None):
 
         self.ssa = ssa
         self.symbolic_exec = symbolic_exec
+        # print each instruction, the stack and the storage
+        self.verbose = verbose
 
         # retrive instructions, basicblocks & functions statically
         disasm = EthereumDisassembler(bytecode)
         self.instructions = disasm.disassemble()
         self.reverse_instructions = {k: v for k, v in enumerate(self.instructions)}
+        self.offset_to_index = {v.offset: k for k, v in enumerate(self.instructions)}
 
         self.simplify_ssa = EthereumSSASimplifier()
 
@@ -35,45 +48,140 @@ class EthereumEmulatorEngine(EmulatorEngine):
         self.max_depth = max_depth
         self.ssa_counter = 0
 
+        # objects notified before and after each instruction
+        # see octopus.platforms.ETH.trace
+        self.tracers = list()
+        # edge coverage map updated at block boundaries
+        # see octopus.platforms.ETH.coverage
+        self.coverage = None
+
+        # jump directly from the dispatcher to the called function
+        # see octopus.platforms.ETH.dispatch
+        self.dispatch = None
+        if fast_entry:
+            self.dispatch = build_dispatch_table(self.instructions)
+
+        # results of calls without side effects
+        # see octopus.platforms.ETH.cache
+        self.result_cache = None
+        # runtime code, creation code & swarm hash removed
+        self.code = bytecode_to_bytes(disasm.bytecode)
+        self.code_hash = keccak(self.code)
+
+        # valid JUMPDEST bitmap of self.code (optional)
+        # see octopus.arch.evm.codemap
+        self.code_map = code_map
+
+    @property
+    def code_map(self):
+        return self._code_map
+
+    @code_map.setter
+    def code_map(self, code_map):
+        if code_map is not None and len(code_map) != len(self.code):
+            raise ValueError('code_map does not match the runtime code')
+        self._code_map = code_map
+
     def emulate(self, callinfo, state=EthereumVMstate(), depth=0):
 
         # custom code block
-        new_state = EthereumVMstate()
+        # callinfo['gas'] (optional) is the gas limit of the call, the
+        # emulation only stops when out of gas if it is given
+        gas_limited = callinfo.get('gas') is not None
+        if not gas_limited:
+            new_state = EthereumVMstate()
+        else:
+            new_state = EthereumVMstate(gas=callinfo['gas'])
         new_state.storage = state.storage
+        new_state.calldata = Calldata(callinfo.get('calldata'))
         state = new_state
         # custom code block end
 
+        # memoized result of a previous call without side effects
+        # see octopus.platforms.ETH.cache
+        cache = self.result_cache
+        if cache is not None:
+            cached = cache.lookup(self.code_hash, callinfo, state.storage)
+            if cached is not None:
+                return cached
+
         #  create fake stack for tests
         state.symbolic_stack = list(range(1000))
 
         # get current instruction
         instr = self.reverse_instructions[state.pc]
 
+        tracers = self.tracers
+        if self.coverage is not None:
+            self.coverage.start()
+        dispatch_head = self.dispatch.head if self.dispatch else None
+
         # halt variable use to catch ending branch
         halt = False
         while not halt:
 
+            if state.pc == dispatch_head:
+                self.dispatch.fast_entry(self, state)
+
             # get current instruction
             instr = self.reverse_instructions[state.pc]
 
+            for tracer in tracers:
+                tracer.before_instruction(instr, state, depth)
+
             # Save instruction and state
             state.instr = instr
             self.states[self.states_total] = state
             #state = copy.deepcopy(state)
             self.states_total += 1
             state.pc += 1
+            state.gas -= instr.fee
+
+            if state.gas < 0 and gas_limited:
+                logging.info('[X] Out of gas at 0x%x' % instr.offset)
+                state.out_of_gas = True
+                # instr is not executed, the execution halts on it
+                for tracer in tracers:
+                    tracer.after_instruction(instr, state, depth, True)
+                break
 
             # execute single instruction
             halt = self.emulate_one_instruction(callinfo, instr, state, depth)
 
+            for tracer in tracers:
+                tracer.after_instruction(instr, state, depth, halt)
+
+        state.rw_set = ReadWriteSet.from_state(state)
+
+        if cache is not None and not state.has_side_effects:
+            cache.store(self.code_hash, callinfo, state)
+
+        return state
+
+    def instruction_at(self, offset):
+        '''Return the instruction starting at offset or None'''
+        index = self.offset_to_index.get(offset)
+        if index is None:
+            return None
+        return self.instructions[index]
+
+    def is_jumpdest(self, offset):
+        '''True if offset is a valid jump destination'''
+        if self.code_map is not None:
+            return self.code_map.is_jumpdest(offset)
+        target = self.instruction_at(offset)
+        return target is not None and target.name == "JUMPDEST"
 
     def emulate_one_instruction(self, callinfo, instr, state, depth):
-        if instr.operand_interpretation:
+        if not self.verbose:
+            pass
+        elif instr.operand_interpretation:
             print ('\033[1;32m Instr \033[0m',hex(state.pc-1), instr.name, hex(instr.operand_interpretation))
         else:
             print ('\033[1;32m Instr \033[0m', hex(state.pc-1), instr.name)
 
         halt = False
+        flags = instr.flags
 
         #
         #  0s: Stop and Arithmetic Operations
@@ -82,37 +190,37 @@ class EthereumEmulatorEngine(EmulatorEngine):
             if self.ssa:
                 instr.ssa = SSA(method_name=instr.name)
             halt = True
-        elif instr.is_arithmetic:
+        elif flags & ARITHMETIC:
             self.emul_arithmetic_instruction(instr, state)
         #
         #  10s: Comparison & Bitwise Logic Operations
         #
-        elif instr.is_comparaison_logic:
+        elif flags & COMPARISON_LOGIC:
             self.emul_comparaison_logic_instruction(instr, state)
         #
         #  20s: SHA3
         #
-        elif instr.is_sha3:
+        elif flags & SHA3:
             self.emul_sha3_instruction(instr, state)
         #
         #  30s: Environment Information
         #
-        elif instr.is_environmental:
+        elif flags & ENVIRONMENTAL:
             self.ssa_environmental_instruction(callinfo, instr, state)
         #
         #  40s: Block Information
         #
-        elif instr.uses_block_info:
+        elif flags & BLOCK_INFO:
             self.ssa_block_instruction(instr, state)
         #
         #  50s: Stack, Memory, Storage, and Flow Information
         #
-        elif instr.uses_stack_block_storage_info:
+        elif flags & STACK_MEMORY_STORAGE_FLOW:
             halt = self.ssa_stack_memory_storage_flow_instruction(callinfo, instr, state, depth)
         #
         #  60s & 70s: Push Operations
         #
-        elif instr.name.startswith("PUSH"):
+        elif flags & PUSH:
             #value = int.from_bytes(instr.operand, byteorder='big')
             instr.ssa = SSA(self.ssa_counter, instr.name,
                             instr.operand_interpretation,
@@ -127,7 +235,7 @@ class EthereumEmulatorEngine(EmulatorEngine):
         #
         #  80s: Duplication Operations
         #
-        elif instr.name.startswith('DUP'):
+        elif flags & DUP:
             # DUPn (eg. DUP1: a b c -> a b c c, DUP3: a b c -> a b c a)
             position = instr.pops  # == XX from DUPXX
             try:
@@ -146,7 +254,7 @@ class EthereumEmulatorEngine(EmulatorEngine):
         #
         #  90s: Swap Operations
         #
-        elif instr.name.startswith('SWAP'):
+        elif flags & SWAP:
             # SWAPn (eg. SWAP1: a b c d -> a b d c, SWAP3: a b c d -> d b c a)
             position = instr.pops - 1  # == XX from SWAPXX
             try:
@@ -172,24 +280,33 @@ class EthereumEmulatorEngine(EmulatorEngine):
         #
         #  a0s: Logging Operations
         #
-        elif instr.name.startswith('LOG'):
+        elif flags & LOG:
             # only stack operations emulated
             arg = [state.ssa_stack.pop() for x in range(instr.pops)]
             instr.ssa = SSA(method_name=instr.name, args=arg)
             #state.ssa_stack.append(instr)
+
+            # custome new code block
+            for x in range(instr.pops):
+                state._stack.pop()
+            state.has_side_effects = True
+            # custome new code block end
         #
         #  f0s: System Operations
         #
-        elif instr.is_system:
+        elif flags & SYSTEM:
             halt = self.ssa_system_instruction(instr, state)
             #ssa.append(instr.name)
 
         # UNKNOWN INSTRUCTION
         else:
             logging.warning('UNKNOWN = ' + instr.name)
+            # opcodes missing from the table are INVALID
+            halt = instr.is_halt
 
-        print ('stack: ',list(map(lambda x: hex(x),state._stack)))
-        print ('storage: ', state.storage)
+        if self.verbose:
+            print ('stack: ',list(map(lambda x: hex(x),state._stack)))
+            print ('storage: ', state.storage)
         #print ('memory: ', state.memory)
         return halt
 
@@ -279,7 +396,8 @@ class EthereumEmulatorEngine(EmulatorEngine):
     def emul_comparaison_logic_instruction(self, instr, state):
 
         if instr.name in ['LT', 'GT', 'SLT', 'SGT',
-                          'EQ', 'AND', 'OR', 'XOR', 'BYTE']:
+                          'EQ', 'AND', 'OR', 'XOR', 'BYTE',
+                          'SHL', 'SHR', 'SAR']:
             args = [state.ssa_stack.pop(), state.ssa_stack.pop()]
 
         elif instr.name in ['ISZERO', 'NOT']:
@@ -361,6 +479,18 @@ class EthereumEmulatorEngine(EmulatorEngine):
         elif op == 'NOT':
             x = state._stack.pop()
             state._stack.append(~x)
+        elif op == 'SHL':
+            shift = state._stack.pop()
+            x = state._stack.pop()
+            state._stack.append((x << shift) & TT256M1 if shift < 256 else 0)
+        elif op == 'SHR':
+            shift = state._stack.pop()
+            x = state._stack.pop()
+            state._stack.append(x >> shift if shift < 256 else 0)
+        elif op == 'SAR':
+            shift = state._stack.pop()
+            x = hlp.to_signed(state._stack.pop())
+            state._stack.append((x >> min(shift, 255)) & TT256M1)
         # custome new code block end
 
 
@@ -390,11 +520,13 @@ class EthereumEmulatorEngine(EmulatorEngine):
             # custome new code block
             op = instr.name
             if op == 'CALLDATASIZE':
-                v = len(callinfo["calldata"])
+                v = len(state.calldata)
                 state._stack.append(v)
             elif op == 'CALLVALUE':
                 v = callinfo['callvalue']
                 state._stack.append(v)
+            elif op == 'CODESIZE':
+                state._stack.append(len(self.code))
             else:
                 state._stack.append(0xbadbeef)
             # custome new code block end
@@ -408,12 +540,15 @@ class EthereumEmulatorEngine(EmulatorEngine):
             # custome new code block
             if instr.name == 'CALLDATALOAD':
                 pos = state._stack.pop()
-                pos_end = pos + 0x20
-
-                v = int(callinfo["calldata"][pos:pos_end].hex(),16)
+                v = state.calldata.load(pos)
                 #print('calldata metadata: ', hex(v))
                 state._stack.append(v)
             else:
+                addr = state._stack.pop()
+                if instr.name == 'BALANCE':
+                    state.balance_reads.add(addr)
+                else:
+                    state.code_reads.add(addr)
                 state._stack.append(0xbadbeef)
             # custome new code block end
 
@@ -425,6 +560,13 @@ class EthereumEmulatorEngine(EmulatorEngine):
             op0 = state._stack.pop()
             op1 = state._stack.pop()
             op2 = state._stack.pop()
+            if instr.name == 'CALLDATACOPY':
+                state.calldata.copy_to(state.memory, op0, op1, op2)
+            elif op2:
+                # code is zero padded, no return data of previous calls
+                data = self.code[op1:op1 + op2] \
+                    if instr.name == 'CODECOPY' else b''
+                state.memory.mwrite(op0, data, op2)
             # custome new code block end
 
 
@@ -441,6 +583,7 @@ class EthereumEmulatorEngine(EmulatorEngine):
             start = state._stack.pop()
             s2 = state._stack.pop()
             size = state._stack.pop()
+            state.code_reads.add(addr)
             state._stack.append(0xbadbeef)
             # custome new code block end
 
@@ -500,6 +643,7 @@ class EthereumEmulatorEngine(EmulatorEngine):
                 storage_pos = state._stack.pop()
                 #storage_val = state.storage[storage_pos]
                 storage_val = state.storage.sload(storage_pos)
+                state.storage_reads.add(storage_pos)
                 state._stack.append(storage_val)
 
             # custome new code block end
@@ -533,6 +677,8 @@ class EthereumEmulatorEngine(EmulatorEngine):
                 val = state._stack.pop()
                 #state.storage[pos] = val
                 state.storage.sstore(pos,val)
+                state.storage_writes.add(pos)
+                state.has_side_effects = True
             # custome new code block end
 
         elif op == 'JUMP':
@@ -548,12 +694,9 @@ class EthereumEmulatorEngine(EmulatorEngine):
             if push_instr.ssa.is_constant:
                 #jump_addr = int.from_bytes(push_instr.operand, byteorder='big')
                 jump_addr = push_instr.operand_interpretation
-                # get instruction with this value as offset
-                target = next(filter(lambda element: element.offset == jump_addr, self.instructions))
             else:
                 # try to resolve the SSA repr
                 jump_addr = self.simplify_ssa.resolve_instr_ssa(push_instr)
-                target = next(filter(lambda element: element.offset == jump_addr, self.instructions))
                 if not jump_addr:
                     logging.warning('JUMP DYNAMIC')
                     logging.warning('[X] push_instr %x: %s ' % (push_instr.offset, push_instr.name))
@@ -564,12 +707,12 @@ class EthereumEmulatorEngine(EmulatorEngine):
 
             # depth of 1 - prevent looping
             #if (depth < self.max_depth):
-            if target.name != "JUMPDEST":
+            if not self.is_jumpdest(jump_addr):
                 logging.info('[X] Bad JUMP to 0x%x' % jump_addr)
                 return True
 
             new_state = state
-            new_state.pc = self.instructions.index(target)
+            new_state.pc = self.offset_to_index[jump_addr]
             #self.emulate(callinfo, new_state, depth=depth + 1)
 
             #return True
@@ -595,12 +738,9 @@ class EthereumEmulatorEngine(EmulatorEngine):
             if push_instr.ssa.is_constant:
                 #jump_addr = int.from_bytes(push_instr.operand, byteorder='big')
                 jump_addr = push_instr.operand_interpretation
-                # get instruction with this value as offset
-                target = next(filter(lambda element: element.offset == jump_addr, self.instructions))
             else:
                 # try to resolve the SSA repr
                 jump_addr = self.simplify_ssa.resolve_instr_ssa(push_instr)
-                target = next(filter(lambda element: element.offset == jump_addr, self.instructions))
                 if not jump_addr:
                     logging.warning('JUMP DYNAMIC')
                     logging.warning('[X] push_instr %x: %s ' % (push_instr.offset, push_instr.name))
@@ -609,7 +749,7 @@ class EthereumEmulatorEngine(EmulatorEngine):
                     logging.warning('[X] push_instr.ssa %s' % list_args)
                     return True
 
-            if target.name != "JUMPDEST":
+            if not self.is_jumpdest(jump_addr):
                 logging.info('[X] Bad JUMP to 0x%x' % jump_addr)
                 return True
 
@@ -617,10 +757,14 @@ class EthereumEmulatorEngine(EmulatorEngine):
             if con:
                 # condition are True
                 new_state = state
-                new_state.pc = self.instructions.index(target)
+                new_state.pc = self.offset_to_index[jump_addr]
 
             else:
                 new_state = state
+                # fallthrough block, a JUMPDEST records its own visit
+                if self.coverage is not None and \
+                        not self.is_jumpdest(instr.offset_end + 1):
+                    self.coverage.visit(instr.offset_end + 1)
                 #halt = True
             #halt = True
 
@@ -639,12 +783,19 @@ class EthereumEmulatorEngine(EmulatorEngine):
             # SSA STACK
             instr.ssa = SSA(method_name=instr.name)
 
+            if self.coverage is not None:
+                self.coverage.visit(instr.offset)
+
         return halt
 
     def ssa_system_instruction(self, instr, state):
 
         halt = False
 
+        if instr.name in ('CREATE', 'CREATE2', 'CALL', 'CALLCODE',
+                          'DELEGATECALL', 'STATICCALL', 'SELFDESTRUCT'):
+            state.has_side_effects = True
+
         if instr.name == 'CREATE':
             args = [state.ssa_stack.pop(), state.ssa_stack.pop(), state.ssa_stack.pop()]
             instr.ssa = SSA(new_assignement=self.ssa_counter, method_name=instr.name, args=args)
@@ -670,6 +821,12 @@ class EthereumEmulatorEngine(EmulatorEngine):
         elif instr.name in ['RETURN', 'REVERT']:
             offset, length = state.ssa_stack.pop(), state.ssa_stack.pop()
             instr.ssa = SSA(method_name=instr.name, args=[offset, length])
+
+            # custome new code block
+            offset = state._stack.pop()
+            length = state._stack.pop()
+            state.last_returned = bytes(state.memory[offset:offset + length]).ljust(length, b'\x00')
+            # custome new code block end
             halt = True
 
         elif instr.name in ['INVALID', 'SELFDESTRUCT']:
@@ -682,8 +839,12 @@ class EthereumEmulatorEngine(EmulatorEngine):
 
 class EthereumSSAEngine(EthereumEmulatorEngine):
 
-    def __init__(self, bytecode=None, max_depth=20):
+    def __init__(self, bytecode=None, max_depth=20, verbose=True,
+                 fast_entry=False, code_map=None):
         EthereumEmulatorEngine.__init__(self, bytecode=bytecode,
                                         ssa=True,
                                         symbolic_exec=False,
-                                        max_depth=max_depth)
+                                        max_depth=max_depth,
+                                        verbose=verbose,
+                                        fast_entry=fast_entry,
+                                        code_map=code_map)
@@ -0,0 +1,337 @@
+'''
+Coverage-guided calldata fuzzer built on EthereumSSAEngine
+
+    fuzz(bytecode, 'corpus/', workers=4, iterations=10000)
+
+Workers share the corpus through its directory: each one periodically
+executes the inputs found by the others. Executions ending with REVERT,
+INVALID (assertion), out of gas or an emulator exception (crash) are
+saved once per (kind, offset) in a sub directory of the corpus.
+'''
+
+import multiprocessing
+import os
+import random
+
+from eth_hash.auto import keccak
+
+from octopus.arch.evm.cfg import enum_func_static
+from octopus.core.storage import Storage
+from octopus.platforms.ETH.coverage import CoverageMap
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.snapshot import dumps_storage, loads_storage
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+WORD_SIZE = 32
+SELECTOR_SIZE = 4
+DEFAULT_FUZZ_GAS = 1000000
+
+INTERESTING_WORDS = (0, 1, 2, 0x20, 0x40, 0x7f, 0x80, 0xff, 0x100, 0xffff,
+                     2 ** 160 - 1, 2 ** 255 - 1, 2 ** 255,
+                     2 ** 256 - 2, 2 ** 256 - 1)
+
+KIND_OK = 'ok'
+KIND_REVERT = 'revert'
+KIND_ASSERTION = 'assertion'
+KIND_OUT_OF_GAS = 'out_of_gas'
+KIND_CRASH = 'crash'
+FINDING_KINDS = (KIND_REVERT, KIND_ASSERTION, KIND_OUT_OF_GAS, KIND_CRASH)
+
+
+def contract_selectors(instructions):
+    '''Return the function selectors found by enum_func_static'''
+    return [f.selector for f in enum_func_static(instructions)
+            if f.selector is not None]
+
+
+class CalldataMutator(object):
+    '''Generate and mutate ABI encoded calldata
+
+    Calldata is seen as a 4 bytes selector followed by 32 bytes words.
+    '''
+
+    def __init__(self, selectors, rng=None, max_words=8):
+        self.selectors = list(selectors) or [0]
+        self.rng = rng or random.Random()
+        self.max_words = max_words
+
+    def _selector(self):
+        return self.rng.choice(self.selectors).to_bytes(SELECTOR_SIZE,
+                                                        byteorder='big')
+
+    def _word(self):
+        rng = self.rng
+        choice = rng.randrange(3)
+        if choice == 0:
+            value = rng.choice(INTERESTING_WORDS)
+        elif choice == 1:
+            value = rng.randrange(0x10000)
+        else:
+            value = rng.getrandbits(256)
+        return value.to_bytes(WORD_SIZE, byteorder='big')
+
+    def generate(self):
+        '''Return a new random calldata'''
+        n_words = self.rng.randrange(self.max_words + 1)
+        return self._selector() + b''.join(self._word()
+                                           for _ in range(n_words))
+
+    def mutate(self, data, other=None):
+        '''Return a mutated copy of data, other is used for splicing'''
+        rng = self.rng
+        selector, args = data[:SELECTOR_SIZE], bytearray(data[SELECTOR_SIZE:])
+        n_words = len(args) // WORD_SIZE
+        strategy = rng.randrange(8)
+
+        if strategy == 0 or len(selector) < SELECTOR_SIZE:
+            selector = self._selector()
+        elif strategy == 1 and n_words < self.max_words:
+            args += self._word()
+        elif strategy == 2 and n_words:
+            del args[-WORD_SIZE:]
+        elif strategy == 3 and other is not None and len(other) > SELECTOR_SIZE:
+            # splice: keep our head, take the tail of other
+            cut = rng.randrange(n_words + 1) * WORD_SIZE
+            args = args[:cut] + other[SELECTOR_SIZE + cut:]
+        elif n_words:
+            pos = rng.randrange(n_words) * WORD_SIZE
+            word = int.from_bytes(args[pos:pos + WORD_SIZE], byteorder='big')
+            if strategy == 4:
+                word ^= 1 << rng.randrange(256)
+            elif strategy == 5:
+                word = (word + rng.randint(-35, 35)) % 2 ** 256
+            elif strategy == 6:
+                word = rng.choice(INTERESTING_WORDS)
+            else:
+                word = int.from_bytes(self._word(), byteorder='big')
+            args[pos:pos + WORD_SIZE] = word.to_bytes(WORD_SIZE,
+                                                      byteorder='big')
+        else:
+            args += self._word()
+
+        return bytes(selector) + bytes(args)
+
+
+class Corpus(object):
+    '''Inputs stored on disk, one file per input named by its keccak
+
+    directory/queue     inputs reaching new coverage
+    directory/<kind>    one input per (kind, offset), see FINDING_KINDS
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.queue = os.path.join(directory, 'queue')
+        for path in [self.queue] + [os.path.join(directory, kind)
+                                    for kind in FINDING_KINDS]:
+            os.makedirs(path, exist_ok=True)
+        self.seen = set()
+        self.findings = set()
+
+    @staticmethod
+    def _write(path, data):
+        # atomic for the other workers listing the directory
+        tmp = path + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def add(self, data):
+        '''Save data in the queue, return False if already present'''
+        name = keccak(data).hex()
+        if name in self.seen:
+            return False
+        self.seen.add(name)
+        path = os.path.join(self.queue, name)
+        if not os.path.exists(path):
+            self._write(path, data)
+        return True
+
+    def sync(self):
+        '''Return the queue inputs not seen yet by this process'''
+        new = list()
+        for name in os.listdir(self.queue):
+            if name.endswith('.tmp') or name in self.seen:
+                continue
+            self.seen.add(name)
+            with open(os.path.join(self.queue, name), 'rb') as f:
+                new.append(f.read())
+        return new
+
+    def save_finding(self, kind, signature, data):
+        '''Save data under directory/kind, once per signature'''
+        if (kind, signature) in self.findings:
+            return False
+        self.findings.add((kind, signature))
+        directory = os.path.join(self.directory, kind)
+        if any(name.startswith(signature + '-')
+               for name in os.listdir(directory)):
+            return False
+        self._write(os.path.join(directory, '%s-%s' % (
+            signature, keccak(data).hex()[:16])), data)
+        return True
+
+
+class Scheduler(object):
+    '''Pick the next input to mutate
+
+    Each entry has an energy starting at 1 + number of new edges (new
+    JUMPI outcomes) it reached; it decays every time the entry is picked.
+    '''
+
+    def __init__(self, rng=None, decay=0.9):
+        self.rng = rng or random.Random()
+        self.decay = decay
+        self.entries = list()
+        self.energy = list()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, data, new_edges=0):
+        self.entries.append(data)
+        self.energy.append(1.0 + new_edges)
+
+    def next(self):
+        index = self.rng.choices(range(len(self.entries)),
+                                 weights=self.energy)[0]
+        self.energy[index] = max(1.0, self.energy[index] * self.decay)
+        return self.entries[index]
+
+
+class Fuzzer(object):
+    '''Single process fuzzing loop'''
+
+    def __init__(self, bytecode, corpus_dir, storage=None, seed=None,
+                 gas=DEFAULT_FUZZ_GAS, callvalues=(0, 1)):
+        self.rng = random.Random(seed)
+        self.engine = EthereumSSAEngine(bytecode, verbose=False)
+        self.coverage = CoverageMap()
+        self.engine.coverage = self.coverage
+        self.storage = storage if storage is not None else Storage()
+        self.gas = gas
+        self.callvalues = callvalues
+
+        self.mutator = CalldataMutator(
+            contract_selectors(self.engine.instructions), rng=self.rng)
+        self.corpus = Corpus(corpus_dir)
+        self.scheduler = Scheduler(rng=self.rng)
+        # AFL buckets seen so far & union of hit edges
+        self.virgin = bytearray(self.coverage.size)
+        self.total = CoverageMap(self.coverage.size)
+
+        self.stats = dict.fromkeys((KIND_OK,) + FINDING_KINDS, 0)
+        self.stats['execs'] = 0
+        self.stats['edges'] = 0
+
+    def execute(self, data, callvalue=0):
+        '''Run one input, return (kind, signature)'''
+        engine = self.engine
+        self.coverage.clear()
+        # only the final state is needed
+        engine.states = dict()
+        engine.states_total = 0
+
+        state = EthereumVMstate()
+        state.storage = Storage()
+        state.storage.update(self.storage)
+        callinfo = {'calldata': data, 'callvalue': callvalue,
+                    'gas': self.gas}
+        self.stats['execs'] += 1
+        try:
+            result = engine.emulate(callinfo, state)
+        except Exception as e:
+            last = engine.states.get(engine.states_total - 1)
+            offset = last.instr.offset if last else 0
+            return KIND_CRASH, '%s_%x' % (type(e).__name__, offset)
+
+        offset = result.instr.offset if result.instr else 0
+        if result.out_of_gas:
+            kind = KIND_OUT_OF_GAS
+        elif result.instr.name == 'REVERT':
+            kind = KIND_REVERT
+        elif result.instr.name == 'INVALID':
+            kind = KIND_ASSERTION
+        else:
+            kind = KIND_OK
+        return kind, '%s_%x' % (kind, offset)
+
+    def _process(self, data, kind, signature):
+        self.stats[kind] += 1
+        if kind != KIND_OK:
+            if self.corpus.save_finding(kind, signature, data):
+                logging.info('[+] new %s: %s', kind, signature)
+
+        if self.coverage.has_new_bits(self.virgin):
+            new_edges = len(self.coverage.diff(self.total))
+            if new_edges:
+                self.total.merge(self.coverage)
+                self.stats['edges'] += new_edges
+            self.corpus.add(data)
+            self.scheduler.add(data, new_edges)
+
+    def sync(self):
+        '''Execute the inputs added to the corpus by other workers'''
+        for data in self.corpus.sync():
+            self._process(data, *self.execute(data))
+
+    def fuzz_one(self):
+        if len(self.scheduler) and self.rng.random() < 0.9:
+            parent = self.scheduler.next()
+            other = self.scheduler.next() if len(self.scheduler) > 1 else None
+            data = self.mutator.mutate(parent, other)
+        else:
+            data = self.mutator.generate()
+        callvalue = self.rng.choice(self.callvalues)
+        self._process(data, *self.execute(data, callvalue))
+
+    def run(self, iterations, sync_every=500):
+        self.sync()
+        for i in range(iterations):
+            self.fuzz_one()
+            if (i + 1) % sync_every == 0:
+                self.sync()
+        self.sync()
+        return self.stats
+
+
+def _worker(args):
+    bytecode, corpus_dir, storage_data, seed, iterations, kwargs = args
+    storage = loads_storage(storage_data)
+    fuzzer = Fuzzer(bytecode, corpus_dir, storage=storage, seed=seed,
+                    **kwargs)
+    return fuzzer.run(iterations)
+
+
+def fuzz(bytecode, corpus_dir, workers=None, iterations=10000,
+         storage=None, seed=None, **kwargs):
+    '''Fuzz bytecode with workers processes sharing corpus_dir
+
+    storage is the initial contract Storage of each execution,
+    iterations is the number of executions per worker.
+    Return the summed statistics of all workers.
+    '''
+    workers = workers or os.cpu_count() or 1
+    storage_data = dumps_storage(storage if storage is not None
+                                 else Storage())
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    # create the directories before the workers race on them
+    Corpus(corpus_dir)
+
+    args = [(bytecode, corpus_dir, storage_data, seed + i, iterations, kwargs)
+            for i in range(workers)]
+    if workers == 1:
+        results = [_worker(args[0])]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_worker, args)
+
+    stats = dict()
+    for result in results:
+        for key, value in result.items():
+            stats[key] = stats.get(key, 0) + value
+    return stats
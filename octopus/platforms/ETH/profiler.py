@@ -0,0 +1,161 @@
+'''
+Opt-in profiler for EthereumEmulatorEngine
+
+    profiler = Profiler(engine.instructions)
+    engine.tracers.append(profiler)
+    engine.emulate(callinfo, state)
+    profiler.report(by='block', sort='tottime')
+    profiler.dump_collapsed('out.folded')   # flamegraph.pl out.folded
+
+Executed instructions and time are accumulated per opcode, per basic
+block (enum_blocks_static) and per function (enum_func_static). A
+function is entered when the execution reaches its start offset; the code
+executed before is attributed to the dispatcher.
+
+ncalls of a block or function counts the times execution entered it:
+coming from another block or function, or reaching its start offset
+again. ninstr counts its executed instructions (equal to ncalls for
+opcodes).
+'''
+
+import sys
+from time import perf_counter_ns
+
+from octopus.arch.evm.cfg import enum_blocks_static, enum_func_static
+from octopus.platforms.ETH.trace import Tracer
+
+
+DISPATCHER = 'dispatcher'
+PROFILE_KEYS = ('opcode', 'block', 'function')
+SORT_KEYS = ('tottime', 'ncalls', 'ninstr', 'percall', 'name')
+
+
+class ProfileEntry(object):
+    '''Number of entries, executed instructions and total time (ns) of
+    one profiled item
+    '''
+
+    __slots__ = ('name', 'ncalls', 'ninstr', 'tottime')
+
+    def __init__(self, name):
+        self.name = name
+        self.ncalls = 0
+        self.ninstr = 0
+        self.tottime = 0
+
+    @property
+    def percall(self):
+        return self.tottime / self.ncalls if self.ncalls else 0
+
+
+class _Entries(dict):
+
+    def __missing__(self, name):
+        entry = ProfileEntry(name)
+        self[name] = entry
+        return entry
+
+
+class Profiler(Tracer):
+    '''Accumulate executions and time per opcode, block and function'''
+
+    def __init__(self, instructions, timer=perf_counter_ns):
+        self.timer = timer
+        # instruction offset -> name of its basic block
+        self.block_of = dict()
+        self.block_starts = set()
+        for block in enum_blocks_static(instructions):
+            self.block_starts.add(block.start_offset)
+            for instr in block.instructions:
+                self.block_of[instr.offset] = block.name
+        # function start offset -> function name
+        self.function_at = {f.start_offset: f.prefered_name
+                            for f in enum_func_static(instructions)}
+
+        self.stats = {key: _Entries() for key in PROFILE_KEYS}
+        # (function, block) -> time, for the collapsed stacks
+        self.stacks = dict()
+        # current function per call depth
+        self.frames = dict()
+        # (function, block) of the previous instruction per call depth
+        self.previous = dict()
+        self._start = 0
+
+    def clear(self):
+        for entries in self.stats.values():
+            entries.clear()
+        self.stacks.clear()
+        self.frames.clear()
+        self.previous.clear()
+
+    def before_instruction(self, instr, state, depth):
+        function = self.function_at.get(instr.offset)
+        if function is not None:
+            self.frames[depth] = function
+        self._start = self.timer()
+
+    def after_instruction(self, instr, state, depth, halt):
+        elapsed = self.timer() - self._start
+        function = self.frames.get(depth, DISPATCHER)
+        block = self.block_of.get(instr.offset, 'block_%x' % instr.offset)
+
+        stack = (function, block)
+        previous = self.previous.get(depth, (None, None))
+        self.previous[depth] = stack
+        offset = instr.offset
+
+        for entries, name, entered in (
+                (self.stats['opcode'], instr.name, True),
+                (self.stats['block'], block,
+                 block != previous[1] or offset in self.block_starts),
+                (self.stats['function'], function,
+                 function != previous[0] or offset in self.function_at)):
+            entry = entries[name]
+            if entered:
+                entry.ncalls += 1
+            entry.ninstr += 1
+            entry.tottime += elapsed
+
+        self.stacks[stack] = self.stacks.get(stack, 0) + elapsed
+        if halt:
+            self.frames.pop(depth, None)
+            self.previous.pop(depth, None)
+
+    def entries(self, by='opcode', sort='tottime'):
+        '''Return the ProfileEntry list of by (see PROFILE_KEYS)
+        sorted by sort (see SORT_KEYS)
+        '''
+        if by not in PROFILE_KEYS:
+            raise ValueError('unknown profile key %r' % by)
+        if sort not in SORT_KEYS:
+            raise ValueError('unknown sort key %r' % sort)
+        return sorted(self.stats[by].values(),
+                      key=lambda e: getattr(e, sort),
+                      reverse=(sort != 'name'))
+
+    def report(self, by='opcode', sort='tottime', limit=None, fp=None):
+        '''Print a pstats-like table, times in microseconds'''
+        fp = fp or sys.stdout
+        entries = self.entries(by, sort)
+        total_instr = sum(e.ninstr for e in entries)
+        total_time = sum(e.tottime for e in entries)
+
+        fp.write('%d instructions executed in %.3f ms\n\n' % (
+            total_instr, total_time / 1e6))
+        fp.write('   ordered by: %s\n\n' % sort)
+        fp.write('%12s %12s %12s %10s %7s  %s\n' % (
+            'ncalls', 'ninstr', 'tottime(us)', 'percall', '%time', by))
+        for entry in entries[:limit]:
+            fp.write('%12d %12d %12.1f %10.3f %7.2f  %s\n' % (
+                entry.ncalls, entry.ninstr, entry.tottime / 1e3,
+                entry.percall / 1e3,
+                100.0 * entry.tottime / total_time if total_time else 0,
+                entry.name))
+
+    def dump_collapsed(self, path):
+        '''Write function;block stacks weighted by time (ns), the
+        collapsed format of flamegraph.pl and speedscope
+        '''
+        with open(path, 'w') as f:
+            for (function, block), elapsed in sorted(self.stacks.items()):
+                f.write('%s;%s %d\n' % (function, block, elapsed))
@@ -0,0 +1,650 @@
+'''
+Struct-of-arrays form of an EVM program and a concrete emulator running on it
+
+    program = Program.from_bytecode(bytecode)
+    program.dump('contract.octp')
+    program = Program.open('contract.octp')    # mmap, nothing decoded
+    state = ProgramEmulator(program).emulate(callinfo, state)
+
+Instead of one EvmInstruction per instruction, a program is a set of
+parallel columns indexed by instruction index:
+
+    opcode      u1  opcode
+    offset      u4  byte offset in the code
+    operand     u4  index of the PUSH value in the word table or NO_OPERAND
+    block       u4  basic block number
+    jumpdest    u1  1 if the instruction is a JUMPDEST
+
+plus index_of (u4 per code byte, instruction index or NO_INDEX), the word
+table (32 bytes per distinct PUSH value) and the code itself.
+
+File layout (little-endian): header, then every section padded to 8 bytes.
+'''
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from eth_hash.auto import keccak
+
+from octopus.arch.evm.evm import EVM
+from octopus.arch.evm.instruction import EvmInstruction
+from octopus.core.calldata import Calldata
+from octopus.core.utils import bytecode_to_bytes
+from octopus.platforms.ETH.constants import TT256, TT256M1, TT255
+from octopus.platforms.ETH.rwset import ReadWriteSet
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+from logging import getLogger
+logging = getLogger(__name__)
+
+
+PROGRAM_MAGIC = b'OCTP'
+PROGRAM_VERSION = 1
+PROGRAM_EXTENSION = '.octp'
+
+# magic, version, instructions, code size, words, code hash
+_HEADER = struct.Struct('<4sHxxIII32s')
+_ALIGN = 8
+
+NO_OPERAND = 0xffffffff
+NO_INDEX = 0xffffffff
+WORD_SIZE = 32
+
+# column name: (array typecode, numpy dtype)
+PROGRAM_COLUMNS = (('opcode', 'B', 'u1'),
+                   ('offset', 'I', '<u4'),
+                   ('operand', 'I', '<u4'),
+                   ('block', 'I', '<u4'),
+                   ('jumpdest', 'B', 'u1'))
+
+_table = EVM().table
+_INVALID = ('INVALID', 0, 0, 0, 0, 'Unknown opcode')
+
+JUMPDEST = 0x5b
+# instructions ending a basic block
+_TERMINATORS = frozenset((0x00, 0x56, 0x57, 0xf3, 0xfd, 0xfe, 0xff))
+
+
+class ProgramFormatException(Exception):
+    """Exception raised when a program file can not be decoded"""
+    pass
+
+
+def _padding(size):
+    return -size % _ALIGN
+
+
+def _column_bytes(column):
+    if sys.byteorder != 'little' and column.itemsize > 1:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column_view(buf, typecode):
+    '''Zero-copy view of a little-endian section when possible'''
+    if sys.byteorder == 'little' or typecode == 'B':
+        return buf.cast(typecode)
+    column = array(typecode, buf.tobytes())
+    column.byteswap()
+    return column
+
+
+class Program(object):
+    '''Parallel columns of an EVM program, see the module documentation'''
+
+    def __init__(self, code, columns, index_of, words, code_hash, buf=None):
+        self.code = code
+        self.opcode = columns['opcode']
+        self.offset = columns['offset']
+        self.operand = columns['operand']
+        self.block = columns['block']
+        self.jumpdest = columns['jumpdest']
+        self.index_of = index_of
+        self.words = words
+        self.code_hash = code_hash
+        self._buf = buf
+        # PUSH values, decoded on first use
+        self._values = None
+
+    def __len__(self):
+        return len(self.opcode)
+
+    @property
+    def columns(self):
+        return {name: getattr(self, name) for name, _, _ in PROGRAM_COLUMNS}
+
+    @property
+    def n_words(self):
+        return len(self.words) // WORD_SIZE
+
+    @property
+    def values(self):
+        '''PUSH values (int) indexed by the operand column'''
+        if self._values is None:
+            words = self.words
+            self._values = [int.from_bytes(words[i:i + WORD_SIZE], 'big')
+                            for i in range(0, len(words), WORD_SIZE)]
+        return self._values
+
+    @classmethod
+    def from_bytecode(cls, bytecode):
+        '''Decode bytecode (hex string or bytes) in a single pass'''
+        code = bytes(bytecode_to_bytes(bytecode))
+        columns = {name: array(typecode) for name, typecode, _
+                   in PROGRAM_COLUMNS}
+        opcodes, offsets, operands, blocks, jumpdests = \
+            [columns[name] for name, _, _ in PROGRAM_COLUMNS]
+        index_of = array('I', [NO_INDEX]) * len(code)
+        word_index = dict()
+
+        block = 0
+        new_block = False
+        offset = 0
+        while offset < len(code):
+            op = code[offset]
+            if op == JUMPDEST and len(opcodes):
+                new_block = True
+            if new_block:
+                block += 1
+                new_block = False
+
+            index_of[offset] = len(opcodes)
+            opcodes.append(op)
+            offsets.append(offset)
+            blocks.append(block)
+            jumpdests.append(op == JUMPDEST)
+
+            if 0x60 <= op <= 0x7f:
+                size = op - 0x5f
+                # truncated PUSH at the end of the code: value of the
+                # remaining bytes, as the operand_interpretation of
+                # EvmDisassembler
+                word = code[offset + 1:offset + 1 + size]
+                word = word.rjust(WORD_SIZE, b'\x00')
+                operands.append(word_index.setdefault(word, len(word_index)))
+                offset += size + 1
+            else:
+                operands.append(NO_OPERAND)
+                offset += 1
+            if op in _TERMINATORS:
+                new_block = True
+
+        words = b''.join(sorted(word_index, key=word_index.get))
+        return cls(code, columns, index_of, words, keccak(code))
+
+    # ==============================
+    # #     serialization          #
+    # ==============================
+
+    def dumps(self):
+        '''Return the binary form of the program'''
+        chunks = [_HEADER.pack(PROGRAM_MAGIC, PROGRAM_VERSION, len(self),
+                               len(self.code), self.n_words,
+                               self.code_hash)]
+        sections = [_column_bytes(array(typecode, getattr(self, name)))
+                    for name, typecode, _ in PROGRAM_COLUMNS]
+        sections.append(_column_bytes(array('I', self.index_of)))
+        sections.append(bytes(self.words))
+        sections.append(bytes(self.code))
+        chunks.append(bytes(_padding(_HEADER.size)))
+        for section in sections:
+            chunks.append(section)
+            chunks.append(bytes(_padding(len(section))))
+        return b''.join(chunks)
+
+    def dump(self, path):
+        # atomic, a program file may be read by other processes
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(self.dumps())
+        os.replace(tmp, path)
+
+    @classmethod
+    def loads(cls, buf):
+        '''Program over buf (bytes, mmap...) without copying the columns'''
+        view = memoryview(buf)
+        if len(view) < _HEADER.size:
+            raise ProgramFormatException('truncated header')
+        magic, version, n_instructions, code_size, n_words, code_hash = \
+            _HEADER.unpack_from(view)
+        if magic != PROGRAM_MAGIC:
+            raise ProgramFormatException('bad magic %r' % magic)
+        if version != PROGRAM_VERSION:
+            raise ProgramFormatException('unsupported version %d' % version)
+
+        sizes = [n_instructions * array(typecode).itemsize
+                 for _, typecode, _ in PROGRAM_COLUMNS]
+        sizes += [code_size * array('I').itemsize, n_words * WORD_SIZE,
+                  code_size]
+        sections = list()
+        pos = _HEADER.size + _padding(_HEADER.size)
+        for size in sizes:
+            if pos + size > len(view):
+                raise ProgramFormatException('truncated program')
+            sections.append(view[pos:pos + size])
+            pos += size + _padding(size)
+
+        columns = {name: _column_view(section, typecode)
+                   for (name, typecode, _), section
+                   in zip(PROGRAM_COLUMNS, sections)}
+        index_of = _column_view(sections[len(PROGRAM_COLUMNS)], 'I')
+        words, code = sections[-2:]
+        return cls(code, columns, index_of, words, bytes(code_hash),
+                   buf=buf)
+
+    @classmethod
+    def open(cls, path):
+        '''Memory-map the program file located at path'''
+        with open(path, 'rb') as f:
+            return cls.loads(mmap.mmap(f.fileno(), 0,
+                                       access=mmap.ACCESS_READ))
+
+    @classmethod
+    def cached(cls, bytecode, directory):
+        '''Open the program of bytecode from directory, decode and save
+        it there first if needed. Files are named by code hash.
+        '''
+        code = bytes(bytecode_to_bytes(bytecode))
+        path = os.path.join(directory, keccak(code).hex() + PROGRAM_EXTENSION)
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            cls.from_bytecode(code).dump(path)
+        return cls.open(path)
+
+    # ==============================
+    # #     accessors              #
+    # ==============================
+
+    def index_at(self, offset):
+        '''Index of the instruction starting at offset or None'''
+        if 0 <= offset < len(self.index_of):
+            index = self.index_of[offset]
+            if index != NO_INDEX:
+                return index
+        return None
+
+    def instruction(self, index):
+        '''Build the EvmInstruction at index'''
+        op = self.opcode[index]
+        name, operand_size, pops, pushes, fee, description = \
+            _table.get(op, _INVALID)
+        instr = EvmInstruction(op, name, operand_size, pops, pushes, fee,
+                               description, offset=self.offset[index])
+        if self.operand[index] != NO_OPERAND:
+            value = self.values[self.operand[index]]
+            instr.operand = value.to_bytes(operand_size, byteorder='big')
+            instr.operand_interpretation = value
+        return instr
+
+    def as_numpy(self):
+        '''Return the columns and index_of as numpy arrays (zero-copy)'''
+        import numpy as np
+
+        arrays = {name: np.frombuffer(getattr(self, name), dtype=dtype)
+                  for name, _, dtype in PROGRAM_COLUMNS}
+        arrays['index_of'] = np.frombuffer(self.index_of, dtype='<u4')
+        return arrays
+
+
+# ==============================
+# #     concrete emulation     #
+# ==============================
+
+def _signed(x):
+    return x - TT256 if x >= TT255 else x
+
+
+# gas fee per opcode
+_FEES = [_table.get(op, _INVALID)[4] for op in range(256)]
+# (pops, pushes) of the opcodes only modelled by their stack effect
+_STACK_EFFECT = {op: (entry[2], entry[3]) for op, entry in _table.items()}
+# calls and contract creations of the table (CREATE2 is 0xfb there), the
+# opcodes missing from the table are INVALID as in EthereumEmulatorEngine
+_SYSTEM_CALLS = frozenset(op for op in (0xf0, 0xf1, 0xf2, 0xf4, 0xfa, 0xfb)
+                          if op in _table)
+
+UNKNOWN_VALUE = 0xbadbeef
+
+
+class ProgramEmulator(object):
+    '''Concrete-only emulation of a Program
+
+    Follows the stack, memory and storage of the concrete part of
+    EthereumEmulatorEngine (same state fields, values not provided by
+    callinfo are UNKNOWN_VALUE) without SSA, tracers or the dispatcher
+    shortcut. Arithmetic is modulo 2**256 with signed operations
+    following the yellow paper.
+    '''
+
+    def __init__(self, program):
+        self.program = program
+        self.coverage = None
+        # executed instructions of the last emulate
+        self.steps = 0
+
+    def emulate(self, callinfo, state=None):
+        '''Run callinfo from the beginning of the program on a new state
+        sharing the storage of state, return the final state
+        '''
+        program = self.program
+        opcodes = program.opcode
+        offsets = program.offset
+        operands = program.operand
+        jumpdests = program.jumpdest
+        values = program.values
+        n_instructions = len(opcodes)
+        coverage = self.coverage
+        if coverage is not None:
+            coverage.start()
+
+        # out of gas only stops a call with callinfo['gas']
+        gas_limited = callinfo.get('gas') is not None
+        if not gas_limited:
+            new_state = EthereumVMstate()
+        else:
+            new_state = EthereumVMstate(gas=callinfo['gas'])
+        if state is not None:
+            new_state.storage = state.storage
+        state = new_state
+        state.calldata = calldata = Calldata(callinfo.get('calldata'))
+        stack = state._stack
+        memory = state.memory
+        storage = state.storage
+        pop = stack.pop
+        push = stack.append
+
+        pc = 0
+        gas = state.gas
+        steps = 0
+        index = 0
+        halt = False
+        while not halt:
+            if pc >= n_instructions:
+                # implicit STOP
+                break
+            index = pc
+            op = opcodes[pc]
+            pc += 1
+            steps += 1
+            gas -= _FEES[op]
+            if gas < 0 and gas_limited:
+                logging.info('[X] Out of gas at 0x%x', offsets[index])
+                state.out_of_gas = True
+                break
+
+            try:
+                halt, pc = self._step(op, index, pc, state, callinfo, stack,
+                                      pop, push, memory, storage, calldata,
+                                      values, operands, jumpdests, gas)
+            except IndexError:
+                logging.info('[X] Stack underflow at 0x%x', offsets[index])
+                halt = True
+            except KeyError:
+                # opcode missing from the table, INVALID
+                logging.info('[X] Invalid opcode 0x%x at 0x%x', op,
+                             offsets[index])
+                halt = True
+
+        state.pc = pc
+        state.gas = gas
+        self.steps = steps
+        if n_instructions:
+            state.instr = program.instruction(index)
+        state.rw_set = ReadWriteSet.from_state(state)
+        return state
+
+    def _jump(self, dest):
+        '''Instruction index of a valid JUMPDEST at dest or None'''
+        program = self.program
+        index = program.index_at(dest)
+        if index is None or not program.jumpdest[index]:
+            logging.info('[X] Bad JUMP to 0x%x', dest)
+            return None
+        return index
+
+    def _step(self, op, index, pc, state, callinfo, stack, pop, push,
+              memory, storage, calldata, values, operands, jumpdests, gas):
+        '''Execute the instruction at index, return (halt, next pc)'''
+
+        # 60s & 70s: Push, 80s: Duplication, 90s: Exchange
+        if 0x60 <= op <= 0x7f:
+            push(values[operands[index]])
+        elif 0x80 <= op <= 0x8f:
+            push(stack[0x7f - op])
+        elif 0x90 <= op <= 0x9f:
+            n = 0x8e - op
+            stack[-1], stack[n] = stack[n], stack[-1]
+
+        # 50s: Stack, Memory, Storage and Flow Operations
+        elif op == 0x50:
+            pop()
+        elif op == 0x51:
+            push(memory.mload(pop()))
+        elif op == 0x52:
+            p = pop()
+            memory.mstore(p, pop())
+        elif op == 0x53:
+            p = pop()
+            memory.mstore8(p, pop())
+        elif op == 0x54:
+            p = pop()
+            state.storage_reads.add(p)
+            push(storage.sload(p))
+        elif op == 0x55:
+            p = pop()
+            storage.sstore(p, pop())
+            state.storage_writes.add(p)
+            state.has_side_effects = True
+        elif op == 0x56:
+            target = self._jump(pop())
+            if target is None:
+                return True, pc
+            return False, target
+        elif op == 0x57:
+            dest = pop()
+            condition = pop()
+            if condition:
+                target = self._jump(dest)
+                if target is None:
+                    return True, pc
+                return False, target
+            # fallthrough block, a JUMPDEST records its own visit
+            if self.coverage is not None and pc < len(self.program) and \
+                    not jumpdests[pc]:
+                self.coverage.visit(self.program.offset[pc])
+        elif op == 0x58:
+            push(self.program.offset[index])
+        elif op == 0x59:
+            push((len(memory) + 31) // 32 * 32)
+        elif op == 0x5a:
+            push(gas)
+        elif op == JUMPDEST:
+            if self.coverage is not None:
+                self.coverage.visit(self.program.offset[index])
+
+        # 0s: Stop and Arithmetic Operations
+        elif op == 0x00:
+            return True, pc
+        elif op == 0x01:
+            push((pop() + pop()) & TT256M1)
+        elif op == 0x02:
+            push((pop() * pop()) & TT256M1)
+        elif op == 0x03:
+            x = pop()
+            push((x - pop()) & TT256M1)
+        elif op == 0x04:
+            x = pop()
+            y = pop()
+            push(x // y if y else 0)
+        elif op == 0x05:
+            x = _signed(pop())
+            y = _signed(pop())
+            if not y:
+                push(0)
+            else:
+                sign = -1 if (x < 0) != (y < 0) else 1
+                push((sign * (abs(x) // abs(y))) & TT256M1)
+        elif op == 0x06:
+            x = pop()
+            y = pop()
+            push(x % y if y else 0)
+        elif op == 0x07:
+            x = _signed(pop())
+            y = _signed(pop())
+            if not y:
+                push(0)
+            else:
+                sign = -1 if x < 0 else 1
+                push((sign * (abs(x) % abs(y))) & TT256M1)
+        elif op == 0x08:
+            x = pop()
+            y = pop()
+            m = pop()
+            push((x + y) % m if m else 0)
+        elif op == 0x09:
+            x = pop()
+            y = pop()
+            m = pop()
+            push((x * y) % m if m else 0)
+        elif op == 0x0a:
+            x = pop()
+            push(pow(x, pop(), TT256))
+        elif op == 0x0b:
+            b = pop()
+            x = pop()
+            if b < 31:
+                bit = b * 8 + 7
+                if x & (1 << bit):
+                    x |= TT256 - (1 << bit)
+                else:
+                    x &= (1 << bit) - 1
+            push(x)
+
+        # 10s: Comparison & Bitwise Logic Operations
+        elif op == 0x10:
+            x = pop()
+            push(1 if x < pop() else 0)
+        elif op == 0x11:
+            x = pop()
+            push(1 if x > pop() else 0)
+        elif op == 0x12:
+            x = _signed(pop())
+            push(1 if x < _signed(pop()) else 0)
+        elif op == 0x13:
+            x = _signed(pop())
+            push(1 if x > _signed(pop()) else 0)
+        elif op == 0x14:
+            push(1 if pop() == pop() else 0)
+        elif op == 0x15:
+            push(0 if pop() else 1)
+        elif op == 0x16:
+            push(pop() & pop())
+        elif op == 0x17:
+            push(pop() | pop())
+        elif op == 0x18:
+            push(pop() ^ pop())
+        elif op == 0x19:
+            push(TT256M1 ^ pop())
+        elif op == 0x1a:
+            n = pop()
+            x = pop()
+            push((x >> (248 - n * 8)) & 0xff if n < 32 else 0)
+        elif op == 0x1b:
+            shift = pop()
+            x = pop()
+            push((x << shift) & TT256M1 if shift < 256 else 0)
+        elif op == 0x1c:
+            shift = pop()
+            x = pop()
+            push(x >> shift if shift < 256 else 0)
+        elif op == 0x1d:
+            shift = pop()
+            x = _signed(pop())
+            push((x >> min(shift, 255)) & TT256M1)
+
+        # 20s: SHA3
+        elif op == 0x20:
+            p = pop()
+            push(int.from_bytes(keccak(memory.mread(p, pop())), 'big'))
+
+        # 30s: Environmental Information
+        elif op == 0x35:
+            push(calldata.load(pop()))
+        elif op == 0x36:
+            push(len(calldata))
+        elif op == 0x37:
+            dest = pop()
+            p = pop()
+            calldata.copy_to(memory, dest, p, pop())
+        elif op == 0x34:
+            push(callinfo['callvalue'])
+        elif op == 0x38:
+            push(len(self.program.code))
+        elif op == 0x39:
+            dest = pop()
+            p = pop()
+            size = pop()
+            if size:
+                memory.mwrite(dest, self.program.code[p:p + size], size)
+        elif op == 0x3e:
+            dest = pop()
+            pop()
+            size = pop()
+            if size:
+                memory.mwrite(dest, b'', size)
+        elif op == 0x31 or op == 0x3b:
+            # BALANCE, EXTCODESIZE
+            addr = pop()
+            if op == 0x31:
+                state.balance_reads.add(addr)
+            else:
+                state.code_reads.add(addr)
+            push(UNKNOWN_VALUE)
+        elif op == 0x3c:
+            state.code_reads.add(pop())
+            dest = pop()
+            pop()
+            size = pop()
+            if size:
+                memory.mwrite(dest, b'', size)
+
+        # a0s: Logging Operations
+        elif 0xa0 <= op <= 0xa4:
+            for _ in range(op - 0xa0 + 2):
+                pop()
+            state.has_side_effects = True
+
+        # f0s: System Operations
+        elif op in (0xf3, 0xfd):
+            p = pop()
+            state.last_returned = memory.mread(p, pop())
+            return True, pc
+        elif op == 0xff:
+            pop()
+            state.has_side_effects = True
+            return True, pc
+        elif op in _SYSTEM_CALLS:
+            pops, _ = _STACK_EFFECT[op]
+            for _ in range(pops):
+                pop()
+            state.has_side_effects = True
+            push(UNKNOWN_VALUE)
+
+        # environment and block information only modelled by their
+        # stack effect
+        elif op in _STACK_EFFECT and (0x30 <= op <= 0x4f):
+            pops, pushes = _STACK_EFFECT[op]
+            for _ in range(pops):
+                pop()
+            for _ in range(pushes):
+                push(UNKNOWN_VALUE)
+
+        # INVALID & unknown opcodes
+        else:
+            return True, pc
+
+        return False, pc
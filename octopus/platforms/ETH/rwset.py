@@ -0,0 +1,75 @@
+'''
+Storage, balance and code accesses of an emulated call
+
+    state = engine.emulate(callinfo, state)
+    state.rw_set.storage_reads    # sorted tuple of slots
+'''
+
+import bisect
+
+WORD_SIZE = 32
+
+
+def pack_words(values):
+    '''Pack sorted 256 bits values as 32 bytes big-endian words'''
+    return b''.join(v.to_bytes(WORD_SIZE, byteorder='big') for v in values)
+
+
+def unpack_words(data):
+    return tuple(int.from_bytes(data[i:i + WORD_SIZE], byteorder='big')
+                 for i in range(0, len(data), WORD_SIZE))
+
+
+def sorted_intersect(a, b):
+    '''Return True if the sorted sequences a and b share a value'''
+    if len(a) > len(b):
+        a, b = b, a
+    for value in a:
+        index = bisect.bisect_left(b, value)
+        if index < len(b) and b[index] == value:
+            return True
+    return False
+
+
+class ReadWriteSet(object):
+    '''Sorted tuples of the accessed storage slots and addresses'''
+
+    __slots__ = ('storage_reads', 'storage_writes',
+                 'balance_reads', 'code_reads')
+
+    def __init__(self, storage_reads=(), storage_writes=(),
+                 balance_reads=(), code_reads=()):
+        self.storage_reads = tuple(sorted(storage_reads))
+        self.storage_writes = tuple(sorted(storage_writes))
+        self.balance_reads = tuple(sorted(balance_reads))
+        self.code_reads = tuple(sorted(code_reads))
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state.storage_reads, state.storage_writes,
+                   state.balance_reads, state.code_reads)
+
+    def reads_conflict_with(self, writes):
+        '''True if a slot read here is in the sorted sequence writes'''
+        return sorted_intersect(self.storage_reads, writes)
+
+    def conflicts_with(self, other):
+        '''True if the two calls can not be reordered'''
+        return sorted_intersect(self.storage_reads, other.storage_writes) or \
+            sorted_intersect(self.storage_writes, other.storage_reads) or \
+            sorted_intersect(self.storage_writes, other.storage_writes)
+
+    def pack(self):
+        '''Return the storage reads and writes as packed words'''
+        return pack_words(self.storage_reads), pack_words(self.storage_writes)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return 'ReadWriteSet(%s)' % ', '.join(
+            '%s=%s' % (name, [hex(v) for v in getattr(self, name)])
+            for name in self.__slots__)
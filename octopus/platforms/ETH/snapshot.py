@@ -0,0 +1,219 @@
+'''
+Compact binary snapshot of an EthereumVMstate
+
+Layout (all integers big-endian):
+
+    header     magic, version, flags, pc, gas and the size of each section
+    stack      stack_count words of 32 bytes, bottom first
+    memory     memory_size raw bytes
+    storage    storage_count (key, value) pairs of 32 bytes, sorted by key
+    returndata returndata_size raw bytes
+
+Sorted fixed-size storage records allow a slot to be looked up with a
+binary search directly on a memory-mapped file, without loading the
+whole section.
+'''
+
+import mmap
+import struct
+
+from octopus.core.memory import Memory
+from octopus.core.storage import Storage
+from octopus.platforms.ETH.constants import TT256M1
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+SNAPSHOT_MAGIC = b'OCTS'
+SNAPSHOT_VERSION = 1
+
+# magic, version, flags, pc, gas,
+# stack_count, memory_size, storage_count, returndata_size
+_HEADER = struct.Struct('>4sHHqqQQQQ')
+
+WORD_SIZE = 32
+STORAGE_RECORD_SIZE = 2 * WORD_SIZE
+
+
+class SnapshotFormatException(Exception):
+    """Exception raised when a snapshot can not be decoded"""
+    pass
+
+
+def _word(value):
+    return (value & TT256M1).to_bytes(WORD_SIZE, byteorder='big')
+
+
+def _encode(pc, gas, stack, memory, storage, returndata):
+    '''Return the list of byte chunks composing a snapshot'''
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, pc, gas,
+                          len(stack), len(memory), len(storage),
+                          len(returndata))
+    chunks = [header]
+    chunks.append(b''.join(_word(v) for v in stack))
+    chunks.append(bytes(memory))
+    chunks.append(b''.join(_word(k) + _word(storage[k])
+                           for k in sorted(storage)))
+    chunks.append(bytes(returndata))
+    return chunks
+
+
+def dumps_state(state):
+    '''Serialize the concrete part of an EthereumVMstate to bytes
+
+    SSA and symbolic stacks are not part of the snapshot.
+    '''
+    return b''.join(_encode(state.pc, state.gas, state._stack,
+                            state.memory, state.storage,
+                            state.last_returned))
+
+
+def dump_state(state, fp):
+    '''Write the snapshot of state to the binary file object fp'''
+    for chunk in _encode(state.pc, state.gas, state._stack,
+                         state.memory, state.storage,
+                         state.last_returned):
+        fp.write(chunk)
+
+
+def dumps_storage(storage):
+    '''Serialize a Storage (the world state shared between calls)'''
+    return b''.join(_encode(0, 0, [], b'', storage, b''))
+
+
+def dump_storage(storage, fp):
+    '''Write the snapshot of storage to the binary file object fp'''
+    for chunk in _encode(0, 0, [], b'', storage, b''):
+        fp.write(chunk)
+
+
+class StateSnapshot(object):
+    '''Read-only view over a serialized state
+
+    buf can be any object supporting the buffer protocol (bytes, mmap...).
+    Memory, storage and return data are exposed as zero-copy views and are
+    only decoded when accessed.
+    '''
+
+    def __init__(self, buf):
+        self._mmap = buf if isinstance(buf, mmap.mmap) else None
+        self.buffer = memoryview(buf)
+
+        if len(self.buffer) < _HEADER.size:
+            raise SnapshotFormatException('truncated header')
+        magic, version, self.flags, self.pc, self.gas, \
+            self.stack_count, self.memory_size, self.storage_count, \
+            self.returndata_size = _HEADER.unpack_from(self.buffer)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotFormatException('bad magic %r' % magic)
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotFormatException('unsupported version %d' % version)
+
+        self._stack_off = _HEADER.size
+        self._memory_off = self._stack_off + self.stack_count * WORD_SIZE
+        self._storage_off = self._memory_off + self.memory_size
+        self._returndata_off = self._storage_off + \
+            self.storage_count * STORAGE_RECORD_SIZE
+        if self._returndata_off + self.returndata_size > len(self.buffer):
+            raise SnapshotFormatException('truncated snapshot')
+
+    @classmethod
+    def open(cls, path):
+        '''Memory-map the snapshot file located at path'''
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        self.buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def stack(self):
+        off = self._stack_off
+        return [int.from_bytes(self.buffer[i:i + WORD_SIZE], byteorder='big')
+                for i in range(off, self._memory_off, WORD_SIZE)]
+
+    @property
+    def memory(self):
+        return self.buffer[self._memory_off:self._storage_off]
+
+    @property
+    def return_data(self):
+        off = self._returndata_off
+        return self.buffer[off:off + self.returndata_size]
+
+    def _storage_key(self, index):
+        off = self._storage_off + index * STORAGE_RECORD_SIZE
+        return bytes(self.buffer[off:off + WORD_SIZE])
+
+    def sload(self, key):
+        '''Binary search of a storage slot, return 0 if missing'''
+        needle = _word(key)
+        lo, hi = 0, self.storage_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._storage_key(mid) < needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.storage_count and self._storage_key(lo) == needle:
+            off = self._storage_off + lo * STORAGE_RECORD_SIZE + WORD_SIZE
+            return int.from_bytes(self.buffer[off:off + WORD_SIZE],
+                                  byteorder='big')
+        return 0
+
+    def storage_items(self):
+        '''Iterate over (key, value) storage pairs in key order'''
+        for off in range(self._storage_off, self._returndata_off,
+                         STORAGE_RECORD_SIZE):
+            yield (int.from_bytes(self.buffer[off:off + WORD_SIZE],
+                                  byteorder='big'),
+                   int.from_bytes(self.buffer[off + WORD_SIZE:
+                                              off + STORAGE_RECORD_SIZE],
+                                  byteorder='big'))
+
+    def restore_storage(self, storage=None):
+        '''Fill storage (a new Storage by default) with the snapshot slots'''
+        storage = Storage() if storage is None else storage
+        storage.update(self.storage_items())
+        return storage
+
+    def restore(self, storage=None):
+        '''Build a new EthereumVMstate from the snapshot'''
+        state = EthereumVMstate(gas=self.gas)
+        state.pc = self.pc
+        state._stack = self.stack
+        state.memory = Memory()
+        state.memory.extend(self.memory)
+        state.storage = self.restore_storage(storage)
+        state.last_returned = bytes(self.return_data)
+        return state
+
+
+def loads_state(data):
+    '''Rebuild an EthereumVMstate from bytes produced by dumps_state'''
+    return StateSnapshot(data).restore()
+
+
+def load_state(path):
+    '''Rebuild an EthereumVMstate from a snapshot file'''
+    with StateSnapshot.open(path) as snapshot:
+        return snapshot.restore()
+
+
+def loads_storage(data):
+    '''Rebuild a Storage from bytes produced by dumps_storage'''
+    return StateSnapshot(data).restore_storage()
+
+
+def load_storage(path):
+    '''Rebuild a Storage from a snapshot file'''
+    with StateSnapshot.open(path) as snapshot:
+        return snapshot.restore_storage()
@@ -1,4 +1,5 @@
 from octopus.engine.helper import helper as hlp
+from octopus.platforms.ETH.constants import TT256
 from z3 import UDiv, ULT, UGT
 
 from logging import getLogger
@@ -34,6 +35,9 @@ class EthereumSSASimplifier(object):
             'AND': self.operate_AND,
             'OR': self.operate_OR,
             'XOR': self.operate_XOR,
+            'SHL': self.operate_SHL,
+            'SHR': self.operate_SHR,
+            'SAR': self.operate_SAR,
             # 'NOT': self.operate_NOT,
             # 'BYTE': self.operate_BYTE,
         }
@@ -159,6 +163,18 @@ class EthereumSSASimplifier(object):
         s1 = hlp.convert_to_bitvec(values[1])
         return hlp.get_concrete_int(s0 ^ s1)
 
+    def operate_SHL(self, *values):
+        shift, value = values[0], values[1]
+        return (value << shift) % TT256 if shift < 256 else 0
+
+    def operate_SHR(self, *values):
+        shift, value = values[0], values[1]
+        return value >> shift if shift < 256 else 0
+
+    def operate_SAR(self, *values):
+        shift, value = values[0], hlp.to_signed(values[1])
+        return (value >> min(shift, 255)) % TT256
+
     # def operate_NOT(self, *values):
     #    return hlp.get_concrete_int(values[0] & values[1])
 
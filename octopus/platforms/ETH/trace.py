@@ -0,0 +1,403 @@
+'''
+Execution tracers for EthereumEmulatorEngine
+
+A tracer is any object providing:
+
+    before_instruction(instr, state, depth)
+    after_instruction(instr, state, depth, halt)
+
+and registered with engine.tracers.append(tracer).
+
+When the gas left can not pay an instruction, the engine sets
+state.out_of_gas and calls after_instruction with halt=True without
+executing it.
+'''
+
+import struct
+import sys
+from array import array
+
+from octopus.platforms.ETH.constants import TT256M1
+
+
+class Tracer(object):
+    '''Base tracer, does nothing'''
+
+    def before_instruction(self, instr, state, depth):
+        pass
+
+    def after_instruction(self, instr, state, depth, halt):
+        pass
+
+
+# opcode: (stack index of the memory offset, stack index of the size,
+#          fixed size used when the size index is None)
+MEMORY_WRITES = {
+    0x52: (-1, None, 32),   # MSTORE
+    0x53: (-1, None, 1),    # MSTORE8
+    0x37: (-1, -3, 0),      # CALLDATACOPY
+    0x39: (-1, -3, 0),      # CODECOPY
+    0x3e: (-1, -3, 0),      # RETURNDATACOPY
+    0x3c: (-2, -4, 0),      # EXTCODECOPY
+}
+SSTORE = 0x55
+OUT_OF_GAS = 'out of gas'
+
+
+def _stack_needed(write):
+    '''Number of stack items needed to decode a MEMORY_WRITES entry'''
+    offset_idx, size_idx, _ = write
+    return max(-offset_idx, -size_idx if size_idx is not None else 0)
+
+
+# =======================================
+# #     Columnar (structure of arrays)  #
+# =======================================
+
+TRACE_MAGIC = b'OCTT'
+TRACE_VERSION = 1
+
+# magic, version
+_FILE_HEADER = struct.Struct('<4sH')
+# first step index, steps, storage deltas, memory blob size
+_CHUNK_HEADER = struct.Struct('<QIIQ')
+
+# column name: (array typecode, numpy dtype), all little-endian
+STEP_COLUMNS = (('pc', 'I', '<u4'),
+                ('opcode', 'B', 'u1'),
+                ('gas', 'q', '<i8'),
+                ('stack_depth', 'H', '<u2'),
+                ('mem_offset', 'Q', '<u8'),
+                ('mem_size', 'I', '<u4'))
+STORAGE_COLUMNS = (('storage_step', 'Q', '<u8'),)
+WORD_SIZE = 32
+
+
+def _column_bytes(column):
+    if sys.byteorder != 'little' and column.itemsize > 1:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class ColumnarTraceRecorder(object):
+    '''Record one row per executed instruction in parallel columns
+
+    Step columns: pc (byte offset), opcode, gas (before the instruction),
+    stack depth, top of stack word and the memory range written by the
+    instruction (mem_size is 0 when memory is untouched). The written bytes
+    are appended to a memory blob column. SSTOREs are kept in a separate
+    sparse table (step index, key, value).
+
+    Columns are flushed to fp every chunk_size steps, see load_trace.
+    failed and error are set when the execution runs out of gas, the last
+    row is then the instruction that could not be paid.
+    '''
+
+    def __init__(self, fp, chunk_size=65536):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.steps = 0
+        self.failed = False
+        self.error = None
+        self._chunk_start = 0
+        self._pending_write = None
+        self._reset_columns()
+        self.fp.write(_FILE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+
+    def _reset_columns(self):
+        self.columns = {name: array(code) for name, code, _ in
+                        STEP_COLUMNS + STORAGE_COLUMNS}
+        self.top_of_stack = bytearray()
+        self.mem_data = bytearray()
+        self.storage_keys = bytearray()
+        self.storage_values = bytearray()
+
+    def before_instruction(self, instr, state, depth):
+        columns = self.columns
+        stack = state._stack
+        opcode = instr.opcode
+
+        columns['pc'].append(instr.offset)
+        columns['opcode'].append(opcode)
+        columns['gas'].append(state.gas)
+        columns['stack_depth'].append(len(stack))
+        if stack:
+            self.top_of_stack += (stack[-1] & TT256M1).to_bytes(
+                WORD_SIZE, byteorder='big')
+        else:
+            self.top_of_stack += bytes(WORD_SIZE)
+
+        write = MEMORY_WRITES.get(opcode)
+        if write is not None and len(stack) >= _stack_needed(write):
+            offset_idx, size_idx, size = write
+            if size_idx is not None:
+                size = stack[size_idx]
+            self._pending_write = (stack[offset_idx], size)
+        else:
+            self._pending_write = None
+
+        if opcode == SSTORE and len(stack) >= 2:
+            columns['storage_step'].append(self.steps)
+            self.storage_keys += (stack[-1] & TT256M1).to_bytes(
+                WORD_SIZE, byteorder='big')
+            self.storage_values += (stack[-2] & TT256M1).to_bytes(
+                WORD_SIZE, byteorder='big')
+
+    def after_instruction(self, instr, state, depth, halt):
+        columns = self.columns
+        if state.out_of_gas:
+            # not executed, nothing written
+            self.failed = True
+            self.error = OUT_OF_GAS
+            self._pending_write = None
+        if self._pending_write is not None:
+            offset, size = self._pending_write
+            data = state.memory[offset:offset + size]
+            columns['mem_offset'].append(offset)
+            columns['mem_size'].append(len(data))
+            self.mem_data += data
+        else:
+            columns['mem_offset'].append(0)
+            columns['mem_size'].append(0)
+
+        self.steps += 1
+        if self.steps - self._chunk_start >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''Write the pending rows as one chunk'''
+        columns = self.columns
+        n_steps = len(columns['pc'])
+        if not n_steps:
+            return
+        self.fp.write(_CHUNK_HEADER.pack(self._chunk_start, n_steps,
+                                         len(columns['storage_step']),
+                                         len(self.mem_data)))
+        for name, _, _ in STEP_COLUMNS:
+            self.fp.write(_column_bytes(columns[name]))
+        self.fp.write(self.top_of_stack)
+        self.fp.write(self.mem_data)
+        for name, _, _ in STORAGE_COLUMNS:
+            self.fp.write(_column_bytes(columns[name]))
+        self.fp.write(self.storage_keys)
+        self.fp.write(self.storage_values)
+
+        self._chunk_start = self.steps
+        self._reset_columns()
+
+    def close(self):
+        self.flush()
+        self.fp.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_trace_chunks(fp):
+    '''Yield each chunk of a columnar trace as a dict of raw buffers
+
+    Step columns are returned as array.array, top_of_stack, mem_data,
+    storage_keys and storage_values as bytes (32 bytes per word).
+    '''
+    magic, version = _FILE_HEADER.unpack(fp.read(_FILE_HEADER.size))
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError('not a columnar trace (version %d)' % version)
+
+    while True:
+        header = fp.read(_CHUNK_HEADER.size)
+        if not header:
+            break
+        start, n_steps, n_storage, mem_size = _CHUNK_HEADER.unpack(header)
+        chunk = {'start': start}
+        for name, code, _ in STEP_COLUMNS:
+            chunk[name] = _read_column(fp, code, n_steps)
+        chunk['top_of_stack'] = fp.read(n_steps * WORD_SIZE)
+        chunk['mem_data'] = fp.read(mem_size)
+        for name, code, _ in STORAGE_COLUMNS:
+            chunk[name] = _read_column(fp, code, n_storage)
+        chunk['storage_keys'] = fp.read(n_storage * WORD_SIZE)
+        chunk['storage_values'] = fp.read(n_storage * WORD_SIZE)
+        yield chunk
+
+
+def _read_column(fp, code, count):
+    column = array(code)
+    column.frombytes(fp.read(count * column.itemsize))
+    if sys.byteorder != 'little' and column.itemsize > 1:
+        column.byteswap()
+    return column
+
+
+def load_trace(path):
+    '''Load a whole columnar trace file as a dict of numpy arrays
+
+    top_of_stack, storage_keys and storage_values are (n, 32) uint8
+    arrays of big-endian words. Require numpy.
+    '''
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, version = _FILE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError('not a columnar trace (version %d)' % version)
+
+    parts = {name: [] for name, _, _ in STEP_COLUMNS + STORAGE_COLUMNS}
+    for name in ('top_of_stack', 'mem_data', 'storage_keys',
+                 'storage_values'):
+        parts[name] = []
+
+    off = _FILE_HEADER.size
+    while off < len(data):
+        start, n_steps, n_storage, mem_size = \
+            _CHUNK_HEADER.unpack_from(data, off)
+        off += _CHUNK_HEADER.size
+        for name, _, dtype in STEP_COLUMNS:
+            column = np.frombuffer(data, dtype=dtype, count=n_steps,
+                                   offset=off)
+            parts[name].append(column)
+            off += column.nbytes
+        parts['top_of_stack'].append(np.frombuffer(
+            data, dtype='u1', count=n_steps * WORD_SIZE,
+            offset=off).reshape(-1, WORD_SIZE))
+        off += n_steps * WORD_SIZE
+        parts['mem_data'].append(np.frombuffer(data, dtype='u1',
+                                               count=mem_size, offset=off))
+        off += mem_size
+        for name, _, dtype in STORAGE_COLUMNS:
+            column = np.frombuffer(data, dtype=dtype, count=n_storage,
+                                   offset=off)
+            parts[name].append(column)
+            off += column.nbytes
+        for name in ('storage_keys', 'storage_values'):
+            parts[name].append(np.frombuffer(
+                data, dtype='u1', count=n_storage * WORD_SIZE,
+                offset=off).reshape(-1, WORD_SIZE))
+            off += n_storage * WORD_SIZE
+
+    return {name: np.concatenate(chunks) if chunks else np.empty(0)
+            for name, chunks in parts.items()}
+
+
+# =======================================
+# #     geth structLog (JSON stream)    #
+# =======================================
+
+SLOAD = 0x54
+FAILED_HALTS = ('REVERT', 'INVALID')
+
+
+class StructLogWriter(object):
+    '''Stream a geth debug_traceTransaction compatible JSON document
+
+    Each instruction is written to fp (any text file object) as soon as it
+    is executed. Sections disabled with disable_stack, disable_memory or
+    disable_storage are never computed. The document is terminated by
+    close() with the gas used, failed status and return value. As geth,
+    the instruction that runs out of gas has an error field.
+    '''
+
+    def __init__(self, fp, disable_stack=False, disable_memory=False,
+                 disable_storage=False):
+        self.fp = fp
+        self.disable_stack = disable_stack
+        self.disable_memory = disable_memory
+        self.disable_storage = disable_storage
+
+        self.first_gas = None
+        self.last_gas = None
+        self.failed = False
+        self.error = None
+        self.return_value = b''
+        # storage slots touched so far, as geth reports them
+        self.storage = dict()
+        self._separator = ''
+        # the last structLog is closed once executed
+        self._open = False
+        self.fp.write('{"structLogs":[')
+
+    @classmethod
+    def from_config(cls, fp, config):
+        '''Build a writer from a geth tracer config dict
+        ex: {"disableStack": True, "disableMemory": True}
+        '''
+        return cls(fp,
+                   disable_stack=config.get('disableStack', False),
+                   disable_memory=config.get('disableMemory', False),
+                   disable_storage=config.get('disableStorage', False))
+
+    @classmethod
+    def to_socket(cls, sock, **kwargs):
+        '''Stream the trace to a connected socket'''
+        return cls(sock.makefile('w', encoding='utf-8'), **kwargs)
+
+    def before_instruction(self, instr, state, depth):
+        if self.first_gas is None:
+            self.first_gas = state.gas
+
+        out = '%s{"pc":%d,"op":"%s","gas":%d,"gasCost":%d,"depth":%d' % \
+            (self._separator, instr.offset, instr.name, state.gas,
+             instr.fee, depth + 1)
+
+        if not self.disable_stack:
+            out += ',"stack":[%s]' % ','.join(
+                '"%s"' % hex(v & TT256M1) for v in state._stack)
+
+        if not self.disable_memory:
+            memory = state.memory.hex()
+            out += ',"memory":[%s]' % ','.join(
+                '"%s"' % memory[i:i + 64] for i in range(0, len(memory), 64))
+
+        if not self.disable_storage and instr.opcode in (SLOAD, SSTORE) \
+                and state._stack:
+            key = state._stack[-1] & TT256M1
+            if instr.opcode == SSTORE:
+                value = state._stack[-2] if len(state._stack) > 1 else 0
+            else:
+                value = state.storage.get(key, 0)
+            self.storage['%064x' % key] = '%064x' % (value & TT256M1)
+            out += ',"storage":{%s}' % ','.join(
+                '"%s":"%s"' % item for item in self.storage.items())
+
+        self.fp.write(out)
+        self._separator = ','
+        self._open = True
+
+    def after_instruction(self, instr, state, depth, halt):
+        if state.out_of_gas:
+            # geth reports all the gas of the call as used
+            self.last_gas = 0
+            self.failed = True
+            self.error = OUT_OF_GAS
+            self.fp.write(',"error":"%s"}' % OUT_OF_GAS)
+            self._open = False
+            return
+        self.last_gas = state.gas
+        self.fp.write('}')
+        self._open = False
+        if halt:
+            self.failed = instr.name in FAILED_HALTS
+            self.return_value = state.last_returned
+
+    def close(self):
+        if self._open:
+            self.fp.write('}')
+            self._open = False
+        gas = 0
+        if self.first_gas is not None:
+            gas = self.first_gas - (self.last_gas or 0)
+        self.fp.write('],"gas":%d,"failed":%s,"returnValue":"%s"}' %
+                      (gas, 'true' if self.failed else 'false',
+                       bytes(self.return_value).hex()))
+        self.fp.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
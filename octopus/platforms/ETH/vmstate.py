@@ -1,4 +1,5 @@
 from octopus.engine.engine import VMstate
+from octopus.core.calldata import Calldata
 from octopus.core.memory import Memory
 from octopus.core.storage import Storage
 
@@ -12,6 +13,7 @@ class EthereumVMstate(VMstate):
         # cumtom code block 
         self.memory = Memory()
         self._stack = []
+        self.calldata = Calldata()
         # custom code block end
 
         self.stack = []
@@ -20,9 +22,21 @@ class EthereumVMstate(VMstate):
 
         self.last_returned = []
         self.gas = gas
+        self.out_of_gas = False
         self.pc = 0
         self.instr = None
 
+        # storage slots loaded and whether the execution did a SSTORE,
+        # LOG, CALL or CREATE
+        self.storage_reads = set()
+        self.has_side_effects = False
+        # storage slots stored, addresses of BALANCE and EXTCODE*
+        self.storage_writes = set()
+        self.balance_reads = set()
+        self.code_reads = set()
+        # sorted accesses, set at the end of emulate (ReadWriteSet)
+        self.rw_set = None
+
         self.instructions_visited = list()
         #self.instructions_visited = dict()
 
@@ -0,0 +1,58 @@
+from octopus.core.storage import Storage
+from octopus.platforms.ETH.batch import execute_batch
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+# storage[calldata[0:32]] += 1, then read slot 100
+# PUSH1 0 CALLDATALOAD DUP1 SLOAD PUSH1 1 ADD SWAP1 SSTORE
+# PUSH1 100 SLOAD POP STOP
+INCREMENT = '600035805460010190556064545000'
+# JUMP on an empty stack, raises in the engine
+UNDERFLOW = '56'
+
+
+def _transactions():
+    return [(INCREMENT, {'calldata': (i % 7).to_bytes(32, 'big'),
+                         'callvalue': 0}) for i in range(40)]
+
+
+def _initial_storage():
+    storage = Storage()
+    storage.sstore(3, 10)
+    return storage
+
+
+def _sequential(transactions):
+    storage = _initial_storage()
+    engines = dict()
+    for bytecode, callinfo in transactions:
+        engine = engines.get(bytecode)
+        if engine is None:
+            engine = engines[bytecode] = EthereumSSAEngine(bytecode,
+                                                           verbose=False)
+        state = EthereumVMstate()
+        state.storage = storage
+        engine.emulate(callinfo, state)
+    return storage
+
+
+def test_batch_matches_sequential():
+    transactions = _transactions()
+    expected = dict(_sequential(transactions))
+    for workers in (1, 2):
+        storage = _initial_storage()
+        results = execute_batch(transactions, storage, workers=workers)
+        assert dict(storage) == expected
+        assert [r.index for r in results] == list(range(len(transactions)))
+        assert all(r.error is None for r in results)
+        assert any(r.reexecuted for r in results)
+
+
+def test_failing_transaction_is_not_committed():
+    transactions = _transactions()[:3]
+    storage = _initial_storage()
+    results = execute_batch(transactions + [(UNDERFLOW, {})] +
+                            transactions, storage, workers=1)
+    assert results[3].error.startswith('IndexError')
+    assert dict(storage) == dict(_sequential(transactions + transactions))
@@ -0,0 +1,49 @@
+from octopus.core.storage import Storage
+from octopus.platforms.ETH.cache import CallResultCache, ViewMonitor
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+# PUSH1 0 SLOAD STOP: the value of slot 0 is left on the stack
+SLOAD_SLOT_0 = '60005400'
+
+
+def _call(engine, value):
+    state = EthereumVMstate()
+    state.storage = Storage()
+    state.storage.sstore(0, value)
+    return engine.emulate({'calldata': b'', 'callvalue': 0}, state)
+
+
+def test_different_storages_same_version():
+    engine = EthereumSSAEngine(SLOAD_SLOT_0, verbose=False)
+    engine.result_cache = CallResultCache()
+
+    assert _call(engine, 5)._stack == [5]
+    # same slot version (1) in another storage holding another value
+    assert _call(engine, 7)._stack == [7]
+    assert engine.result_cache.hits == 0
+
+    assert _call(engine, 5)._stack == [5]
+    assert engine.result_cache.hits == 1
+
+
+def test_view_monitor_ignores_own_writes():
+    storage = Storage()
+    monitor = ViewMonitor(storage)
+    # SSTORE(0, SLOAD(0) + 1) STOP
+    counter = monitor.add(EthereumSSAEngine('60005460010160005500',
+                                            verbose=False),
+                          {'calldata': b''})
+    reader = monitor.add(EthereumSSAEngine(SLOAD_SLOT_0, verbose=False),
+                         {'calldata': b''})
+    assert monitor.refresh() == [counter, reader]
+    assert monitor.results[reader]._stack == [1]
+
+    # the counter writes the slot it reads, only the reader is stale
+    assert monitor.refresh() == []
+    monitor.dirty.add(counter)
+    assert monitor.refresh() == [counter]
+    assert monitor.dirty == {reader}
+    assert monitor.refresh() == [reader]
+    assert monitor.results[reader]._stack == [2]
@@ -0,0 +1,74 @@
+import os
+import random
+
+import pytest
+
+from benchmarks.contracts import sized_contract
+from octopus.arch.evm.cfg import EvmCFG, enum_blocks_static
+from octopus.arch.evm.codemap import build_code_map, build_code_maps
+from octopus.arch.evm.disassembler import EvmDisassembler
+from octopus.core.utils import bytecode_to_bytes
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+
+# the code maps require numpy
+np = pytest.importorskip('numpy')
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _codes():
+    with open(os.path.join(ROOT, 'ctf.bytecode')) as f:
+        ctf = f.read().strip()
+    rng = random.Random(1)
+    return [ctf, sized_contract(4096)[0], '60', '7f01', '', '5b5b00fe5b',
+            '5b605b5b'] + \
+        [bytes(rng.randrange(256) for _ in range(rng.randrange(1, 2000)))
+         for _ in range(20)]
+
+
+def _reference(code):
+    '''(instruction starts, valid JUMPDEST, block leaders) of the
+    disassembler
+    '''
+    code = bytes(bytecode_to_bytes(code))
+    if not code:
+        return [], [], []
+    instructions = list(EvmDisassembler(code).iter_instructions(
+        analysis=False))
+    starts = [i.offset for i in instructions]
+    jumpdests = [i.offset for i in instructions if i.name == 'JUMPDEST']
+    leaders = [b.start_offset for b in enum_blocks_static(instructions)]
+    return starts, jumpdests, leaders
+
+
+def test_code_maps_match_disassembler():
+    codes = _codes()
+    for code, code_map in zip(codes, build_code_maps(codes)):
+        starts, jumpdests, leaders = _reference(code)
+        assert np.flatnonzero(code_map.code_mask).tolist() == starts
+        assert np.flatnonzero(code_map.jumpdests).tolist() == jumpdests
+        assert code_map.leaders.tolist() == leaders
+        assert build_code_map(code).leaders.tolist() == leaders
+
+
+def test_cfg_and_engine_with_code_map():
+    bytecode, _ = sized_contract(4096)
+    code_map = build_code_map(bytecode)
+    for analysis in ('static', 'dynamic'):
+        expected = EvmCFG(bytecode, analysis=analysis)
+        cfg = EvmCFG(bytecode, analysis=analysis, code_map=code_map)
+        assert [b.start_offset for b in cfg.basicblocks] == \
+            [b.start_offset for b in expected.basicblocks]
+
+    engine = EthereumSSAEngine(bytecode, verbose=False, code_map=code_map)
+    for offset in range(len(bytecode) // 2 + 1):
+        instr = engine.instruction_at(offset)
+        assert engine.is_jumpdest(offset) == \
+            (instr is not None and instr.name == 'JUMPDEST')
+
+    with pytest.raises(ValueError):
+        EvmCFG(bytecode, code_map=build_code_map(bytecode + '00'))
+    with pytest.raises(ValueError):
+        EthereumSSAEngine(bytecode, verbose=False,
+                          code_map=build_code_map(bytecode + '00'))
@@ -0,0 +1,35 @@
+import io
+import json
+
+from octopus.platforms.ETH.corpus import iter_lines, process_corpus
+
+
+# PUSH1 4 JUMP JUMPDEST STOP
+CODE = '6004565b00'
+
+LINES = ['{"name": "a", "bytecode": "%s"}' % CODE,
+         '{"name": "int", "bytecode": 5}',
+         '{"name": "list", "bytecode": [96, 0]}',
+         '{"name": "dict", "bytecode": {"hex": "%s"}}' % CODE,
+         '{"name": "nohex", "bytecode": "zz"}',
+         '{"name": "nofield"}',
+         '{not json',
+         '6005565b00',
+         '{"name": "b", "code": "0x%s"}' % CODE]
+
+
+def _run(workers):
+    out = io.StringIO()
+    contracts = iter_lines(io.StringIO('\n'.join(LINES) + '\n'))
+    stats = process_corpus(contracts, out, workers=workers)
+    return stats, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_bad_lines_are_skipped():
+    for workers in (1, 2):
+        stats, records = _run(workers)
+        assert stats == {'inputs': 3, 'unique': 2, 'duplicates': 1,
+                         'errors': 0}
+        assert sorted(r['name'] for r in records) == ['7', 'a', 'b']
+        duplicate = next(r for r in records if 'duplicate_of' in r)
+        assert duplicate['name'] == 'b' and duplicate['duplicate_of'] == 'a'
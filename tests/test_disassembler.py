@@ -0,0 +1,51 @@
+import io
+import os
+import re
+
+from benchmarks.contracts import assemble, sized_contract
+from octopus.arch.evm.cfg import enum_func_static
+from octopus.arch.evm.disassembler import EvmDisassembler
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _short_selectors():
+    '''SHR prologue, selectors with leading zero bytes (PUSH1/PUSH3)
+    and a binary search split which is not a function
+    '''
+    program = [('PUSH1', 0), 'CALLDATALOAD', ('PUSH1', 0xe0), 'SHR',
+               'DUP1', ('PUSH4', 0x80000000), 'GT', ('PUSH1', 0x24), 'JUMPI',
+               'DUP1', ('PUSH1', 0x2a), 'EQ', ('PUSH1', 0x29), 'JUMPI',
+               'DUP1', ('PUSH3', 0xabcdef), 'EQ', ('PUSH1', 0x2e), 'JUMPI',
+               ('PUSH1', 0), 'DUP1', 'REVERT',
+               'JUMPDEST', ('PUSH1', 0), 'DUP1', 'REVERT']
+    code = assemble(program)
+    bodies = assemble(['JUMPDEST', ('PUSH1', 1), 'STOP', 'STOP',
+                       'JUMPDEST', ('PUSH1', 2), 'STOP'])
+    return (code + bodies).hex()
+
+
+def _labels(bytecode):
+    fp = io.StringIO()
+    EvmDisassembler(bytecode).write(fp, offsets=True)
+    text = fp.getvalue()
+    # function label and offset of the next instruction
+    return re.findall(r'func_([0-9a-f]+):\nblock_([0-9a-f]+):', text)
+
+
+def _functions(bytecode):
+    instructions = EvmDisassembler(bytecode).disassemble()
+    return [('%x' % f.selector, '%x' % f.start_offset)
+            for f in enum_func_static(instructions)[1:]]
+
+
+def test_annotator_matches_enum_func_static():
+    with open(os.path.join(ROOT, 'ctf.bytecode')) as f:
+        ctf = f.read().strip()
+    short = _short_selectors()
+    for bytecode in (ctf, sized_contract(4096)[0], short):
+        functions = _functions(bytecode)
+        assert functions
+        assert _labels(bytecode) == functions
+    assert [sign for sign, _ in _functions(short)] == ['2a', 'abcdef']
@@ -0,0 +1,56 @@
+import os
+
+from benchmarks.contracts import sized_contract
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(bytecode, calldatas, fast_entry):
+    '''Final (name, return data, storage, stack) and step count of
+    every call
+    '''
+    engine = EthereumSSAEngine(bytecode, verbose=False,
+                               fast_entry=fast_entry)
+    results = list()
+    for calldata in calldatas:
+        engine.states = dict()
+        engine.states_total = 0
+        state = engine.emulate({'calldata': calldata, 'callvalue': 0},
+                               EthereumVMstate())
+        results.append(((state.instr.name, bytes(state.last_returned),
+                         dict(state.storage), state._stack),
+                        engine.states_total))
+    return engine, results
+
+
+def _assert_same(bytecode, calldatas):
+    _, full = _run(bytecode, calldatas, False)
+    engine, fast = _run(bytecode, calldatas, True)
+    assert engine.dispatch is not None
+    for (expected, full_steps), (result, fast_steps) in zip(full, fast):
+        assert result == expected
+        assert fast_steps <= full_steps
+    return engine
+
+
+def test_fast_entry_matches_full_execution():
+    bytecode, selectors = sized_contract(4096)
+    calldatas = [selector.to_bytes(4, 'big') + (42).to_bytes(32, 'big')
+                 for selector in selectors]
+    # unknown selector and short calldata run the whole dispatcher
+    engine = _assert_same(bytecode, calldatas + [b'\xde\xad\xbe\xef',
+                                                 b'\x12'])
+    assert engine.dispatch.hits == len(selectors)
+    assert engine.dispatch.misses == 2
+
+
+def test_fast_entry_matches_on_ctf():
+    with open(os.path.join(ROOT, 'ctf.bytecode')) as f:
+        bytecode = f.read().strip()
+    calldatas = [bytes.fromhex('c6c58bcd') + bytes(32),
+                 bytes.fromhex('fc0e74d1') + bytes(32),
+                 bytes.fromhex('12345678')]
+    _assert_same(bytecode, calldatas)
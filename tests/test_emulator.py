@@ -0,0 +1,30 @@
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.program import Program, ProgramEmulator
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+# i = 60000; do i -= 1 while i; SSTORE(0, i), more than the default
+# 1000000 gas of EthereumVMstate
+# PUSH2 60000 JUMPDEST PUSH1 1 SWAP1 SUB DUP1 PUSH1 3 JUMPI
+# PUSH1 0 SSTORE STOP
+LOOP = '61ea605b600190038060035760005500'
+
+
+def _engine_run(callinfo):
+    engine = EthereumSSAEngine(LOOP, verbose=False)
+    return engine.emulate(callinfo, EthereumVMstate())
+
+
+def _program_run(callinfo):
+    return ProgramEmulator(Program.from_bytecode(LOOP)).emulate(callinfo)
+
+
+def test_gas_is_only_enforced_with_a_limit():
+    for run in (_engine_run, _program_run):
+        state = run({'calldata': b''})
+        assert not state.out_of_gas
+        assert state.storage[0] == 0
+
+        state = run({'calldata': b'', 'gas': 1000})
+        assert state.out_of_gas
+        assert 0 not in state.storage
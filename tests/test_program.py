@@ -0,0 +1,129 @@
+import os
+
+from benchmarks.contracts import (OPCODE_CLASSES, jump_contract,
+                                  opcode_class_contract, sized_contract)
+from octopus.arch.evm.disassembler import EvmDisassembler
+from octopus.core.utils import bytecode_to_bytes
+from octopus.platforms.ETH.coverage import CoverageMap
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.program import Program, ProgramEmulator
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# creation code of ctf.bytecode, as in demo.py
+CTF_INIT = (
+    '608060405234801561001057600080fd5b5060008054600160a060020a03191633'
+    '17815560036002557feb3effabe9960401da2b4dbf9e92b0b40569c5f005f81491'
+    'c9d92f574adb5b0b907f7e782580d29c5c8c2fc261c858906ff320bd5d2e005b56'
+    '69cc140d42f15d9b08905b60108110156100845791811881019160010161006d56'
+    '5b505060015561023e806100986000396000f300')
+CTF_CALLDATA = bytecode_to_bytes(
+    '0xc6c58bcd95529edd28cb526ab5071fd2fdebd5fc4e08b2af6876dd33a57764a9'
+    '70157576')
+
+
+def _final(state):
+    return (state.instr.name, state.instr.offset, bytes(state.last_returned),
+            dict(state.storage), state._stack, state.gas,
+            state.out_of_gas)
+
+
+def _both(bytecode, callinfo, storage=None):
+    '''Final (engine, program) states of the same call'''
+    results = list()
+    for emulate in (EthereumSSAEngine(bytecode, verbose=False).emulate,
+                    ProgramEmulator(Program.from_bytecode(bytecode)).emulate):
+        state = EthereumVMstate()
+        if storage:
+            state.storage.update(storage)
+        results.append(_final(emulate(callinfo, state)))
+    return results
+
+
+def _assert_same(bytecode, callinfo, storage=None):
+    engine, program = _both(bytecode, callinfo, storage)
+    assert program == engine
+    return engine
+
+
+def test_decoding_matches_disassembler():
+    bytecode, _ = sized_contract(2048)
+    program = Program.from_bytecode(bytecode)
+    instructions = EvmDisassembler(bytecode).disassemble()
+    assert len(program) == len(instructions)
+    for index, instr in enumerate(instructions):
+        assert program.offset[index] == instr.offset
+        assert program.opcode[index] == instr.opcode
+
+    # truncated PUSH2 at the end of the code
+    program = Program.from_bytecode('6112')
+    instr = EvmDisassembler('6112').disassemble()[0]
+    assert program.values[program.operand[0]] == \
+        instr.operand_interpretation == 0x12
+
+
+def test_ctf_matches_engine():
+    final = _assert_same(CTF_INIT, {'calldata': None, 'callvalue': 0})
+    storage = final[3]
+    with open(os.path.join(ROOT, 'ctf.bytecode')) as f:
+        runtime = f.read().strip()
+    _assert_same(runtime, {'calldata': CTF_CALLDATA, 'callvalue': 0},
+                 storage)
+
+
+def test_sized_contract_matches_engine():
+    bytecode, selectors = sized_contract(4096)
+    for selector in selectors[:3] + selectors[-2:] + [0xdeadbeef]:
+        calldata = selector.to_bytes(4, 'big') + (42).to_bytes(32, 'big')
+        _assert_same(bytecode, {'calldata': calldata, 'callvalue': 0})
+
+
+def test_opcode_classes_match_engine():
+    for name in sorted(OPCODE_CLASSES):
+        _assert_same(opcode_class_contract(name, repeat=20),
+                     {'calldata': b'', 'callvalue': 0})
+    _assert_same(jump_contract(repeat=20), {'calldata': b'', 'callvalue': 0})
+
+
+def test_code_copy_matches_engine():
+    # MSTORE(0x40, 0x80) CODECOPY(0x20, 0, 0x40) CODESIZE RETURN(0, 0x60),
+    # the code is zero padded and overwrites the memory
+    _assert_same('6080604052' '60406000602039' '38' '60606000f3',
+                 {'calldata': b''})
+
+
+def test_invalid_and_out_of_gas_match_engine():
+    # 0x3f (not in the table), 0xfe INVALID
+    for bytecode in ('60013f00', '6001fe00'):
+        _assert_same(bytecode, {'calldata': b''})
+    _assert_same(jump_contract(repeat=20), {'calldata': b'', 'gas': 100})
+
+
+def _coverage(bytecode, callinfo):
+    '''Coverage bitmaps of the engine and the program'''
+    maps = list()
+    for emulator in (EthereumSSAEngine(bytecode, verbose=False),
+                     ProgramEmulator(Program.from_bytecode(bytecode))):
+        emulator.coverage = CoverageMap()
+        emulator.emulate(callinfo, EthereumVMstate())
+        maps.append(bytes(emulator.coverage.bitmap))
+    return maps
+
+
+def test_coverage_matches_engine():
+    # JUMPI falling through to a JUMPDEST enters a single block
+    engine, program = _coverage('6000600557' '5b' '00', {'calldata': b''})
+    assert engine == program
+    assert sum(engine) == 1
+
+    bytecode, selectors = sized_contract(4096)
+    calldata = selectors[-1].to_bytes(4, 'big') + bytes(32)
+    engine, program = _coverage(bytecode, {'calldata': calldata})
+    assert engine == program
+    # one edge per failed selector test and the function entry
+    assert sum(engine) == len(selectors)
+
+    engine, program = _coverage(jump_contract(repeat=20), {'calldata': b''})
+    assert engine == program and sum(engine)
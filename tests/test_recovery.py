@@ -0,0 +1,102 @@
+from benchmarks.contracts import sized_contract
+from octopus.arch.evm.cfg import enum_blocks_static
+from octopus.arch.evm.disassembler import EvmDisassembler
+from octopus.arch.evm.recovery import (CFGRecovery, ValueSetAnalysis,
+                                       MAX_STATES_PER_BLOCK)
+from octopus.core.edge import EDGE_UNCONDITIONAL
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.trace import Tracer
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+# JUMPDEST PUSH2 <return> PUSH2 <function> JUMP
+CALLER_SIZE = 8
+
+
+def _callers(n):
+    '''n callers of one internal function, each one returning to the
+    JUMPDEST starting the next caller
+    '''
+    function = CALLER_SIZE * n + 2
+    code = bytearray(b'\x5b')
+    for i in range(n):
+        ret = CALLER_SIZE * (i + 1)
+        code += b'\x61' + ret.to_bytes(2, 'big')
+        code += b'\x61' + function.to_bytes(2, 'big')
+        code += b'\x56\x5b'
+    # STOP, function: JUMPDEST PUSH1 1 POP JUMP
+    code += b'\x00\x5b\x60\x01\x50\x56'
+    return bytes(code), function
+
+
+def test_many_callers_return_edges():
+    n = 4 * MAX_STATES_PER_BLOCK
+    code, function = _callers(n)
+    instructions = EvmDisassembler().disassemble(code, analysis=False)
+    returns = {CALLER_SIZE * (i + 1) for i in range(n)}
+    return_jump = function + 4
+
+    vsa = ValueSetAnalysis(instructions)
+    basicblocks, edges = vsa.run()
+    assert not vsa.unresolved
+    assert vsa.targets[return_jump] == returns
+    assert {e.node_to for e in edges if e.node_from == function and
+            e.type == EDGE_UNCONDITIONAL} == returns
+    assert len(basicblocks) == n + 2
+
+    # CFGRecovery gives up on the shared function
+    recovery = CFGRecovery(instructions)
+    recovery.run()
+    assert return_jump in recovery.unresolved
+
+
+class _BlockTrace(Tracer):
+    '''Blocks entered by a concrete execution, as (from, to) edges'''
+
+    def __init__(self, leaders):
+        self.leaders = leaders
+        self.edges = set()
+        self.block = None
+
+    def before_instruction(self, instr, state, depth):
+        if instr.offset in self.leaders:
+            if self.block is not None:
+                self.edges.add((self.block, instr.offset))
+            self.block = instr.offset
+
+
+def _executed_edges(bytecode, calldatas):
+    engine = EthereumSSAEngine(bytecode, verbose=False)
+    leaders = {b.start_offset
+               for b in enum_blocks_static(engine.instructions)}
+    trace = _BlockTrace(leaders)
+    engine.tracers.append(trace)
+    for calldata in calldatas:
+        trace.block = None
+        engine.emulate({'calldata': calldata, 'callvalue': 0},
+                       EthereumVMstate())
+    return trace.edges
+
+
+def test_recovered_edges_contain_executions():
+    bytecode, selectors = sized_contract(4096)
+    calldatas = [selector.to_bytes(4, 'big') + bytes(32)
+                 for selector in selectors] + [b'\xde\xad\xbe\xef']
+    instructions = EvmDisassembler(bytecode).disassemble()
+    for recovery_class in (CFGRecovery, ValueSetAnalysis):
+        recovery = recovery_class(instructions)
+        _, edges = recovery.run()
+        assert not recovery.unresolved
+        recovered = {(e.node_from, e.node_to) for e in edges}
+        assert _executed_edges(bytecode, calldatas) <= recovered
+
+
+def test_state_limit_is_reported():
+    n = 2 * MAX_STATES_PER_BLOCK
+    code, function = _callers(n)
+    instructions = EvmDisassembler().disassemble(code, analysis=False)
+    recovery = CFGRecovery(instructions, max_states=n // 4)
+    basicblocks, edges = recovery.run()
+    # the return jump of the function is widened, not dropped silently
+    assert function + 4 in recovery.unresolved
+    assert function in {b.start_offset for b in basicblocks}
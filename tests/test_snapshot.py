@@ -0,0 +1,61 @@
+from octopus.core.storage import Storage
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.snapshot import (StateSnapshot, dump_state,
+                                            dump_storage, dumps_state,
+                                            dumps_storage, load_state,
+                                            load_storage, loads_state,
+                                            loads_storage)
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+# SSTORE(0, 0x2a) SSTORE(0x1234, 7) MSTORE(0, 0xff) PUSH1 3 PUSH1 1
+# RETURN(0x1f, 1), the stack keeps 3 and 1
+CODE = ('602a600055' '6007611234' '55' '60ff600052' '60036001'
+        '6001601ff3')
+
+
+def _state():
+    engine = EthereumSSAEngine(CODE, verbose=False)
+    state = engine.emulate({'calldata': b''}, EthereumVMstate())
+    # negative values are stored as 256 bits words
+    state._stack.append(-1)
+    return state
+
+
+def _assert_same(restored, state):
+    assert restored.pc == state.pc
+    assert restored.gas == state.gas
+    assert restored._stack == [v & (2 ** 256 - 1) for v in state._stack]
+    assert bytes(restored.memory) == bytes(state.memory)
+    assert dict(restored.storage) == dict(state.storage)
+    assert bytes(restored.last_returned) == bytes(state.last_returned)
+
+
+def test_state_round_trip(tmp_path):
+    state = _state()
+    assert state._stack[:2] == [3, 1]
+    assert bytes(state.last_returned) == b'\xff'
+    _assert_same(loads_state(dumps_state(state)), state)
+
+    path = str(tmp_path / 'state.snap')
+    with open(path, 'wb') as f:
+        dump_state(state, f)
+    _assert_same(load_state(path), state)
+
+    with StateSnapshot.open(path) as snapshot:
+        for key, value in state.storage.items():
+            assert snapshot.sload(key) == value
+        assert snapshot.sload(1) == 0
+        assert list(snapshot.storage_items()) == sorted(state.storage.items())
+
+
+def test_storage_round_trip(tmp_path):
+    storage = Storage()
+    for key in (5, 0, 2 ** 255, 17):
+        storage.sstore(key, key + 1)
+    assert loads_storage(dumps_storage(storage)) == storage
+
+    path = str(tmp_path / 'storage.snap')
+    with open(path, 'wb') as f:
+        dump_storage(storage, f)
+    assert load_storage(path) == storage
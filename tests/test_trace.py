@@ -0,0 +1,106 @@
+import io
+import json
+
+import pytest
+
+from octopus.platforms.ETH.emulator import EthereumSSAEngine
+from octopus.platforms.ETH.trace import (ColumnarTraceRecorder,
+                                         StructLogWriter, iter_trace_chunks,
+                                         load_trace)
+from octopus.platforms.ETH.vmstate import EthereumVMstate
+
+
+# i = 3; do { MSTORE(i * 32, i); SSTORE(i, i + 1); i -= 1 } while i
+# RETURN(0, 0x80)
+LOOP = ('6003'                      # PUSH1 3
+        '5b'                        # 2: JUMPDEST
+        '80' '8060200252'           # DUP1 DUP1 PUSH1 32 MUL MSTORE
+        '8060010181' '55'           # DUP1 PUSH1 1 ADD DUP2 SSTORE
+        '600190038060025760'        # PUSH1 1 SWAP1 SUB DUP1 PUSH1 2 JUMPI
+        '80' '6000f3')              # PUSH1 0x80 PUSH1 0 RETURN
+
+
+def _trace(chunk_size, gas=None):
+    engine = EthereumSSAEngine(LOOP, verbose=False)
+    columnar = io.BytesIO()
+    struct_log = io.StringIO()
+    recorder = ColumnarTraceRecorder(columnar, chunk_size=chunk_size)
+    writer = StructLogWriter(struct_log)
+    engine.tracers += [recorder, writer]
+    callinfo = {'calldata': b''}
+    if gas is not None:
+        callinfo['gas'] = gas
+    engine.emulate(callinfo, EthereumVMstate())
+    recorder.close()
+    writer.close()
+    columnar.seek(0)
+    return recorder, columnar, json.loads(struct_log.getvalue())
+
+
+def test_columns_match_struct_logs():
+    _, columnar, document = _trace(chunk_size=7)
+    logs = document['structLogs']
+    assert not document['failed']
+
+    chunks = list(iter_trace_chunks(columnar))
+    assert len(chunks) > 1
+    steps = {name: [] for name in ('pc', 'opcode', 'gas', 'stack_depth',
+                                   'mem_offset', 'mem_size')}
+    top_of_stack = b''
+    storage = list()
+    for chunk in chunks:
+        for name in steps:
+            steps[name] += chunk[name].tolist()
+        top_of_stack += chunk['top_of_stack']
+        for index, step in enumerate(chunk['storage_step']):
+            storage.append((
+                step,
+                int.from_bytes(chunk['storage_keys'][index * 32:
+                                                     index * 32 + 32], 'big'),
+                int.from_bytes(chunk['storage_values'][index * 32:
+                                                       index * 32 + 32],
+                               'big')))
+
+    assert steps['pc'] == [log['pc'] for log in logs]
+    assert steps['gas'] == [log['gas'] for log in logs]
+    assert steps['stack_depth'] == [len(log['stack']) for log in logs]
+    for index, log in enumerate(logs):
+        top = int(log['stack'][-1], 16) if log['stack'] else 0
+        assert top_of_stack[index * 32:index * 32 + 32] == \
+            top.to_bytes(32, 'big')
+
+    mstores = [index for index, log in enumerate(logs)
+               if log['op'] == 'MSTORE']
+    assert [steps['mem_offset'][i] for i in mstores] == [96, 64, 32]
+    assert all(steps['mem_size'][i] == 32 for i in mstores)
+    sstores = [index for index, log in enumerate(logs)
+               if log['op'] == 'SSTORE']
+    assert storage == [(index, slot, slot + 1)
+                       for index, slot in zip(sstores, (3, 2, 1))]
+
+
+def test_load_trace_matches_chunks(tmp_path):
+    pytest.importorskip('numpy')
+    _, columnar, _ = _trace(chunk_size=5)
+    path = str(tmp_path / 'trace.octt')
+    with open(path, 'wb') as f:
+        f.write(columnar.getvalue())
+    trace = load_trace(path)
+    chunks = list(iter_trace_chunks(columnar))
+    for name in ('pc', 'opcode', 'gas', 'stack_depth', 'mem_offset',
+                 'mem_size', 'storage_step'):
+        assert trace[name].tolist() == \
+            [v for chunk in chunks for v in chunk[name]]
+    assert trace['top_of_stack'].tobytes() == \
+        b''.join(chunk['top_of_stack'] for chunk in chunks)
+    assert trace['mem_data'].tobytes() == \
+        b''.join(chunk['mem_data'] for chunk in chunks)
+
+
+def test_out_of_gas_is_reported():
+    recorder, columnar, document = _trace(chunk_size=7, gas=20)
+    assert recorder.failed and recorder.error == 'out of gas'
+    assert document['failed']
+    assert document['structLogs'][-1]['error'] == 'out of gas'
+    steps = sum(len(chunk['pc']) for chunk in iter_trace_chunks(columnar))
+    assert steps == len(document['structLogs'])